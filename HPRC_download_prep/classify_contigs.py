@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Assign HPRC assembly contigs to chromosomes by shared minimizers and write the
+contig lists extract_chr19_ch22.py takes, without aligning whole genomes.
+
+1. The reference assemblies in assemblies.tsv (GRCh38, CHM13) are sketched
+   once: canonical k-mer minimizers (window w) of every primary chromosome.
+   Minimizers found on more than one chromosome are dropped; the rest are saved
+   as sorted hash and chromosome arrays, memory-mapped by every worker.
+2. Every assembly is streamed (docker_pipeline/fast_reader.py) and each contig
+   sketched the same way in fixed-size segments; each of its minimizers found
+   in the reference sketch votes for that chromosome. A contig goes to the top
+   chromosome if it has at least --min-hits votes and --min-fraction of them.
+
+K-mers are 2-bit packed and hashed with NumPy (scripts/kmers.py, shared with
+the dot plots and MinHash sketches), and window minima come from a blockwise
+prefix/suffix minimum, so sketching is a few vector passes per segment. Assemblies are processed by a process pool.
+
+Output in the output directory:
+    chr{N}_contigs.txt        one contig header per line, per chromosome
+    targets.tsv               target spec of all lists (extract_chr19_ch22.py --targets)
+    contig_assignments.tsv    contig, length, chromosome, votes, hits, top fraction
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "docker_pipeline"))
+from fast_reader import iter_fasta_pieces
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+from kmers import MAX_K, kmer_codes, mix64
+
+K = 21
+WINDOW = 200
+SEGMENT_SIZE = 4 * 1024 * 1024  # Bases sketched at a time
+REFERENCE_SAMPLES = ("GRCh38", "CHM13")
+PRIMARY_CHROM = re.compile(r'^(?:chr)?([0-9]{1,2}|X|Y|M)$')
+MAX_HASH = np.uint64(0xffffffffffffffff)
+SKETCH_HASH = "mix64"  # Hash of saved sketches; others were built with another hash
+
+
+def _window_min(values, w):
+    """Minimum of every window of w consecutive values (blockwise prefix/suffix minima)"""
+    n = len(values)
+    if n < w:
+        return values[:0]
+    blocks = np.concatenate([values, np.full((-n) % w, MAX_HASH)]).reshape(-1, w)
+    prefix = np.minimum.accumulate(blocks, axis=1).ravel()
+    suffix = np.minimum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    m = n - w + 1
+    return np.minimum(suffix[:m], prefix[w - 1:w - 1 + m])
+
+
+def minimizers(seq, k=K, w=WINDOW):
+    """Distinct hashed canonical (k, w)-minimizers of a sequence (bytes)"""
+    if len(seq) < k + w - 1:
+        return np.empty(0, dtype=np.uint64)
+    forward, reverse, positions = kmer_codes(seq, k)
+    # K-mers containing N never count
+    hashes = np.full(len(seq) - k + 1, MAX_HASH)
+    hashes[positions] = mix64(np.minimum(forward, reverse))
+    mins = _window_min(hashes, w)
+    mins = mins[np.concatenate([[True], mins[1:] != mins[:-1]])]
+    return np.unique(mins[mins != MAX_HASH])
+
+
+def iter_contig_sketches(fasta, k=K, w=WINDOW):
+    """(header, length, minimizers of one segment) of every contig, segment by segment"""
+    overlap = k + w - 2
+    header, buf, length = None, bytearray(), 0
+    for name, piece in iter_fasta_pieces(fasta):
+        if name is not header:
+            if header is not None:
+                yield header, length, minimizers(bytes(buf), k, w)
+            header, buf, length = name, bytearray(), 0
+        buf += piece
+        length += len(piece)
+        if len(buf) >= SEGMENT_SIZE:
+            yield header, length, minimizers(bytes(buf), k, w)
+            del buf[:len(buf) - overlap]
+    if header is not None:
+        yield header, length, minimizers(bytes(buf), k, w)
+
+
+def reference_files(assemblies_tsv, reference_dir):
+    """Reference FASTA files listed in assemblies.tsv and present in reference_dir"""
+    df = pd.read_csv(assemblies_tsv, sep='\t')
+    files = []
+    for _, row in df[df['Sample ID'].isin(REFERENCE_SAMPLES)].iterrows():
+        path = Path(reference_dir) / row['Filename']
+        if path.exists():
+            files.append(path)
+        else:
+            print(f"Warning: reference {row['Sample ID']} not found at {path}", file=sys.stderr)
+    # A reference listed on several rows is sketched once
+    return list(dict.fromkeys(files))
+
+
+def sketch_reference(args):
+    """Minimizers of every primary chromosome of one reference FASTA"""
+    fasta, k, w = args
+    chroms = {}
+    for header, _, mins in iter_contig_sketches(fasta, k, w):
+        match = PRIMARY_CHROM.match(header.split()[0].split('#')[-1])
+        if match:
+            chroms.setdefault(match.group(1), []).append(mins)
+    print(f"Sketched {Path(fasta).name}: {len(chroms)} chromosomes", file=sys.stderr)
+    return {chrom: np.unique(np.concatenate(parts)) for chrom, parts in chroms.items()}
+
+
+def chrom_order(chrom):
+    return (0, int(chrom)) if chrom.isdigit() else (1, chrom)
+
+
+def build_sketch(reference_fastas, sketch_path, k=K, w=WINDOW, num_cores=4):
+    """Sketch the references and save them as <sketch>.hashes.npy, <sketch>.chroms.npy and <sketch>.json"""
+    with Pool(min(num_cores, len(reference_fastas))) as pool:
+        sketches = pool.map(sketch_reference, [(fasta, k, w) for fasta in reference_fastas])
+
+    merged = {}
+    for sketch in sketches:
+        for chrom, mins in sketch.items():
+            merged[chrom] = np.union1d(merged[chrom], mins) if chrom in merged else mins
+    chroms = sorted(merged, key=chrom_order)
+
+    hashes = np.concatenate([merged[c] for c in chroms])
+    labels = np.concatenate([np.full(len(merged[c]), i, dtype=np.uint8) for i, c in enumerate(chroms)])
+    order = np.argsort(hashes, kind='stable')
+    hashes, labels = hashes[order], labels[order]
+    # Minimizers on more than one chromosome carry no vote
+    dup = np.zeros(len(hashes), dtype=bool)
+    dup[1:] = hashes[1:] == hashes[:-1]
+    dup[:-1] |= dup[1:]
+    np.save(f"{sketch_path}.hashes.npy", hashes[~dup])
+    np.save(f"{sketch_path}.chroms.npy", labels[~dup])
+    with open(f"{sketch_path}.json", 'w') as f:
+        json.dump({'k': k, 'w': w, 'hash': SKETCH_HASH, 'chroms': chroms,
+                   'references': [str(p) for p in reference_fastas]}, f, indent=2)
+    print(f"Reference sketch: {int((~dup).sum()):,} informative minimizers on {len(chroms)} chromosomes "
+          f"({int(dup.sum()):,} shared dropped) -> {sketch_path}.*.npy")
+
+
+def sketch_hash(sketch_path):
+    """Hash a saved sketch was built with (None if there is none)"""
+    meta_path = Path(f"{sketch_path}.json")
+    if not meta_path.exists():
+        return None
+    with open(meta_path) as f:
+        return json.load(f).get('hash')
+
+
+# Reference sketch of the worker processes, memory-mapped once per worker by init_worker
+_worker_sketch = {}
+
+
+def init_worker(sketch_path, min_hits, min_fraction):
+    with open(f"{sketch_path}.json") as f:
+        meta = json.load(f)
+    _worker_sketch.update(meta, hashes=np.load(f"{sketch_path}.hashes.npy", mmap_mode='r'),
+                          labels=np.load(f"{sketch_path}.chroms.npy", mmap_mode='r'),
+                          min_hits=min_hits, min_fraction=min_fraction)
+
+
+def classify_assembly(fasta):
+    """[(contig, length, chromosome or None, votes, hits, top fraction)] of one assembly"""
+    hashes, labels = _worker_sketch['hashes'], _worker_sketch['labels']
+    chroms = _worker_sketch['chroms']
+    results = []
+    header, length, votes = None, 0, None
+
+    def assign():
+        hits = int(votes.sum())
+        top = int(votes.argmax())
+        fraction = votes[top] / hits if hits else 0.0
+        ok = hits >= _worker_sketch['min_hits'] and fraction >= _worker_sketch['min_fraction']
+        results.append((header, length, chroms[top] if ok else None, int(votes[top]), hits, fraction))
+
+    for name, name_length, mins in iter_contig_sketches(fasta, _worker_sketch['k'], _worker_sketch['w']):
+        if name is not header:
+            if header is not None:
+                assign()
+            header, votes = name, np.zeros(len(chroms), dtype=np.int64)
+        length = name_length
+        idx = np.searchsorted(hashes, mins)
+        idx[idx == len(hashes)] = 0
+        found = hashes[idx] == mins
+        votes += np.bincount(labels[idx[found]], minlength=len(chroms))
+    if header is not None:
+        assign()
+    print(f"Classified {Path(fasta).name}: {sum(1 for r in results if r[2])}/{len(results)} contigs",
+          file=sys.stderr)
+    return results
+
+
+def classify_contigs(input_dir, output_dir, assemblies_tsv, reference_dir=None, sketch_path=None,
+                     k=K, w=WINDOW, min_hits=5, min_fraction=0.5, num_cores=24):
+    """Classify the contigs of all haplotype assemblies and write per-chromosome contig lists."""
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    sketch_path = sketch_path or output_path / "reference_sketch"
+
+    start = time.time()
+    if sketch_hash(sketch_path) == SKETCH_HASH:
+        print(f"Using reference sketch {sketch_path}")
+    else:
+        if Path(f"{sketch_path}.json").exists():
+            print(f"Reference sketch {sketch_path} was built with another hash; rebuilding it", file=sys.stderr)
+        references = reference_files(assemblies_tsv, reference_dir or input_dir)
+        if not references:
+            print("No reference assemblies found; download GRCh38/CHM13 from assemblies.tsv", file=sys.stderr)
+            sys.exit(1)
+        build_sketch(references, sketch_path, k, w, num_cores)
+
+    fasta_files = sorted(Path(input_dir).glob("*_hap[12]_hprc*.fa.gz"))
+    if not fasta_files:
+        print(f"No FASTA files found in {input_dir}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Classifying contigs of {len(fasta_files)} haplotype assemblies with {num_cores} cores...")
+
+    with Pool(num_cores, initializer=init_worker, initargs=(str(sketch_path), min_hits, min_fraction)) as pool:
+        results = pool.map(classify_assembly, fasta_files)
+
+    lists = {}
+    with open(output_path / "contig_assignments.tsv", 'w') as out:
+        out.write("contig\tlength\tchromosome\tvotes\thits\ttop_fraction\n")
+        for assembly in results:
+            for contig, length, chrom, votes, hits, fraction in assembly:
+                out.write(f"{contig}\t{length}\t{chrom or 'unassigned'}\t{votes}\t{hits}\t{fraction:.3f}\n")
+                if chrom:
+                    lists.setdefault(chrom, []).append(contig)
+
+    with open(output_path / "targets.tsv", 'w') as spec:
+        spec.write("# name\tcontigs\n")
+        for chrom in sorted(lists, key=chrom_order):
+            with open(output_path / f"chr{chrom}_contigs.txt", 'w') as f:
+                f.write('\n'.join(sorted(lists[chrom])) + '\n')
+            spec.write(f"{chrom}\tchr{chrom}_contigs.txt\n")
+
+    n_contigs = sum(len(r) for r in results)
+    n_assigned = sum(len(c) for c in lists.values())
+    print("\n=== COMPLETE ===")
+    print(f"Contigs assigned: {n_assigned}/{n_contigs} in {time.time() - start:.1f}s")
+    for chrom in sorted(lists, key=chrom_order):
+        print(f"  chr{chrom}: {len(lists[chrom])} contigs")
+    print(f"\nContig lists and targets.tsv: {output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assign HPRC assembly contigs to chromosomes by shared minimizers")
+    parser.add_argument("input_dir", help="Directory with *_hap[12]_hprc*.fa.gz")
+    parser.add_argument("output_dir", help="Output directory for contig lists")
+    parser.add_argument("--assemblies", default=str(Path(__file__).resolve().parent / "assemblies.tsv"),
+                        help="assemblies.tsv listing the GRCh38/CHM13 reference files")
+    parser.add_argument("--reference-dir", help="Directory with the reference FASTA files (default: input_dir)")
+    parser.add_argument("--sketch", dest="sketch_path",
+                        help="Reference sketch prefix to reuse or create (default: output_dir/reference_sketch)")
+    parser.add_argument("-k", type=int, default=K, help=f"Minimizer k-mer size, at most {MAX_K} (default {K})")
+    parser.add_argument("-w", type=int, default=WINDOW, help=f"Minimizer window in k-mers (default {WINDOW})")
+    parser.add_argument("--min-hits", type=int, default=5,
+                        help="Fewest reference minimizer hits to assign a contig (default 5)")
+    parser.add_argument("--min-fraction", type=float, default=0.5,
+                        help="Smallest share of hits on the top chromosome (default 0.5)")
+    parser.add_argument("--cores", type=int, default=24, help="Worker processes (default 24)")
+
+    args = parser.parse_args()
+    if not 1 <= args.k <= MAX_K:
+        parser.error(f"-k must be between 1 and {MAX_K}")
+
+    classify_contigs(
+        args.input_dir,
+        args.output_dir,
+        args.assemblies,
+        reference_dir=args.reference_dir,
+        sketch_path=args.sketch_path,
+        k=args.k,
+        w=args.w,
+        min_hits=args.min_hits,
+        min_fraction=args.min_fraction,
+        num_cores=args.cores,
+    )
@@ -1,19 +1,53 @@
 #!/usr/bin/env python3
 """
 Download HPRC raw sequencing data from S3 URLs listed in a TSV file.
+
+Files are fetched by a bounded pool of concurrent transfers. Partial files
+(<name>.part) are resumed with HTTP Range requests, and every file is hashed
+while it streams and checked against the TSV's FASTA SHA-256 value or the
+.md5 file its FASTA MD5 column points to, and against File Size. Verified
+files get a <name>.verified marker and are skipped on the next run.
 """
 
 import argparse
+import hashlib
+import http.client
+import json
 import os
+import queue
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import pandas as pd
 
+BLOCK_SIZE = 1024 * 1024  # Bytes per read from the connection
+PROGRESS_INTERVAL = 10  # Seconds between progress lines per file
+RETRIES = 3
+RETRY_DELAY = 2  # Seconds before the first retry, doubled for every further attempt
+MISSING_HTTP_CODES = (403, 404)  # Not worth retrying; S3 answers 403 for missing keys
+TIMEOUT = 60  # Socket timeout in seconds
+PREFETCH_BLOCKS = 32  # Blocks read ahead of the consumer by stream_url
+
+print_lock = threading.Lock()
+
 
-def s3_to_wget_url(s3_url):
+def log(message):
+    with print_lock:
+        print(message, flush=True)
+
+
+def s3_to_wget_url(s3_url, endpoint=None):
     """
     Convert an S3 URL to an HTTPS URL that works with wget.
     
     Args:
         s3_url (str): S3 URL in format s3://bucket-name/path/to/file
+        endpoint (str): Optional S3-compatible endpoint or mirror; the URL then
+            becomes {endpoint}/bucket-name/path/to/file (path style)
         
     Returns:
         str: HTTPS URL in format https://bucket-name.s3.amazonaws.com/path/to/file
@@ -37,12 +71,320 @@ def s3_to_wget_url(s3_url):
     key = parts[1] if len(parts) > 1 else ""
     
     # Construct HTTPS URL
+    if endpoint:
+        return f"{endpoint.rstrip('/')}/{bucket}/{key}"
     https_url = f"https://{bucket}.s3.amazonaws.com/{key}"
     
     return https_url
 
 
-def download_files(tsv_file, output_dir, url_column='AWS FASTA', filename_column='Filename'):
+def format_bytes(n):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n < 1024 or unit == 'GB':
+            return f"{n:.1f} {unit}" if unit != 'B' else f"{n} B"
+        n /= 1024
+
+
+def backoff(attempt):
+    time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+
+
+def fetch_md5(md5_url, timeout=TIMEOUT):
+    """Expected MD5 from a .md5 file ("<hex digest>  <file name>"), or None if unavailable"""
+    try:
+        with urllib.request.urlopen(md5_url, timeout=timeout) as response:
+            text = response.read(4096).decode().strip()
+        return text.split()[0].lower() if text else None
+    except (urllib.error.URLError, OSError, UnicodeDecodeError) as e:
+        log(f"Warning: could not fetch {md5_url}: {e}")
+        return None
+
+
+def hash_file(path, hashers):
+    """Feed an existing file (or partial download) to the hashers, return its size"""
+    size = 0
+    with open(path, 'rb') as f:
+        while block := f.read(BLOCK_SIZE):
+            for h in hashers.values():
+                h.update(block)
+            size += len(block)
+    return size
+
+
+def verify(hashers, size, expected):
+    """List of mismatches between a finished file and the expected size/checksums"""
+    problems = []
+    if expected.get('size') is not None and size != expected['size']:
+        problems.append(f"size {size} != {expected['size']}")
+    for algo, h in hashers.items():
+        if h.hexdigest() != expected[algo]:
+            problems.append(f"{algo} {h.hexdigest()} != {expected[algo]}")
+    return problems
+
+
+def is_verified(dest, marker):
+    """True if dest was verified before and has not changed since"""
+    if not (os.path.exists(dest) and os.path.exists(marker)):
+        return False
+    with open(marker) as f:
+        info = json.load(f)
+    st = os.stat(dest)
+    return info.get('size') == st.st_size and info.get('mtime_ns') == st.st_mtime_ns
+
+
+def write_marker(dest, marker, hashers):
+    st = os.stat(dest)
+    info = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    info.update({algo: h.hexdigest() for algo, h in hashers.items()})
+    with open(marker, 'w') as f:
+        json.dump(info, f)
+
+
+def download_one(url, dest, expected, label, timeout=TIMEOUT, retries=RETRIES):
+    """
+    Download one file with resume and streaming checksum verification.
+    
+    Args:
+        url: HTTP(S) URL of the file
+        dest: Output path; data goes to dest + '.part' until verified
+        expected: {'size': int or None, 'md5'/'sha256': hex digest} to check against
+        label: Prefix of the progress lines
+    
+    Returns:
+        tuple: (status, bytes transferred) with status 'skipped', 'done' or 'failed'
+    """
+    part, marker = f"{dest}.part", f"{dest}.verified"
+    algos = [a for a in ('sha256', 'md5') if expected.get(a)]
+
+    if is_verified(dest, marker):
+        log(f"{label}: already downloaded and verified, skipping")
+        return 'skipped', 0
+    if os.path.exists(dest):
+        # Complete file from an earlier run without a marker: check it once
+        hashers = {a: hashlib.new(a) for a in algos}
+        problems = verify(hashers, hash_file(dest, hashers), expected)
+        if not problems:
+            write_marker(dest, marker, hashers)
+            log(f"{label}: existing file verified, skipping")
+            return 'skipped', 0
+        log(f"{label}: existing file does not match ({'; '.join(problems)}), downloading again")
+        os.remove(dest)
+
+    transferred = 0
+    start = time.time()
+    for attempt in range(1, retries + 2):
+        # Hash what is already on disk, then keep hashing while the rest streams in
+        hashers = {a: hashlib.new(a) for a in algos}
+        offset = hash_file(part, hashers) if os.path.exists(part) else 0
+        request = urllib.request.Request(url)
+        if offset:
+            request.add_header('Range', f"bytes={offset}-")
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                if offset and response.status != 206:
+                    # Server ignored the range: start over
+                    log(f"{label}: server does not resume, restarting")
+                    hashers = {a: hashlib.new(a) for a in algos}
+                    offset = 0
+                elif offset:
+                    log(f"{label}: resuming at {format_bytes(offset)}")
+                total = expected.get('size')
+                size = offset
+                start = last = time.time()
+                with open(part, 'ab' if offset else 'wb') as out:
+                    while block := response.read(BLOCK_SIZE):
+                        out.write(block)
+                        for h in hashers.values():
+                            h.update(block)
+                        size += len(block)
+                        transferred += len(block)
+                        now = time.time()
+                        if now - last >= PROGRESS_INTERVAL:
+                            last = now
+                            rate = (size - offset) / (now - start)
+                            pct = f"{100 * size / total:5.1f}% " if total else ""
+                            log(f"{label}: {pct}{format_bytes(size)} at {format_bytes(rate)}/s")
+                if response.length:
+                    # Connection closed before Content-Length was reached
+                    raise http.client.IncompleteRead(b'', response.length)
+        except (urllib.error.URLError, OSError, http.client.HTTPException) as e:
+            if isinstance(e, urllib.error.HTTPError) and e.code == 416 and offset:
+                # Range past the end: the partial file is complete (or longer than the file)
+                size = offset
+            elif isinstance(e, urllib.error.HTTPError) and e.code in MISSING_HTTP_CODES:
+                log(f"{label}: failed: {e}")
+                return 'failed', transferred
+            else:
+                log(f"{label}: attempt {attempt} failed: {e}")
+                if attempt <= retries:
+                    backoff(attempt)
+                    continue
+                return 'failed', transferred
+
+        problems = verify(hashers, size, expected)
+        if problems:
+            log(f"{label}: verification failed ({'; '.join(problems)}), discarding")
+            os.remove(part)
+            if attempt <= retries:
+                continue
+            return 'failed', transferred
+        os.replace(part, dest)
+        write_marker(dest, marker, hashers)
+        elapsed = time.time() - start if transferred else 0
+        rate = f" at {format_bytes(transferred / elapsed)}/s" if elapsed else ""
+        checked = "+".join(algos) or "not checksummed"
+        log(f"{label}: done, {format_bytes(size)}{rate} ({checked})")
+        return 'done', transferred
+    return 'failed', transferred
+
+
+def _iter_url(url, expected, label, timeout, retries):
+    """Blocks of a URL; dropped connections resume where they stopped, checksums checked at the end"""
+    algos = [a for a in ('sha256', 'md5') if expected.get(a)]
+    hashers = {a: hashlib.new(a) for a in algos}
+    size = 0
+    attempt = 0
+    while True:
+        request = urllib.request.Request(url)
+        if size:
+            request.add_header('Range', f"bytes={size}-")
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                if size and response.status != 206:
+                    raise ValueError(f"server does not support resuming at byte {size}")
+                while block := response.read(BLOCK_SIZE):
+                    for h in hashers.values():
+                        h.update(block)
+                    size += len(block)
+                    yield block
+                if response.length:
+                    raise http.client.IncompleteRead(b'', response.length)
+            break
+        except (urllib.error.URLError, OSError, http.client.HTTPException) as e:
+            attempt += 1
+            if attempt > retries or isinstance(e, urllib.error.HTTPError) and e.code in MISSING_HTTP_CODES:
+                raise
+            log(f"{label}: connection lost at {format_bytes(size)} ({e}), resuming")
+            backoff(attempt)
+    problems = verify(hashers, size, expected)
+    if problems:
+        raise ValueError(f"verification failed ({'; '.join(problems)})")
+
+
+def stream_url(url, expected, label, timeout=TIMEOUT, retries=RETRIES, prefetch=PREFETCH_BLOCKS):
+    """
+    Yield the bytes of a URL as they arrive, without writing them to disk.
+    
+    A reader thread keeps up to prefetch blocks ahead of the consumer, so the
+    transfer overlaps with whatever the consumer does with the data. Dropped
+    connections are resumed with Range requests; the stream is hashed on the
+    fly and ValueError is raised after the last block if it does not match
+    expected (see download_one).
+    """
+    blocks = queue.Queue(prefetch)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        """Queue an item unless the consumer has stopped; False once it has"""
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def reader():
+        try:
+            for block in _iter_url(url, expected, label, timeout, retries):
+                if not put(block):
+                    return
+            put(done)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while (block := blocks.get()) is not done:
+            if isinstance(block, Exception):
+                raise block
+            yield block
+    finally:
+        # Consumer stopped early: let the reader thread finish
+        stop.set()
+        thread.join()
+
+
+def fetch_range(url, start, end=None, timeout=TIMEOUT, retries=RETRIES):
+    """Bytes [start, end) of a URL (to the end of the file if end is None) with HTTP Range requests
+
+    A dropped connection is resumed where it stopped; a server that ignores
+    the Range header raises ValueError rather than sending the whole file.
+    """
+    parts = []
+    pos = start
+    attempt = 0
+    while True:
+        request = urllib.request.Request(url)
+        request.add_header('Range', f"bytes={pos}-{'' if end is None else end - 1}")
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                if response.status != 206:
+                    raise ValueError(f"server ignored the Range request (HTTP {response.status})")
+                while block := response.read(BLOCK_SIZE):
+                    parts.append(block)
+                    pos += len(block)
+                if response.length:
+                    raise http.client.IncompleteRead(b'', response.length)
+            break
+        except (urllib.error.URLError, OSError, http.client.HTTPException) as e:
+            attempt += 1
+            if attempt > retries or isinstance(e, urllib.error.HTTPError) and e.code in MISSING_HTTP_CODES:
+                raise
+            backoff(attempt)
+    data = b''.join(parts)
+    if end is not None and len(data) != end - start:
+        raise ValueError(f"got {len(data)} bytes for range {start}-{end - 1}")
+    return data
+
+
+def fetch_bytes(url, timeout=TIMEOUT, retries=RETRIES):
+    """Whole content of a small URL, or None if it does not exist"""
+    for attempt in range(1, retries + 2):
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            if e.code in MISSING_HTTP_CODES or attempt > retries:
+                return None
+        except (urllib.error.URLError, OSError, http.client.HTTPException):
+            if attempt > retries:
+                raise
+        backoff(attempt)
+
+
+def expected_checksums(row, md5_column, sha256_column, size_column, endpoint=None):
+    """Expected size and checksums of a TSV row: a SHA-256 value, or the MD5 in the linked .md5 file"""
+    expected = {'size': None}
+    if size_column in row and pd.notna(row[size_column]):
+        expected['size'] = int(row[size_column])
+    if sha256_column in row and pd.notna(row[sha256_column]):
+        expected['sha256'] = str(row[sha256_column]).strip().lower()
+    elif md5_column in row and pd.notna(row[md5_column]):
+        value = str(row[md5_column]).strip()
+        if value.startswith('s3://'):
+            expected['md5'] = fetch_md5(s3_to_wget_url(value, endpoint))
+        elif value.startswith(('http://', 'https://')):
+            expected['md5'] = fetch_md5(value)
+        else:
+            expected['md5'] = value.lower()
+    return expected
+
+
+def download_files(tsv_file, output_dir, url_column='AWS FASTA', filename_column='Filename',
+                   jobs=4, endpoint=None, verify_checksums=True):
     """
     Download files from S3 URLs listed in a TSV file.
     
@@ -51,6 +393,9 @@ def download_files(tsv_file, output_dir, url_column='AWS FASTA', filename_column
         output_dir: Directory where files will be downloaded
         url_column: Column name containing S3 URLs
         filename_column: Column name containing output filenames
+        jobs: Number of concurrent transfers
+        endpoint: Optional S3-compatible endpoint or mirror (see s3_to_wget_url)
+        verify_checksums: Check FASTA SHA-256/FASTA MD5 (File Size is always checked)
     """
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
@@ -60,25 +405,38 @@ def download_files(tsv_file, output_dir, url_column='AWS FASTA', filename_column
     
     print(f"Found {len(df)} files to download")
     print(f"Output directory: {output_dir}")
+    print(f"Concurrent transfers: {jobs}")
     
-    # Change to output directory
-    original_dir = os.getcwd()
-    os.chdir(output_dir)
+    def task(idx, row):
+        filename = row[filename_column]
+        label = f"[{idx + 1}/{len(df)}] {filename}"
+        if verify_checksums:
+            expected = expected_checksums(row, 'FASTA MD5', 'FASTA SHA-256', 'File Size', endpoint)
+        else:
+            expected = {'size': int(row['File Size']) if pd.notna(row.get('File Size')) else None}
+        https_url = s3_to_wget_url(row[url_column], endpoint)
+        return filename, download_one(https_url, os.path.join(output_dir, filename), expected, label)
     
-    try:
-        for idx, row in df.iterrows():
-            filename = row[filename_column]
-            s3_url = row[url_column]
-            https_url = s3_to_wget_url(s3_url)
-            
-            print(f"Downloading {idx + 1}/{len(df)}: {filename}")
-            ret = os.system(f"wget -O {filename} {https_url}")
-            
-            if ret != 0:
-                print(f"Warning: Download failed for {filename}")
-    finally:
-        os.chdir(original_dir)
+    start = time.time()
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(task, idx, row) for idx, row in enumerate(df.to_dict('records'))]
+        for future in as_completed(futures):
+            filename, result = future.result()
+            results[filename] = result
+    elapsed = time.time() - start
     
+    transferred = sum(n for _, n in results.values())
+    counts = {status: sum(1 for s, _ in results.values() if s == status) for status in ('done', 'skipped', 'failed')}
+    print(f"\nDownloaded {counts['done']}, skipped {counts['skipped']} already verified, "
+          f"failed {counts['failed']}")
+    print(f"Transferred {format_bytes(transferred)} in {elapsed:.0f}s"
+          + (f" ({format_bytes(transferred / elapsed)}/s)" if elapsed > 0 else ""))
+    for filename, (status, _) in sorted(results.items()):
+        if status == 'failed':
+            print(f"  FAILED: {filename}")
+    if counts['failed']:
+        sys.exit(1)
     print("Download complete!")
 
 
@@ -104,6 +462,22 @@ if __name__ == "__main__":
         default="Filename",
         help="Column name containing output filenames (default: 'Filename')"
     )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=4,
+        help="Number of concurrent transfers (default: 4)"
+    )
+    parser.add_argument(
+        "--endpoint",
+        help="S3-compatible endpoint or local mirror to download from instead of s3.amazonaws.com"
+    )
+    parser.add_argument(
+        "--no-verify",
+        dest="verify_checksums",
+        action="store_false",
+        help="Skip MD5/SHA-256 verification (sizes are still checked)"
+    )
     
     args = parser.parse_args()
     
@@ -111,5 +485,8 @@ if __name__ == "__main__":
         args.tsv_file,
         args.output_dir,
         url_column=args.url_column,
-        filename_column=args.filename_column
+        filename_column=args.filename_column,
+        jobs=args.jobs,
+        endpoint=args.endpoint,
+        verify_checksums=args.verify_checksums
     )
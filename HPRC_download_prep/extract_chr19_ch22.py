@@ -2,20 +2,82 @@
 """
 Extract chromosome 19 and 22 sequences from HPRC assemblies into chunked PanSN FASTA files
 using pre-generated contig list files.
+
+Any set of chromosomes and BED regions can be extracted with a target spec
+(--targets), one target per line: name, contig list and an optional BED file
+of regions on those contigs ('-' for no contig list takes the contigs from
+the BED file). Relative paths are resolved against the spec's directory:
+
+    # name  contigs              [regions]
+    19      chr19_contigs.txt
+    22      chr22_contigs.txt
+    MHC     -                    mhc_regions.bed
+
+classify_contigs.py writes the contig lists of all chromosomes and a matching
+target spec by minimizer voting against GRCh38/CHM13.
+
+Every contig is routed to all of its targets during a single pass over each
+assembly, so extracting all 24 chromosomes reads the inputs once, like two.
+Region records are named sample#hap#contig:start-end (1-based, inclusive).
+
+Bgzipped assemblies are read through their .fai/.gzi indexes (built and cached
+next to them if missing), so only the blocks of the listed contigs are
+decompressed; plain gzip assemblies are scanned in full, in large blocks
+through docker_pipeline/fast_reader.py.
+
+Given the assembly TSV of download_hprc.py (assemblies.tsv) instead of an
+input directory, the assemblies are streamed from S3 (or --endpoint) without
+ever landing on disk: every worker inflates its HTTP response as it arrives,
+keeps only the routed contigs and writes them straight to its shards, while
+the other workers' transfers run alongside. Dropped connections resume with
+Range requests, and a file whose size or checksum does not match is dropped
+from the chunks with an error. Only the extracted sequences touch the disk.
+Where the .fai/.gzi published next to an assembly exist (cached in
+<output_dir>/remote_index), only the BGZF blocks of the routed contigs are
+fetched, in coalesced Range requests (remote_faidx.py), instead of the whole
+file; --no-index streams everything.
+
+Each worker streams its matching contigs into its own BGZF shard per
+(target, chunk, file); the shards are then concatenated byte by byte into
+the chunk files chrom{target}_chunk{N}.fa.gz, so sequences never pass
+through the parent process. Block offsets and record positions are kept while
+the shards are written, so the chunks get their .fai/.gzi indexes directly.
+
+Samples go to chunks by a chunk plan (docker_pipeline/chunk_plan.py), saved as
+chunk_plan.json next to the chunks: fixed groups of --chunk-size sorted names by
+default, or --balance to bin-pack them into chunks of equal bp for PGGB;
+--plan reuses a saved plan.
+
+A manifest.json with each chunk's sequence, sample and haplotype counts, bp, N
+content and checksum is written next to the chunks (docker_pipeline/fasta_manifest.py).
 """
 
 import argparse
+import fnmatch
 import gzip
-import io
+import math
 import os
 import re
-import shutil
-import subprocess
 import sys
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Pool
 
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "docker_pipeline"))
+from bgzf import BgzfWriter, concatenate, is_bgzf, write_gzi
+from faidx import IndexedFasta, fai_entry, write_fai
+from fasta_manifest import ChunkStats, HashingWriter, update_manifest
+from fast_reader import iter_fasta_pieces, iter_gzip_stream
+from chunk_plan import balanced_plan, fixed_plan, format_plan, load_plan, sample_sizes, update_plan
+from download_hprc import expected_checksums, format_bytes, s3_to_wget_url, stream_url
+from remote_faidx import RemoteIndexedFasta, fetch_index
+
+ASSEMBLY_PATTERN = "*_hap[12]_hprc*.fa.gz"
+INDEX_FETCH_JOBS = 16  # Concurrent downloads of remote .fai/.gzi files
+
 def load_contig_list(contig_list_file):
     """Load contig identifiers (one per line)."""
     contigs = set()
@@ -28,279 +90,625 @@ def load_contig_list(contig_list_file):
     return contigs
 
 
+def load_bed(bed_file):
+    """Load BED regions as contig -> sorted [(start, end)] (0-based, half-open)."""
+    regions = defaultdict(list)
+    with open(bed_file, 'r') as fh:
+        for line in fh:
+            if not line.strip() or line.startswith(('#', 'track', 'browser')):
+                continue
+            parts = line.rstrip('\n').split('\t')
+            regions[parts[0]].append((int(parts[1]), int(parts[2])))
+    return {contig: sorted(spans) for contig, spans in regions.items()}
+
+
+def load_target_spec(spec_file):
+    """Load a target spec: name -> {'contigs': set, 'regions': {contig: spans} or None}."""
+    spec_dir = Path(spec_file).resolve().parent
+    targets = {}
+    with open(spec_file, 'r') as fh:
+        for line in fh:
+            if not line.strip() or line.startswith('#'):
+                continue
+            parts = line.split()
+            name, contig_list = parts[0], parts[1]
+            regions = load_bed(spec_dir / parts[2]) if len(parts) > 2 else None
+            if contig_list != '-':
+                contigs = load_contig_list(spec_dir / contig_list)
+            elif regions is not None:
+                contigs = set(regions)
+            else:
+                raise ValueError(f"Target {name} in {spec_file} has neither contigs nor regions")
+            targets[name] = {'contigs': contigs, 'regions': regions}
+    return targets
 
 
+def build_router(targets):
+    """Map every contig to the targets it goes to: contig -> [(target, regions or None)]."""
+    router = defaultdict(list)
+    for name, target in targets.items():
+        for contig in target['contigs']:
+            if target['regions'] is None:
+                router[contig].append((name, None))
+            elif contig in target['regions']:
+                router[contig].append((name, target['regions'][contig]))
+    return dict(router)
 
-def open_output(path, use_bgzip=False):
-    """Return a text handle and a closer for gzip/bgzip output."""
+
+# Contig router of the worker processes, set once per worker by init_worker
+_worker_router = {}
+
+
+def init_worker(router):
+    """Pool initializer: send the contig router once per worker instead of once per file."""
+    _worker_router.update(router)
+
+
+def open_shard(path, use_bgzip=False, threads=1):
+    """Binary writer for one shard of a chunk file.
+
+    BGZF shards are written without the EOF block so they can be concatenated
+    byte by byte; plain gzip shards concatenate into a valid multi-member gzip.
+    """
     if use_bgzip:
-        bgzip_bin = shutil.which('bgzip')
-        if bgzip_bin:
-            raw_out = open(path, 'wb')
-            proc = subprocess.Popen([bgzip_bin, '-c'], stdin=subprocess.PIPE, stdout=raw_out)
-            text_handle = io.TextIOWrapper(proc.stdin, encoding='utf-8', newline='\n')
-
-            def closer():
-                text_handle.close()
-                proc.wait()
-                raw_out.close()
-
-            return text_handle, closer
-        else:
-            print("bgzip not found; falling back to gzip", file=sys.stderr)
+        return BgzfWriter(path, eof=False, threads=threads)
+    return gzip.open(path, 'wb')
 
-    gz_handle = gzip.open(path, 'wt')
 
-    def closer():
-        gz_handle.close()
+class ShardSet:
+    """Shard writers of one input file, opened on first use, with their ChunkStats.
 
-    return gz_handle, closer
+    For BGZF shards the block offsets and .fai entries are recorded while
+    writing, so the chunk files get their indexes without another pass.
+    """
+
+    def __init__(self, shard_paths, use_bgzip, threads=1):
+        self.shard_paths = shard_paths
+        self.use_bgzip = use_bgzip
+        self.threads = threads
+        self.writers = {}
+        self.stats = {}
+        self.fai = defaultdict(list)
+        self.open_records = {}  # target -> (name, sequence offset) of the record being written
+
+    def get(self, target):
+        """Writer and stats for a target, or (None, None) if this sample has no chunk for it."""
+        if not self.shard_paths.get(target):
+            return None, None
+        if target not in self.writers:
+            self.writers[target] = open_shard(self.shard_paths[target], self.use_bgzip, self.threads)
+            self.stats[target] = ChunkStats()
+        return self.writers[target], self.stats[target]
+
+    def start_record(self, target, header):
+        """Write a record header; the sequence follows as one line, then end_record."""
+        out, stats = self.get(target)
+        out.write(f"{header}\n".encode())
+        stats.start(header)
+        if self.use_bgzip:
+            self.open_records[target] = (header[1:], out.tell())
+        return out, stats
+
+    def end_record(self, target, length):
+        self.writers[target].write(b'\n')
+        if self.use_bgzip:
+            name, offset = self.open_records.pop(target)
+            self.fai[target].append(fai_entry(name, offset, length))
+
+    def write_record(self, target, header, seq):
+        out, stats = self.start_record(target, header)
+        out.write(seq.encode())
+        stats.extend(seq)
+        self.end_record(target, len(seq))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+    def result(self):
+        """Shard path, ChunkStats and (for BGZF) (blocks, .fai entries, size) per target."""
+        shard_files = {target: str(self.shard_paths[target]) for target in self.writers}
+        indexes = {}
+        if self.use_bgzip:
+            indexes = {target: (writer.blocks, self.fai[target], writer.uncompressed_bytes)
+                       for target, writer in self.writers.items()}
+        return shard_files, self.stats, indexes
+
+
+def merge_shard_indexes(shards, indexes):
+    """.gzi and .fai entries of the concatenation of BGZF shards, from the entries of each shard."""
+    gzi, fai = [], []
+    cbase = ubase = 0
+    for shard, (blocks, entries, size) in zip(shards, indexes):
+        gzi.extend((c + cbase, u + ubase) for c, u in blocks)
+        fai.extend([name, length, offset + ubase, linebases, linewidth]
+                   for name, length, offset, linebases, linewidth in entries)
+        cbase += os.path.getsize(shard)
+        ubase += size
+    return gzi, fai
+
+
+def region_name(contig, start, end):
+    return f"{contig}:{start + 1}-{end}"
+
+
+def load_remote_assemblies(tsv_file, endpoint=None):
+    """(file name, URL, TSV row) of the haplotype assemblies in a download_hprc.py TSV."""
+    df = pd.read_csv(tsv_file, sep='\t')
+    return [(row['Filename'], s3_to_wget_url(row['AWS FASTA'], endpoint), row)
+            for row in df.to_dict('records')
+            if fnmatch.fnmatch(str(row['Filename']), ASSEMBLY_PATTERN)]
+
+
+def scan_contigs(fasta_file, sample_name, haplotype_id, shards):
+    """Stream the whole file (or decompressed chunks) once and copy every routed contig and region to its shards."""
+    prefix = f">{sample_name}#{haplotype_id}#"
+    contig = None
+    whole = []    # (target, writer, stats) of targets taking the whole contig
+    regions = []  # [target, start, end, pieces] of targets taking regions of it
+    pos = 0
+
+    def end_contig():
+        for target, _, _ in whole:
+            shards.end_record(target, pos)
+        for target, start, end, pieces in regions:
+            if pieces:
+                shards.write_record(target, prefix + region_name(contig, start, min(end, pos)),
+                                    ''.join(pieces))
+
+    # Pieces come in large blocks; contigs without sequence never show up, so they are skipped
+    for header, piece in iter_fasta_pieces(fasta_file):
+        if header is not contig:
+            end_contig()
+
+            # Route the new contig to its targets
+            contig = header
+            whole, regions, pos = [], [], 0
+            for target, spans in _worker_router.get(contig, ()):
+                out, stats = shards.get(target)
+                if not out:
+                    continue
+                if spans is None:
+                    whole.append((target, *shards.start_record(target, prefix + contig)))
+                else:
+                    regions.extend([target, start, end, []] for start, end in spans)
+
+        if whole or regions:
+            text = piece.decode()
+            for _, out, stats in whole:
+                out.write(piece)
+                stats.extend(text)
+            piece_end = pos + len(text)
+            for target, start, end, pieces in regions:
+                if start < piece_end and end > pos:
+                    pieces.append(text[max(start - pos, 0):end - pos])
+            pos = piece_end
+
+    end_contig()
+
+
+def fetch_contigs(fa, sample_name, haplotype_id, shards):
+    """Copy every routed contig and region to its shards via the .fai/.gzi indexes."""
+    prefix = f">{sample_name}#{haplotype_id}#"
+    for contig, (length, _, _, _) in fa.index.items():
+        for target, spans in _worker_router.get(contig, ()):
+            out, stats = shards.get(target)
+            if not out or length == 0:
+                continue
+            if spans is None:
+                shards.start_record(target, prefix + contig)
+                for piece in fa.iter_sequence(contig):
+                    out.write(piece.encode())
+                    stats.extend(piece)
+                shards.end_record(target, length)
+            else:
+                for start, end in spans:
+                    end = min(end, length)
+                    if start < end:
+                        shards.write_record(target, prefix + region_name(contig, start, end),
+                                            fa.fetch(contig, start, end))
+
+
+def routed_regions(index, shards):
+    """(contig, start, end or None) of every routed contig and region of an assembly's .fai index."""
+    regions = []
+    for contig in index:
+        for target, spans in _worker_router.get(contig, ()):
+            if not shards.shard_paths.get(target):
+                continue
+            if spans is None:
+                regions.append((contig, 0, None))
+            else:
+                regions.extend((contig, start, end) for start, end in spans)
+    return regions
 
 
 def process_single_file(args):
-    """Process a single FASTA file and return extracted sequences by chromosome and sample."""
-    fasta_file, sample_name, haplotype_id, chr19_contigs, chr22_contigs, file_idx, total_files = args
-    
-    sequences = {'19': [], '22': []}  # List of (header, seq) tuples
-    stats = {'19': 0, '22': 0}
-    
-    print(f"[{file_idx}/{total_files}] Processing {sample_name} haplotype {haplotype_id}...", file=sys.stderr)
-    
+    """Write the routed contigs and regions of one FASTA file into its shard files.
+
+    BGZF inputs are read through their indexes (built and cached if missing)
+    unless use_index is off; plain gzip inputs are scanned in full. Remote
+    inputs (a (URL, TSV row, endpoint, cached .fai/.gzi) source) with indexes
+    have only the blocks of their routed contigs fetched; the others are
+    streamed and scanned as they download. If reading fails partway (a
+    corrupt or truncated file, an I/O error, a download that does not
+    verify), the shards are deleted and the file is reported as failed.
+    Returns the shard written per target with its ChunkStats and index
+    entries; no sequence goes back to the parent process.
+    """
+    (fasta_file, sample_name, haplotype_id, shard_paths, use_bgzip, use_index, write_threads,
+     file_idx, total_files) = args
+
+    shards = ShardSet(shard_paths, use_bgzip, write_threads)
+    fa = None
+    remote = isinstance(fasta_file, tuple)
+    if remote:
+        url, row, endpoint, remote_index = fasta_file
+        if remote_index:
+            fa = RemoteIndexedFasta(url, *remote_index)
+        mode = "ranged" if fa else "stream"
+    elif use_index and is_bgzf(fasta_file):
+        try:
+            fa = IndexedFasta(fasta_file)
+        except (OSError, ValueError) as e:
+            print(f"Cannot index {fasta_file} ({e}); scanning it instead", file=sys.stderr)
+    if not remote:
+        mode = "indexed" if fa else "scan"
+    print(f"[{file_idx}/{total_files}] Processing {sample_name} haplotype {haplotype_id} ({mode})...", file=sys.stderr)
+
+    failed = False
     try:
-        with gzip.open(fasta_file, 'rt') as in_f:
-            current_header = None
-            current_seq = []
-            current_chrom = None
-
-            for line in in_f:
-                line = line.strip()
-
-                if line.startswith('>'):
-                    # Flush previous
-                    if current_chrom and current_header and current_seq:
-                        header_no_gt = current_header[1:]
-                        pansn_header = f">{sample_name}#{haplotype_id}#{header_no_gt}"
-                        seq_data = ''.join(current_seq)
-                        sequences[current_chrom].append((pansn_header, seq_data))
-                        stats[current_chrom] += 1
-
-                    # Start new contig
-                    current_header = line
-                    current_seq = []
-                    current_chrom = None
-
-                    # Check if this contig is in our contig lists
-                    header_no_gt = current_header[1:]
-                    if header_no_gt in chr19_contigs:
-                        current_chrom = '19'
-                    elif header_no_gt in chr22_contigs:
-                        current_chrom = '22'
-                    
-                else:
-                    if current_chrom:
-                        current_seq.append(line)
-
-            # Flush last contig
-            if current_chrom and current_header and current_seq:
-                header_no_gt = current_header[1:]
-                pansn_header = f">{sample_name}#{haplotype_id}#{header_no_gt}"
-                seq_data = ''.join(current_seq)
-                sequences[current_chrom].append((pansn_header, seq_data))
-                stats[current_chrom] += 1
-    
+        label = f"[{file_idx}/{total_files}] {sample_name} haplotype {haplotype_id}"
+        if remote and fa:
+            fa.prefetch(routed_regions(fa.index, shards))
+            print(f"{label}: fetched {format_bytes(fa.spans.fetched)} in {len(fa.ranges)} range requests",
+                  file=sys.stderr)
+            fetch_contigs(fa, sample_name, haplotype_id, shards)
+        elif fa:
+            fetch_contigs(fa, sample_name, haplotype_id, shards)
+        elif remote:
+            expected = expected_checksums(row, 'FASTA MD5', 'FASTA SHA-256', 'File Size', endpoint)
+            chunks = iter_gzip_stream(stream_url(url, expected, label))
+            scan_contigs(chunks, sample_name, haplotype_id, shards)
+        else:
+            scan_contigs(fasta_file, sample_name, haplotype_id, shards)
+
     except Exception as e:
-        print(f"Error processing {fasta_file}: {e}", file=sys.stderr)
-    
-    return sample_name, haplotype_id, sequences, stats
+        print(f"Error processing {fasta_file[0] if remote else fasta_file}: {e}", file=sys.stderr)
+        failed = True
 
+    finally:
+        shards.close()
+        if fa:
+            fa.close()
 
-def extract_chr_sequences(
+    shard_files, stats, indexes = shards.result()
+    if failed:
+        # A partial record (or a partial or corrupt download) must not end up in the chunks
+        for shard in shard_files.values():
+            os.remove(shard)
+        shard_files, stats, indexes = {}, {}, {}
+    return sample_name, haplotype_id, shard_files, stats, indexes, failed
+
+
+def extract_targets(
     input_dir,
     output_dir,
-    chr19_list_file=None,
-    chr22_list_file=None,
+    targets,
     chunk_size=20,
     use_bgzip=True,
     num_cores=32,
+    use_index=True,
+    balance=False,
+    num_chunks=None,
+    plan_file=None,
+    plan_only=False,
+    endpoint=None,
 ):
     """
-    Extract chromosome 19 and 22 sequences from all haplotype assemblies
-    and write to chunked PanSN-compliant FASTA files (20 individuals per chunk).
+    Extract the contigs and regions of every target from all haplotype assemblies
+    in one pass and write them to chunked PanSN-compliant FASTA files
+    (chunk_size individuals per chunk and target, or num_chunks chunks of
+    balanced bp with balance, or the chunks of a saved plan_file).
+
+    input_dir is a directory of assemblies, or a download_hprc.py TSV whose
+    assemblies are streamed from S3 (or endpoint) without saving them.
     """
     input_path = Path(input_dir)
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
 
-    fasta_files = sorted(input_path.glob("*_hap[12]_hprc*.fa.gz"))
+    index_dir = output_path / "remote_index"
+    if input_path.is_file():
+        # Sources are (URL, TSV row, endpoint, cached .fai/.gzi or None); file names come from the TSV
+        remote = load_remote_assemblies(input_path, endpoint)
+        remote_indexes = {}
+
+        def remote_index(assembly):
+            name, url, _ = assembly
+            try:
+                return fetch_index(url, index_dir, name)
+            except (OSError, ValueError) as e:
+                print(f"Cannot fetch the indexes of {name} ({e}); streaming it instead", file=sys.stderr)
+                return None
+
+        if use_index:
+            with ThreadPoolExecutor(INDEX_FETCH_JOBS) as pool:
+                fetched = pool.map(remote_index, remote)
+                remote_indexes = dict(zip((name for name, _, _ in remote), fetched))
+            n_indexed = sum(1 for index in remote_indexes.values() if index)
+            print(f"Fetched .fai/.gzi of {n_indexed}/{len(remote)} assemblies; "
+                  f"{len(remote) - n_indexed} are streamed in full")
+        sources = {name: (url, row, endpoint, remote_indexes.get(name)) for name, url, row in remote}
+        fasta_files = sorted(Path(name) for name in sources)
+    else:
+        sources = None
+        fasta_files = sorted(input_path.glob(ASSEMBLY_PATTERN))
     if not fasta_files:
         print(f"No FASTA files found in {input_dir}", file=sys.stderr)
         sys.exit(1)
 
-    print(f"Found {len(fasta_files)} haplotype assemblies")
-
-    # Load contig lists for each chromosome
-    chr19_contigs = set()
-    chr22_contigs = set()
-    if chr19_list_file:
-        chr19_contigs = load_contig_list(chr19_list_file)
-        print(f"Loaded {len(chr19_contigs)} chr19 contigs from {chr19_list_file}")
-    if chr22_list_file:
-        chr22_contigs = load_contig_list(chr22_list_file)
-        print(f"Loaded {len(chr22_contigs)} chr22 contigs from {chr22_list_file}")
-
-    # Build a mapping of (sample, haplotype) -> list of contigs for each chromosome
-    sample_chr19_contigs = defaultdict(list)
-    sample_chr22_contigs = defaultdict(list)
-    
-    for header in chr19_contigs:
-        parts = header.split('#')
-        if len(parts) >= 2:
-            sample = parts[0]
-            hap = parts[1]
-            sample_chr19_contigs[(sample, hap)].append(header)
-    
-    for header in chr22_contigs:
-        parts = header.split('#')
-        if len(parts) >= 2:
-            sample = parts[0]
-            hap = parts[1]
-            sample_chr22_contigs[(sample, hap)].append(header)
-    
-    # Get unique samples in order
-    samples_19 = sorted(set(s for s, h in sample_chr19_contigs.keys()))
-    samples_22 = sorted(set(s for s, h in sample_chr22_contigs.keys()))
-    
-    print(f"\nChr19: {len(samples_19)} samples, {len(chr19_contigs)} total contigs")
-    print(f"Chr22: {len(samples_22)} samples, {len(chr22_contigs)} total contigs")
-
-    print(f"\n=== STEP 1: Creating chunk files ===", file=sys.stderr)
-
-    # Prepare chunk files for each chromosome
-    chunk_files_19 = {}
-    chunk_files_22 = {}
-    sequences_by_chunk = {'19': defaultdict(int), '22': defaultdict(int)}
-    
-    def create_chunk_files(samples, chrom, output_dir, chunk_size, use_bgzip):
-        """Create chunk files for a chromosome's samples."""
+    print(f"Found {len(fasta_files)} haplotype assemblies" + (" to stream" if sources else ""))
+
+    assemblies = []  # (file index, path or remote source, sample, haplotype)
+    for file_idx, fasta_file in enumerate(fasta_files, start=1):
+        match = re.match(r'([^_]+)_hap([12])_', fasta_file.name)
+        if not match:
+            print(f"Warning: Could not parse filename {fasta_file.name}, skipping")
+            continue
+        source = sources[fasta_file.name] if sources else fasta_file
+        assemblies.append((file_idx, source, match.group(1), match.group(2)))
+
+    # Samples of each target, from the PanSN names (sample#hap#contig) of its contigs
+    target_samples = {}
+    for name, target in targets.items():
+        target_samples[name] = sorted(set(c.split('#')[0] for c in target['contigs'] if len(c.split('#')) >= 2))
+        n_regions = sum(len(spans) for spans in target['regions'].values()) if target['regions'] else 0
+        print(f"Target {name}: {len(target_samples[name])} samples, {len(target['contigs'])} contigs"
+              + (f", {n_regions} regions" if target['regions'] else ""))
+
+    router = build_router(targets)
+
+    print(f"\n=== STEP 1: Planning chunk files ===", file=sys.stderr)
+
+    # Remote assemblies are sized by their cached .fai; streamed ones count as the mean sample
+    sizing_inputs = []
+    for file_idx, source, sample, hap in assemblies:
+        if not sources:
+            sizing_inputs.append((sample, hap, source))
+        elif source[3]:
+            sizing_inputs.append((sample, hap, index_dir / fasta_files[file_idx - 1].name))
+
+    # Sample -> chunk assignment of each target: saved, balanced by bp or fixed groups
+    saved_plans = load_plan(plan_file) if plan_file else {}
+    plans = {}
+    for name, target in targets.items():
+        if name in saved_plans:
+            plans[name] = saved_plans[name]
+            planned = set(s for chunk in plans[name]['chunks'] for s in chunk['samples'])
+            missing = set(target_samples[name]) - planned
+            if missing:
+                print(f"Warning: {len(missing)} target {name} samples are not in {plan_file} and are skipped",
+                      file=sys.stderr)
+            continue
+        sizes = sample_sizes(sizing_inputs, target['contigs'], target['regions'], build_index=balance)
+        if balance:
+            plans[name] = balanced_plan(sizes, num_chunks or math.ceil(len(sizes) / chunk_size))
+        else:
+            plans[name] = fixed_plan(sizes, chunk_size)
+    for name, plan in plans.items():
+        print(format_plan(name, plan), file=sys.stderr)
+    update_plan(output_path, plans)
+    if plan_only:
+        print(f"\nChunk plan: {output_path / 'chunk_plan.json'}")
+        return {}
+
+    def plan_chunk_files(plan, target, output_dir):
+        """Chunk files of a target's plan."""
         chunks = {}
-        for chunk_idx, i in enumerate(range(0, len(samples), chunk_size), start=1):
-            chunk_samples = samples[i:i+chunk_size]
-            chunk_path = output_dir / f"chrom{chrom}_chunk{chunk_idx}.fa.gz"
-            out_handle, closer = open_output(str(chunk_path), use_bgzip=use_bgzip)
+        for chunk_idx, chunk in enumerate(plan['chunks'], start=1):
+            chunk_path = output_dir / f"chrom{target}_chunk{chunk_idx}.fa.gz"
             chunks[chunk_idx] = {
                 'path': chunk_path,
-                'handle': out_handle,
-                'closer': closer,
-                'samples': set(chunk_samples)
+                'samples': set(chunk['samples']),
+                'shards': [],
+                'indexes': [],
+                'stats': ChunkStats()
             }
-            print(f"Created chunk {chunk_idx} for {len(chunk_samples)} samples: {chunk_path}", file=sys.stderr)
+            print(f"Planned chunk {chunk_idx} for {len(chunk['samples'])} samples: {chunk_path}", file=sys.stderr)
         return chunks
-    
-    if chr19_contigs:
-        chunk_files_19 = create_chunk_files(samples_19, '19', output_path, chunk_size, use_bgzip)
-    if chr22_contigs:
-        chunk_files_22 = create_chunk_files(samples_22, '22', output_path, chunk_size, use_bgzip)
-    
-    sequences_written = {'19': 0, '22': 0}
+
+    # Chunk files for each target and the chunk of every sample
+    chunk_files = {name: plan_chunk_files(plans[name], name, output_path) for name in targets}
+    chunk_of_sample = {name: {sample: chunk_idx for chunk_idx, info in chunks.items() for sample in info['samples']}
+                       for name, chunks in chunk_files.items()}
+
+    # Every worker writes its own shard per (target, chunk, file)
+    shard_dir = output_path / "shards"
+    shard_dir.mkdir(exist_ok=True)
+
+    sequences_written = defaultdict(int)
     samples_processed = set()
+    failed_files = []
 
     print(f"\n=== STEP 2: Extracting sequences in parallel ({num_cores} cores) ===", file=sys.stderr)
 
+    # Cores left over when there are fewer files than workers compress the shards' blocks
+    write_threads = max(1, (os.cpu_count() or 1) // min(num_cores, len(fasta_files)))
+
     # Prepare arguments for parallel processing
     process_args = []
     total_files = len(fasta_files)
-    for file_idx, fasta_file in enumerate(fasta_files, start=1):
-        match = re.match(r'([^_]+)_hap([12])_', fasta_file.name)
-        if not match:
-            print(f"Warning: Could not parse filename {fasta_file.name}, skipping")
-            continue
-        
-        sample_name = match.group(1)
-        haplotype_id = match.group(2)
+    for file_idx, fasta_file, sample_name, haplotype_id in assemblies:
         samples_processed.add(sample_name)
-        
+
+        shard_paths = {}
+        for name in targets:
+            chunk_idx = chunk_of_sample[name].get(sample_name)
+            if chunk_idx:
+                shard_paths[name] = shard_dir / f"chrom{name}_chunk{chunk_idx}.{file_idx:05d}.fa.gz"
+
         process_args.append((
             fasta_file,
             sample_name,
             haplotype_id,
-            chr19_contigs,
-            chr22_contigs,
+            shard_paths,
+            use_bgzip,
+            use_index,
+            write_threads,
             file_idx,
             total_files
         ))
 
     # Process files in parallel
     print(f"Processing {len(process_args)} files with {num_cores} cores...", file=sys.stderr)
-    with Pool(num_cores) as pool:
+    with Pool(num_cores, initializer=init_worker, initargs=(router,)) as pool:
         results = pool.map(process_single_file, process_args)
 
-    # Write results to chunk files
-    print(f"\n=== STEP 3: Writing sequences to chunk files ===", file=sys.stderr)
-    
-    # Organize sequences by sample and chromosome for efficient writing
-    for sample_name, haplotype_id, sequences, stats in results:
-        # Write chr19 sequences
-        for header, seq in sequences['19']:
-            for chunk_idx, chunk_info in chunk_files_19.items():
-                if sample_name in chunk_info['samples']:
-                    chunk_info['handle'].write(header + '\n')
-                    chunk_info['handle'].write(seq + '\n')
-                    sequences_by_chunk['19'][chunk_idx] += 1
-            sequences_written['19'] += 1
-        
-        # Write chr22 sequences
-        for header, seq in sequences['22']:
-            for chunk_idx, chunk_info in chunk_files_22.items():
-                if sample_name in chunk_info['samples']:
-                    chunk_info['handle'].write(header + '\n')
-                    chunk_info['handle'].write(seq + '\n')
-                    sequences_by_chunk['22'][chunk_idx] += 1
-            sequences_written['22'] += 1
-
-    # Close all chunk handles
-    for chunk_idx, chunk_info in chunk_files_19.items():
-        chunk_info['closer']()
-    for chunk_idx, chunk_info in chunk_files_22.items():
-        chunk_info['closer']()
+    # Concatenate shards into the chunk files
+    print(f"\n=== STEP 3: Concatenating shards into chunk files ===", file=sys.stderr)
+
+    for sample_name, haplotype_id, shards, stats, indexes, failed in results:
+        if failed:
+            failed_files.append(f"{sample_name} haplotype {haplotype_id}")
+        for name, shard in shards.items():
+            chunk_info = chunk_files[name][chunk_of_sample[name][sample_name]]
+            chunk_info['shards'].append(shard)
+            if use_bgzip:
+                chunk_info['indexes'].append(indexes[name])
+            chunk_info['stats'].merge(stats[name])
+            sequences_written[name] += stats[name].sequences
+
+    manifest_entries = {}
+    for name, chunks in chunk_files.items():
+        for chunk_idx, chunk_info in chunks.items():
+            raw_out = HashingWriter(chunk_info['path'])
+            concatenate(chunk_info['shards'], raw_out, eof=use_bgzip)
+            if not use_bgzip and not chunk_info['shards']:
+                raw_out.write(gzip.compress(b''))
+            raw_out.close()
+            if use_bgzip:
+                # Indexes as samtools faidx would write them, without reading the chunk again
+                gzi, fai = merge_shard_indexes(chunk_info['shards'], chunk_info['indexes'])
+                write_gzi(f"{chunk_info['path']}.gzi", gzi)
+                write_fai(f"{chunk_info['path']}.fai", fai)
+            for shard in chunk_info['shards']:
+                os.remove(shard)
+            manifest_entries[chunk_info['path'].name] = chunk_info['stats'].entry(
+                raw_out.sha256.hexdigest(), raw_out.size)
+    update_manifest(output_path, manifest_entries)
+    shard_dir.rmdir()
 
     print("\n=== COMPLETE ===")
     print(f"Samples processed: {len(samples_processed)}")
-    
-    if chr19_contigs:
-        print(f"\nChromosome 19:")
-        print(f"  Total sequences written: {sequences_written.get('19', 0)}")
-        for chunk_idx in sorted(chunk_files_19.keys()):
-            print(f"  Chunk {chunk_idx}: {sequences_by_chunk['19'][chunk_idx]} sequences -> {chunk_files_19[chunk_idx]['path']}")
-    
-    if chr22_contigs:
-        print(f"\nChromosome 22:")
-        print(f"  Total sequences written: {sequences_written.get('22', 0)}")
-        for chunk_idx in sorted(chunk_files_22.keys()):
-            print(f"  Chunk {chunk_idx}: {sequences_by_chunk['22'][chunk_idx]} sequences -> {chunk_files_22[chunk_idx]['path']}")
-
-    return sequences_written.get('22', 0)
+
+    for name, chunks in chunk_files.items():
+        print(f"\nTarget {name}:")
+        print(f"  Total sequences written: {sequences_written[name]}")
+        for chunk_idx in sorted(chunks.keys()):
+            print(f"  Chunk {chunk_idx}: {chunks[chunk_idx]['stats'].sequences} sequences -> {chunks[chunk_idx]['path']}")
+
+    print(f"\nManifest: {output_path / 'manifest.json'}")
+    if failed_files:
+        print(f"\nFailed to read {len(failed_files)} assemblies (left out of the chunks):")
+        for failed in failed_files:
+            print(f"  {failed}")
+
+    return dict(sequences_written)
+
+
+def extract_chr_sequences(
+    input_dir,
+    output_dir,
+    chr19_list_file=None,
+    chr22_list_file=None,
+    chunk_size=20,
+    use_bgzip=True,
+    num_cores=32,
+    use_index=True,
+    balance=False,
+    num_chunks=None,
+    plan_file=None,
+    plan_only=False,
+    endpoint=None,
+):
+    """
+    Extract chromosome 19 and 22 sequences from all haplotype assemblies
+    and write to chunked PanSN-compliant FASTA files (20 individuals per chunk).
+    """
+    targets = {}
+    for chrom, list_file in (('19', chr19_list_file), ('22', chr22_list_file)):
+        if list_file:
+            targets[chrom] = {'contigs': load_contig_list(list_file), 'regions': None}
+            print(f"Loaded {len(targets[chrom]['contigs'])} chr{chrom} contigs from {list_file}")
+    written = extract_targets(input_dir, output_dir, targets, chunk_size=chunk_size,
+                              use_bgzip=use_bgzip, num_cores=num_cores, use_index=use_index,
+                              balance=balance, num_chunks=num_chunks, plan_file=plan_file,
+                              plan_only=plan_only, endpoint=endpoint)
+    return written.get('22', 0)
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Extract chromosome 19 and 22 sequences from HPRC assemblies into chunked PanSN FASTA files")
-    parser.add_argument("input_dir", help="Directory with *_hap[12]_hprc*.fa.gz")
+    parser = argparse.ArgumentParser(description="Extract chromosome 19 and 22 sequences (or any target spec) from HPRC assemblies into chunked PanSN FASTA files")
+    parser.add_argument("input_dir", help="Directory with *_hap[12]_hprc*.fa.gz, or the assembly TSV of "
+                                          "download_hprc.py to stream them from S3 without saving them")
     parser.add_argument("output_dir", help="Output directory for chunked FASTA files")
-    parser.add_argument("--chr19-list", dest="chr19_list_file", required=True,
+    parser.add_argument("--chr19-list", dest="chr19_list_file",
                         help="File with chr19 contig headers (one per line)")
-    parser.add_argument("--chr22-list", dest="chr22_list_file", required=True,
+    parser.add_argument("--chr22-list", dest="chr22_list_file",
                         help="File with chr22 contig headers (one per line)")
+    parser.add_argument("--targets", dest="target_spec",
+                        help="Target spec with any chromosomes and BED regions (replaces --chr19-list/--chr22-list)")
     parser.add_argument("--chunk-size", type=int, default=20,
                         help="Number of individuals per chunk file (default 20)")
     parser.add_argument("--no-bgzip", dest="use_bgzip", action="store_false",
-                        help="Use gzip instead of bgzip for output")
+                        help="Use plain gzip instead of BGZF for output")
+    parser.add_argument("--no-index", dest="use_index", action="store_false",
+                        help="Scan every input in full instead of seeking to the listed contigs of "
+                             "bgzipped inputs through their .fai/.gzi indexes")
+    parser.add_argument("--balance", action="store_true",
+                        help="Bin-pack samples into chunks of balanced bp (from the inputs' .fai) "
+                             "instead of fixed groups of --chunk-size sorted names")
+    parser.add_argument("--num-chunks", type=int,
+                        help="Number of balanced chunks per target (default: samples / --chunk-size)")
+    parser.add_argument("--plan", dest="plan_file",
+                        help="Reuse the sample-to-chunk assignment of a saved chunk_plan.json")
+    parser.add_argument("--plan-only", action="store_true",
+                        help="Write chunk_plan.json to the output directory and stop")
+    parser.add_argument("--endpoint",
+                        help="S3-compatible endpoint or mirror to stream from when input_dir is a TSV")
 
     args = parser.parse_args()
-
-    extract_chr_sequences(
-        args.input_dir,
-        args.output_dir,
-        chr19_list_file=args.chr19_list_file,
-        chr22_list_file=args.chr22_list_file,
-        chunk_size=args.chunk_size,
-        use_bgzip=args.use_bgzip,
-        num_cores=24,
-    )
\ No newline at end of file
+    if not args.target_spec and not (args.chr19_list_file and args.chr22_list_file):
+        parser.error("either --targets or both --chr19-list and --chr22-list are required")
+
+    if args.target_spec:
+        extract_targets(
+            args.input_dir,
+            args.output_dir,
+            load_target_spec(args.target_spec),
+            chunk_size=args.chunk_size,
+            use_bgzip=args.use_bgzip,
+            num_cores=24,
+            use_index=args.use_index,
+            balance=args.balance,
+            num_chunks=args.num_chunks,
+            plan_file=args.plan_file,
+            plan_only=args.plan_only,
+            endpoint=args.endpoint,
+        )
+    else:
+        extract_chr_sequences(
+            args.input_dir,
+            args.output_dir,
+            chr19_list_file=args.chr19_list_file,
+            chr22_list_file=args.chr22_list_file,
+            chunk_size=args.chunk_size,
+            use_bgzip=args.use_bgzip,
+            num_cores=24,
+            use_index=args.use_index,
+            balance=args.balance,
+            num_chunks=args.num_chunks,
+            plan_file=args.plan_file,
+            plan_only=args.plan_only,
+            endpoint=args.endpoint,
+        )
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Read target contigs out of remote bgzipped HPRC assemblies with HTTP Range
+requests, through the .fai/.gzi indexes published next to them, instead of
+downloading the whole ~1 GB files.
+
+1. The .fai and .gzi of an assembly (a few hundred KB) are fetched once and
+   cached locally (fetch_index).
+2. The uncompressed byte range of every wanted contig or region is mapped to
+   the BGZF blocks holding it; block ranges less than MERGE_GAP apart are
+   coalesced, and the resulting spans are fetched by a few threads.
+3. RemoteIndexedFasta serves the fetched spans like a local IndexedFasta
+   (docker_pipeline/faidx.py), so extract_chr19_ch22.py reads them with the
+   same code. Every block is checked against its CRC32, since the file's
+   MD5/SHA-256 cannot be checked without all of it.
+
+Usage:
+    python remote_faidx.py <s3:// or http(s):// URL of a .fa.gz> [contig ...] [--endpoint URL]
+"""
+
+import argparse
+import bisect
+import os
+import sys
+import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "docker_pipeline"))
+from bgzf import BgzfReader, read_gzi
+from faidx import IndexedFasta, read_fai
+from download_hprc import fetch_bytes, fetch_range, format_bytes, s3_to_wget_url
+
+MERGE_GAP = 256 * 1024  # Compressed bytes between two ranges that are fetched in one request anyway
+FETCH_THREADS = 4  # Concurrent range requests per assembly
+
+
+def coalesce(ranges, gap=MERGE_GAP):
+    """Merge (start, end) byte ranges that overlap or are less than gap apart; end None is the end of the file"""
+    merged = []
+    for start, end in sorted(ranges, key=lambda r: r[0]):
+        if merged and (merged[-1][1] is None or start <= merged[-1][1] + gap):
+            if merged[-1][1] is not None:
+                merged[-1][1] = None if end is None else max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+def fetch_index(url, cache_dir, name=None):
+    """Local copies of the .fai and .gzi published next to a remote BGZF FASTA, or None if it has none"""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    name = name or url.rsplit('/', 1)[-1]
+    paths = (cache_dir / f"{name}.fai", cache_dir / f"{name}.gzi")
+    if all(p.exists() for p in paths):
+        return paths
+    for suffix, path in zip(('.fai', '.gzi'), paths):
+        data = fetch_bytes(url + suffix)
+        if data is None:
+            return None
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    return paths
+
+
+class SpanFile:
+    """Read-only binary file over the byte spans fetched from a remote file"""
+
+    def __init__(self):
+        self.starts = []
+        self.spans = []
+        self.pos = 0
+        self.fetched = 0
+
+    def add(self, start, data):
+        i = bisect.bisect(self.starts, start)
+        self.starts.insert(i, start)
+        self.spans.insert(i, data)
+        self.fetched += len(data)
+
+    def seek(self, pos):
+        self.pos = pos
+
+    def read(self, n):
+        i = bisect.bisect_right(self.starts, self.pos) - 1
+        if i < 0 or self.pos >= self.starts[i] + len(self.spans[i]):
+            raise ValueError(f"byte {self.pos} of the remote file was not fetched")
+        offset = self.pos - self.starts[i]
+        data = self.spans[i][offset:offset + n]
+        self.pos += len(data)
+        return data
+
+    def close(self):
+        self.starts, self.spans = [], []
+
+
+class RemoteIndexedFasta(IndexedFasta):
+    """Contigs and regions of a remote bgzipped FASTA, fetched with Range requests
+
+    Only what was passed to prefetch can be read afterwards.
+    """
+
+    def __init__(self, url, fai_path, gzi_path):
+        self.url = url
+        self.index = read_fai(fai_path)
+        self.spans = SpanFile()
+        self.reader = BgzfReader(self.spans, read_gzi(gzi_path), check_crc=True)
+        self.ranges = []
+
+    def prefetch(self, regions, threads=FETCH_THREADS):
+        """Fetch the blocks of (contig, start, end or None) regions in coalesced range requests"""
+        ranges = []
+        for contig, start, end in regions:
+            length = self.index[contig][0]
+            end = length if end is None else min(end, length)
+            if start >= end:
+                continue
+            first = self._byte_offset(contig, start)
+            ranges.append(self.reader.block_range(first, self._byte_offset(contig, end - 1) + 1 - first))
+        self.ranges = coalesce(ranges)
+        with ThreadPoolExecutor(threads) as pool:
+            for (start, _), data in zip(self.ranges, pool.map(lambda r: fetch_range(self.url, *r), self.ranges)):
+                self.spans.add(start, data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print contigs of a remote bgzipped FASTA, fetching only their blocks")
+    parser.add_argument("url", help="s3:// or http(s):// URL of a BGZF FASTA with .fai/.gzi next to it")
+    parser.add_argument("contigs", nargs="*", help="Contigs to print (default: list contigs)")
+    parser.add_argument("--endpoint", help="S3-compatible endpoint or mirror for s3:// URLs")
+    parser.add_argument("--cache", default="remote_index", help="Directory for the fetched indexes (default remote_index)")
+    args = parser.parse_args()
+
+    url = s3_to_wget_url(args.url, args.endpoint) if args.url.startswith('s3://') else args.url
+    index = fetch_index(url, args.cache)
+    if index is None:
+        print(f"No .fai/.gzi next to {url}", file=sys.stderr)
+        sys.exit(1)
+
+    fa = RemoteIndexedFasta(url, *index)
+    if not args.contigs:
+        for name, (length, _, _, _) in fa.index.items():
+            print(f"{name}\t{length}")
+        return
+    start = time.time()
+    fa.prefetch([(name, 0, None) for name in args.contigs])
+    elapsed = time.time() - start
+    for name in args.contigs:
+        print(f">{name}")
+        print(fa.fetch(name))
+    index_bytes = sum(os.path.getsize(p) for p in index)
+    print(f"Fetched {format_bytes(fa.spans.fetched)} in {len(fa.ranges)} range requests "
+          f"({format_bytes(index_bytes)} of indexes) in {elapsed:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
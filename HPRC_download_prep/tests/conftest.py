@@ -0,0 +1,75 @@
+"""Shared fixtures: a local HTTP server with Range support that can misbehave on request"""
+
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+sys.path.insert(0, str(HERE.parent.parent / "docker_pipeline"))
+
+import download_hprc  # noqa: E402
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get('Range')))
+        path = server.root / self.path.lstrip('/')
+        if self.path in server.status:
+            self.send_error(server.status[self.path])
+            return
+        if not path.is_file():
+            self.send_error(404)
+            return
+        data = path.read_bytes()
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match and not server.ignore_range:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) + 1, len(data)) if match.group(2) else len(data)
+            if start >= len(data):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end - 1}/{len(data)}")
+            body = data[start:end]
+        else:
+            self.send_response(200)
+            body = data
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if server.truncate:
+            # Promise the whole body, send half of it and drop the connection
+            server.truncate -= 1
+            body = body[:len(body) // 2]
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    """Serves tmp_path/'www'; set ignore_range, truncate (responses to cut short) or status[path]"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    server.root = tmp_path / "www"
+    server.root.mkdir()
+    server.requests = []
+    server.status = {}
+    server.ignore_range = False
+    server.truncate = 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(download_hprc, 'RETRY_DELAY', 0)
@@ -0,0 +1,82 @@
+import hashlib
+import os
+
+import pytest
+
+from download_hprc import download_one
+
+DATA = bytes(range(256)) * 4096  # 1 MB
+
+
+@pytest.fixture
+def remote(http_server):
+    (http_server.root / "asm.fa.gz").write_bytes(DATA)
+    return f"{http_server.url}/asm.fa.gz"
+
+
+def expected(data=DATA):
+    return {'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+
+
+def test_resumes_part_file(remote, http_server, tmp_path):
+    dest = tmp_path / "asm.fa.gz"
+    (tmp_path / "asm.fa.gz.part").write_bytes(DATA[:300000])
+    assert download_one(remote, str(dest), expected(), "t") == ('done', len(DATA) - 300000)
+    assert dest.read_bytes() == DATA
+    assert http_server.requests == [("/asm.fa.gz", "bytes=300000-")]
+    assert (tmp_path / "asm.fa.gz.verified").exists()
+    assert not (tmp_path / "asm.fa.gz.part").exists()
+
+
+def test_complete_part_file_gets_416(remote, http_server, tmp_path):
+    dest = tmp_path / "asm.fa.gz"
+    (tmp_path / "asm.fa.gz.part").write_bytes(DATA)
+    assert download_one(remote, str(dest), expected(), "t") == ('done', 0)
+    assert dest.read_bytes() == DATA
+    assert http_server.requests == [("/asm.fa.gz", f"bytes={len(DATA)}-")]
+
+
+def test_server_ignoring_range_restarts(remote, http_server, tmp_path):
+    http_server.ignore_range = True
+    dest = tmp_path / "asm.fa.gz"
+    (tmp_path / "asm.fa.gz.part").write_bytes(DATA[:300000])
+    assert download_one(remote, str(dest), expected(), "t") == ('done', len(DATA))
+    assert dest.read_bytes() == DATA
+
+
+def test_checksum_mismatch_fails(remote, http_server, tmp_path):
+    dest = tmp_path / "asm.fa.gz"
+    bad = dict(expected(), sha256="0" * 64)
+    assert download_one(remote, str(dest), bad, "t", retries=1) == ('failed', 2 * len(DATA))
+    assert len(http_server.requests) == 2
+    assert not dest.exists()
+    assert not (tmp_path / "asm.fa.gz.part").exists()
+
+
+def test_skips_verified_file(remote, http_server, tmp_path):
+    dest = tmp_path / "asm.fa.gz"
+    assert download_one(remote, str(dest), expected(), "t")[0] == 'done'
+    assert download_one(remote, str(dest), expected(), "t") == ('skipped', 0)
+    assert len(http_server.requests) == 1
+
+    # A file changed after it was verified is checked again
+    dest.write_bytes(DATA[:-1] + b'x')
+    os.utime(dest, ns=(1, 1))
+    assert download_one(remote, str(dest), expected(), "t")[0] == 'done'
+    assert dest.read_bytes() == DATA
+    assert len(http_server.requests) == 2
+
+
+def test_truncated_response_is_resumed(remote, http_server, tmp_path):
+    http_server.truncate = 1
+    dest = tmp_path / "asm.fa.gz"
+    assert download_one(remote, str(dest), expected(), "t")[0] == 'done'
+    assert dest.read_bytes() == DATA
+    assert http_server.requests == [("/asm.fa.gz", None), ("/asm.fa.gz", f"bytes={len(DATA) // 2}-")]
+
+
+@pytest.mark.parametrize("code", [403, 404])
+def test_missing_file_fails_without_retrying(remote, http_server, tmp_path, code):
+    http_server.status["/asm.fa.gz"] = code
+    assert download_one(remote, str(tmp_path / "asm.fa.gz"), expected(), "t") == ('failed', 0)
+    assert len(http_server.requests) == 1
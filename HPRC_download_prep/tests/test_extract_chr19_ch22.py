@@ -0,0 +1,47 @@
+import gzip
+import random
+
+from extract_chr19_ch22 import extract_targets
+from faidx import IndexedFasta, read_fai
+from fasta_manifest import load_manifest
+
+
+def write_assembly(path, contigs, truncate=False):
+    """Plain gzip FASTA; truncate cuts the compressed file in the middle of the last contig"""
+    text = ''.join(f">{name}\n" + ''.join(seq[j:j + 60] + '\n' for j in range(0, len(seq), 60))
+                   for name, seq in contigs.items())
+    data = gzip.compress(text.encode(), compresslevel=1)
+    path.write_bytes(data[:len(data) * 3 // 4] if truncate else data)
+
+
+def test_truncated_local_assembly_is_left_out(tmp_path):
+    rng = random.Random(0)
+    in_dir, out_dir = tmp_path / "in", tmp_path / "out"
+    in_dir.mkdir()
+    good = {f"HG001#1#ctg{i}": ''.join(rng.choices('ACGT', k=length))
+            for i, length in enumerate([40000, 250000])}
+    # The reader parses 16 MB at a time: the cut contig must span more than that
+    # for a piece of it to be copied before the error
+    bad = {"HG002#1#ctg0": ''.join(rng.choices('ACGT', k=30000)),
+           "HG002#1#ctg1": ''.join(rng.choices('ACGT', k=1000)) * 24000}
+    write_assembly(in_dir / "HG001_hap1_hprc_test.fa.gz", good)
+    write_assembly(in_dir / "HG002_hap1_hprc_test.fa.gz", bad, truncate=True)
+
+    # Targets list PanSN contig names; the chunks prefix sample#hap# to the input headers
+    targets = {'19': {'contigs': set(good) | set(bad), 'regions': None}}
+    extract_targets(str(in_dir), str(out_dir), targets, num_cores=1)
+
+    chunk = out_dir / "chrom19_chunk1.fa.gz"
+    fai = read_fai(f"{chunk}.fai")
+    assert list(fai) == [f"HG001#1#{name}" for name in good]
+    # The chunk holds exactly the indexed records, whole
+    with gzip.open(chunk, 'rt') as f:
+        headers = [line[1:].rstrip() for line in f if line.startswith('>')]
+    assert headers == list(fai)
+    fasta = IndexedFasta(str(chunk))
+    for name, seq in good.items():
+        assert fasta.fetch(f"HG001#1#{name}") == seq
+    fasta.close()
+    entry = load_manifest(out_dir)[chunk.name]
+    assert entry['sequences'] == len(fai)
+    assert 'HG002' not in entry['per_sample']
@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from bgzf import BgzfReader, BgzfWriter, read_gzi
+from download_hprc import fetch_range
+from faidx import IndexedFasta
+from remote_faidx import RemoteIndexedFasta, coalesce, fetch_index
+
+
+@pytest.fixture
+def assembly(http_server):
+    """BGZF FASTA of several multi-block contigs with .fai/.gzi, served over HTTP"""
+    rng = random.Random(0)
+    path = http_server.root / "asm.fa.gz"
+    with BgzfWriter(str(path)) as out:
+        for i, length in enumerate([150000, 70, 260000, 1000, 90000]):
+            seq = ''.join(rng.choices('ACGTN', k=length))
+            out.write(f">HG002#1#ctg{i}\n")
+            out.write(''.join(seq[j:j + 60] + '\n' for j in range(0, length, 60)))
+    local = IndexedFasta(str(path))  # Builds the .fai/.gzi next to it
+    yield f"{http_server.url}/asm.fa.gz", local
+    local.close()
+
+
+def test_coalesce():
+    assert coalesce([]) == []
+    assert coalesce([(300, 400), (0, 100)], gap=0) == [(0, 100), (300, 400)]
+    assert coalesce([(0, 100), (50, 80), (90, 200)], gap=0) == [(0, 200)]
+    assert coalesce([(0, 100), (150, 200)], gap=50) == [(0, 200)]
+    assert coalesce([(0, 100), (151, 200)], gap=50) == [(0, 100), (151, 200)]
+    # An open end absorbs everything after it
+    assert coalesce([(500, None), (0, 100), (120, 300), (600, 700)], gap=50) == [(0, 300), (500, None)]
+    assert coalesce([(0, 100), (80, None)], gap=0) == [(0, None)]
+
+
+def test_block_range(assembly, http_server):
+    path = http_server.root / "asm.fa.gz"
+    entries = read_gzi(f"{path}.gzi")
+    reader = BgzfReader(str(path), entries)
+    (c0, u0), (c1, u1), (c2, _) = entries[:3]
+    assert reader.block_range(0, 1) == (c0, c1)
+    assert reader.block_range(u1 - 1, 2) == (c0, c2)
+    assert reader.block_range(u1, u1) == (c1, c2)
+    # The last block's end is not in the index
+    last_c, last_u = entries[-1]
+    assert reader.block_range(last_u + 5, 10) == (last_c, None)
+    assert reader.block_range(u1, last_u - u1 + 1) == (c1, None)
+    reader.close()
+
+
+def test_remote_fetch_matches_local(assembly, http_server, tmp_path):
+    url, local = assembly
+    index = fetch_index(url, tmp_path / "cache")
+    remote = RemoteIndexedFasta(url, *index)
+    regions = [("HG002#1#ctg0", 1000, 2000), ("HG002#1#ctg2", 70000, 200000),
+               ("HG002#1#ctg1", 0, None), ("HG002#1#ctg4", 0, None)]
+    remote.prefetch(regions)
+    for name, start, end in regions:
+        assert remote.fetch(name, start, end) == local.fetch(name, start, end)
+    # Only the coalesced block spans were fetched, not the whole file
+    assert remote.spans.fetched < (http_server.root / "asm.fa.gz").stat().st_size
+    assert len([r for r in http_server.requests if r[1]]) == len(remote.ranges)
+
+    # Only prefetched blocks can be read
+    remote = RemoteIndexedFasta(url, *index)
+    remote.prefetch([("HG002#1#ctg0", 0, 100)])
+    assert remote.fetch("HG002#1#ctg0", 0, 100) == local.fetch("HG002#1#ctg0", 0, 100)
+    with pytest.raises(ValueError, match="not fetched"):
+        remote.fetch("HG002#1#ctg4")
+
+
+def test_fetch_index_missing_fai(assembly, http_server, tmp_path):
+    url, _ = assembly
+    (http_server.root / "asm.fa.gz.fai").unlink()
+    assert fetch_index(url, tmp_path / "cache") is None
+    assert not (tmp_path / "cache" / "asm.fa.gz.fai").exists()
+
+
+def test_fetch_range(assembly, http_server):
+    url, _ = assembly
+    data = (http_server.root / "asm.fa.gz").read_bytes()
+    assert fetch_range(url, 100, 5000) == data[100:5000]
+    assert fetch_range(url, len(data) - 10) == data[-10:]
+    http_server.ignore_range = True
+    with pytest.raises(ValueError, match="ignored the Range"):
+        fetch_range(url, 100, 5000)
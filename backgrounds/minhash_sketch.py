@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+MinHash Sketch Similarity for Haplotype Sequences
+
+Sketches FASTA sequences (e.g. the APOE cluster representatives) and writes
+their all-pairs Jaccard and Mash distance matrices:
+- Every sequence becomes a bottom-k MinHash sketch: the --sketch-size smallest
+  hashes of its canonical k-mers (2-bit codes, k <= 31, shared with
+  scripts/dotplot.py through scripts/kmers.py), computed in a process pool
+- Sketches are saved in one .npz (sorted uint64 hashes per sequence, names,
+  k), so they can be compared again without the FASTA
+- Shared hashes of all pairs come from an inverted index of the hashes
+  (cost follows the number of shared hashes), with a 0/1 incidence
+  matrix product for hashes most sketches hold; no merge per pair
+- Rows can be put in neighbor-joining order so similar haplotypes sit next to
+  each other in the heatmap
+"""
+
+import argparse
+import gzip
+import io
+import sys
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+from kmers import MAX_K, kmer_codes, mix64
+
+K = 21
+SKETCH_SIZE = 1000
+MAX_HASH = np.uint64(0xffffffffffffffff)  # Padding of sketches with fewer hashes
+INCIDENCE_BYTES = 256 * 1024 * 1024  # Memory of one block of the incidence matrix
+DENSE_SHARE = 0.05  # Hashes held by more than this fraction of sketches go through the incidence product
+PAIR_BATCH = 1 << 24  # Sketch pairs expanded from the inverted index at a time
+NJ_BLOCK = 64  # Rows of the neighbor-joining Q matrix computed at a time
+
+
+def read_fasta(path):
+    """
+    Yield (name, sequence) of every record in a FASTA or FASTA.GZ file.
+
+    Args:
+        path: FASTA file, optionally gzipped
+
+    Yields:
+        tuple: (record name up to the first whitespace, sequence)
+    """
+    opener = gzip.open if str(path).endswith('.gz') else open
+    name, seq = None, []
+    with opener(path, 'rt') as f:
+        for line in f:
+            if line.startswith('>'):
+                if name is not None:
+                    yield name, ''.join(seq)
+                name, seq = line[1:].split()[0], []
+            else:
+                seq.append(line.strip())
+    if name is not None:
+        yield name, ''.join(seq)
+
+
+def sketch_sequence(seq, k=K, size=SKETCH_SIZE):
+    """
+    Bottom-k MinHash sketch of a sequence.
+
+    Args:
+        seq: DNA sequence; k-mers with non-ACGT bases are skipped
+        k: K-mer size (at most 31)
+        size: Number of hashes kept
+
+    Returns:
+        np.ndarray: The smallest distinct canonical k-mer hashes, sorted (uint64)
+    """
+    forward, reverse, _ = kmer_codes(seq, k)
+    hashes = mix64(np.minimum(forward, reverse))
+
+    # Only the smallest hashes need sorting; repeats can leave too few, then sort all
+    if len(hashes) > 2 * size:
+        smallest = np.unique(hashes[hashes <= np.partition(hashes, 2 * size)[2 * size]])
+        if len(smallest) >= size:
+            return smallest[:size]
+    return np.unique(hashes)[:size]
+
+
+def _sketch_record(args):
+    name, seq, k, size = args
+    return name, len(seq), sketch_sequence(seq, k, size)
+
+
+def sketch_fasta(fasta_files, k=K, size=SKETCH_SIZE, processes=None):
+    """
+    Sketch every record of the FASTA files in a process pool.
+
+    Returns:
+        dict: names, lengths, hashes (n x size, padded with MAX_HASH), counts, k, size
+    """
+    if not 1 <= k <= MAX_K:
+        raise ValueError(f"k must be between 1 and {MAX_K}")
+    records = ((name, seq, k, size) for path in fasta_files for name, seq in read_fasta(path))
+    names, lengths, sketches = [], [], []
+    with Pool(processes) as pool:
+        for name, length, sketch in pool.imap(_sketch_record, records, chunksize=16):
+            names.append(name)
+            lengths.append(length)
+            sketches.append(sketch)
+
+    hashes = np.full((len(sketches), size), MAX_HASH, dtype=np.uint64)
+    for row, sketch in zip(hashes, sketches):
+        row[:len(sketch)] = sketch
+    return {'names': np.array(names), 'lengths': np.array(lengths, dtype=np.int64),
+            'hashes': hashes, 'counts': np.array([len(s) for s in sketches], dtype=np.int64),
+            'k': k, 'size': size}
+
+
+def save_sketches(path, sketches):
+    np.savez(path, **sketches)
+
+
+def load_sketches(path):
+    with np.load(path) as data:
+        sketches = {key: data[key] for key in data.files}
+    sketches['k'], sketches['size'] = int(sketches['k']), int(sketches['size'])
+    return sketches
+
+
+def shared_hashes(hashes, counts):
+    """
+    Number of hashes every pair of sketches has in common (n x n).
+
+    Works from an inverted index (the sketches holding each hash), so the
+    cost follows the shared hashes rather than n x distinct hashes: a hash
+    held by s sketches adds its s(s-1)/2 pairs. Hashes held by more than
+    DENSE_SHARE of the sketches are counted with a 0/1 incidence matrix
+    product instead, which is cheaper per pair.
+    """
+    n = len(hashes)
+    shared = np.zeros((n, n), dtype=np.int64)
+    if not n:
+        return shared
+    rows = np.repeat(np.arange(n), counts)
+    values = np.concatenate([h[:c] for h, c in zip(hashes, counts)])
+    _, cols, sizes = np.unique(values, return_inverse=True, return_counts=True)
+    order = np.argsort(cols, kind='stable')  # Rows stay ascending within a hash
+    rows, cols = rows[order], cols[order]
+
+    dense = sizes[cols] > DENSE_SHARE * n
+    if dense.any():
+        _, dense_cols = np.unique(cols[dense], return_inverse=True)
+        shared += _incidence_product(n, rows[dense], dense_cols)
+    rows, cols = rows[~dense], cols[~dense]
+
+    # Pairs of every hash: each entry with the entries after it in the hash's group
+    group_ends = np.cumsum(np.bincount(cols, minlength=len(sizes)))
+    partners = group_ends[cols] - np.arange(len(cols)) - 1
+    done = np.cumsum(partners)
+    flat = shared.reshape(-1)
+    lo = 0
+    while lo < len(cols):
+        hi = max(lo + 1, int(np.searchsorted(done, done[lo] - partners[lo] + PAIR_BATCH, side='right')))
+        n_partners = partners[lo:hi]
+        starts = np.cumsum(n_partners) - n_partners
+        index = np.repeat(np.arange(lo, hi) + 1 - starts, n_partners) + np.arange(starts[-1] + n_partners[-1])
+        pairs, times = np.unique(np.repeat(rows[lo:hi], n_partners) * n + rows[index], return_counts=True)
+        flat[pairs] += times
+        lo = hi
+    shared += shared.T
+    shared[np.diag_indices(n)] = counts
+    return shared
+
+
+def _incidence_product(n, rows, cols):
+    """Shared hashes of all pairs from 0/1 incidence blocks (sketch x hash), upper triangle only"""
+    shared = np.zeros((n, n), dtype=np.float64)
+    block = max(1, INCIDENCE_BYTES // (4 * n))
+    bounds = np.searchsorted(cols, np.arange(0, cols.max() + 1 + block, block))
+    for b, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+        if lo == hi:
+            continue
+        incidence = np.zeros((n, block), dtype=np.float32)
+        incidence[rows[lo:hi], cols[lo:hi] - b * block] = 1
+        shared += incidence @ incidence.T
+    return np.triu(np.rint(shared).astype(np.int64), 1)
+
+
+def jaccard_matrix(sketches):
+    """
+    Estimated Jaccard similarity of all pairs of sketches.
+
+    For a pair the union is cut at the smaller of the two sketch maxima, as in
+    the bottom-k estimator; all hashes of the sketch with that maximum lie
+    below the cut, so its shared hashes are the whole intersection.
+    """
+    hashes, counts = sketches['hashes'], sketches['counts']
+    n = len(hashes)
+    shared = shared_hashes(hashes, counts)
+    maxes = np.array([h[c - 1] if c else np.uint64(0) for h, c in zip(hashes, counts)], dtype=np.uint64)
+
+    # below[i, j]: hashes of sketch j up to the maximum of sketch i
+    below = np.empty((n, n), dtype=np.int64)
+    for j in range(n):
+        below[:, j] = np.searchsorted(hashes[j, :counts[j]], maxes, side='right')
+
+    i_cut = maxes[:, None] <= maxes[None, :]
+    union = np.where(i_cut, counts[:, None] + below - shared, counts[None, :] + below.T - shared)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        jaccard = np.where(union > 0, shared / union, 0.0)
+    np.fill_diagonal(jaccard, np.where(counts > 0, 1.0, 0.0))
+    return jaccard
+
+
+def mash_distance(jaccard, k):
+    """Mash distance -1/k ln(2J / (1 + J)); 1 for pairs without shared hashes"""
+    with np.errstate(divide='ignore'):
+        dist = np.log((1 + jaccard) / (2 * jaccard)) / k
+    return np.clip(np.nan_to_num(dist, posinf=1.0), 0.0, 1.0)
+
+
+def neighbor_joining_order(dist):
+    """
+    Leaf order of the neighbor-joining tree of a distance matrix.
+
+    Q = (m - 2) d_ij - r_i - r_j is scanned in row blocks that fit in cache,
+    so every join reads the matrix once; row sums r are updated in place and
+    joined nodes are removed by moving the last row/column into their slot.
+    """
+    d = np.array(dist, dtype=np.float64)
+    groups = [[i] for i in range(len(d))]
+    r = d.sum(axis=1)
+    m = len(groups)
+    while m > 2:
+        best, i, j = np.inf, 0, 1
+        for lo in range(0, m, NJ_BLOCK):
+            hi = min(lo + NJ_BLOCK, m)
+            q = d[lo:hi, :m] * (m - 2)
+            q -= r[:m]
+            q[np.arange(hi - lo), np.arange(lo, hi)] = np.inf
+            cols = q.argmin(axis=1)
+            values = q[np.arange(hi - lo), cols] - r[lo:hi]
+            row = int(values.argmin())
+            if values[row] < best:
+                best, i, j = values[row], lo + row, int(cols[row])
+        i, j = min(i, j), max(i, j)
+
+        # The joined node replaces i; the last node moves into j
+        new = (d[i, :m] + d[j, :m] - d[i, j]) / 2
+        r[:m] += new - d[i, :m] - d[j, :m]
+        new[i] = new[j] = 0
+        r[i] = new.sum()
+        d[i, :m] = d[:m, i] = new
+        groups[i] = groups[i] + groups[j]
+        last = m - 1
+        if j != last:
+            d[j, :m] = d[last, :m]
+            d[:m, j] = d[:m, last]
+            d[j, j] = 0
+            r[j] = r[last]
+            groups[j] = groups[last]
+        del groups[last]
+        m -= 1
+    return [leaf for group in groups for leaf in group]
+
+
+def write_matrix(path, matrix, names, fmt):
+    """Write a labelled square matrix as TSV (np.savetxt is several times faster than DataFrame.to_csv)"""
+    buffer = io.StringIO()
+    np.savetxt(buffer, matrix, fmt=fmt, delimiter='\t')
+    with open(path, 'w') as f:
+        f.write('\t'.join(['', *names]) + '\n')
+        for name, line in zip(names, buffer.getvalue().splitlines()):
+            f.write(f"{name}\t{line}\n")
+
+
+def plot_heatmap(dist, names, output):
+    import matplotlib.pyplot as plt
+    n = len(names)
+    fig, ax = plt.subplots(figsize=(10, 9))
+    image = ax.imshow(dist, cmap='viridis_r', interpolation='nearest')
+    fig.colorbar(image, ax=ax, label="Mash distance")
+    if n <= 100:
+        ax.set_xticks(range(n), names, rotation=90, fontsize=5)
+        ax.set_yticks(range(n), names, fontsize=5)
+    ax.set_title(f"MinHash distances of {n} sequences")
+    plt.tight_layout()
+    plt.savefig(output, dpi=200)
+    plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="MinHash sketches and all-pairs Jaccard/Mash distance matrices of FASTA sequences"
+    )
+    parser.add_argument("inputs", nargs="+",
+                        help="FASTA/FASTA.GZ files, or one .npz of saved sketches")
+    parser.add_argument("-o", "--output-prefix", required=True,
+                        help="Writes <prefix>.sketch.npz, <prefix>.jaccard.tsv and <prefix>.mash.tsv")
+    parser.add_argument("-k", "--kmer", type=int, default=K, help=f"K-mer size, at most 31 (default {K})")
+    parser.add_argument("-s", "--sketch-size", type=int, default=SKETCH_SIZE,
+                        help=f"Hashes per sketch (default {SKETCH_SIZE})")
+    parser.add_argument("--processes", type=int, help="Sketching processes (default: all cores)")
+    parser.add_argument("--nj-order", action="store_true",
+                        help="Order the matrices by the neighbor-joining tree of the Mash distances")
+    parser.add_argument("--heatmap", action="store_true", help="Also write <prefix>.heatmap.png")
+    args = parser.parse_args()
+
+    if len(args.inputs) == 1 and args.inputs[0].endswith('.npz'):
+        sketches = load_sketches(args.inputs[0])
+    else:
+        sketches = sketch_fasta(args.inputs, args.kmer, args.sketch_size, args.processes)
+        save_sketches(f"{args.output_prefix}.sketch.npz", sketches)
+    names = sketches['names']
+    if len(names) < 2:
+        sys.exit("Error: Need at least 2 sequences to compare.")
+    print(f"Sketched {len(names)} sequences (k={sketches['k']}, {sketches['size']} hashes each)")
+
+    jaccard = jaccard_matrix(sketches)
+    dist = mash_distance(jaccard, sketches['k'])
+
+    order = neighbor_joining_order(dist) if args.nj_order else list(range(len(names)))
+    names = names[order]
+    jaccard = jaccard[np.ix_(order, order)]
+    dist = dist[np.ix_(order, order)]
+
+    write_matrix(f"{args.output_prefix}.jaccard.tsv", jaccard, names, '%.5f')
+    write_matrix(f"{args.output_prefix}.mash.tsv", dist, names, '%.6f')
+    if args.heatmap:
+        plot_heatmap(dist, names, f"{args.output_prefix}.heatmap.png")
+    print(f"Matrices written to {args.output_prefix}.jaccard.tsv and {args.output_prefix}.mash.tsv")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 import sys
-import gzip
 import json
 import os
 from pathlib import Path
@@ -11,6 +10,8 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 
+from fast_reader import iter_lines
+
 class GFAParser:
     def __init__(self, filepath):
         self.filepath = filepath
@@ -24,21 +25,19 @@ class GFAParser:
         print(f"  Done: {len(self.nodes):,} nodes, {len(self.edges):,} edges, {len(self.paths):,} paths")
     
     def parse(self):
-        opener = gzip.open if str(self.filepath).endswith('.gz') else open
-        mode = 'rt' if str(self.filepath).endswith('.gz') else 'r'
-        with opener(self.filepath, mode) as f:
-            for line in f:
-                line = line.strip()
-                if not line: continue
-                parts = line.split('\t')
-                if parts[0] == 'S':
-                    self.nodes[parts[1]] = len(parts[2]) if len(parts) > 2 else 0
-                    self.node_lengths.append(len(parts[2]) if len(parts) > 2 else 0)
-                elif parts[0] == 'L':
-                    self.edges.append({'from': parts[1], 'to': parts[3]})
-                elif parts[0] == 'P':
-                    self.paths[parts[1]] = parts[2].split(',')
-                    if '#' in parts[1]: self.samples.add(parts[1].split('#')[0])
+        # Plain or gzipped; read in large blocks (BGZF inflated in parallel) by fast_reader
+        for line in iter_lines(self.filepath):
+            line = line.strip()
+            if not line: continue
+            parts = line.split('\t')
+            if parts[0] == 'S':
+                self.nodes[parts[1]] = len(parts[2]) if len(parts) > 2 else 0
+                self.node_lengths.append(len(parts[2]) if len(parts) > 2 else 0)
+            elif parts[0] == 'L':
+                self.edges.append({'from': parts[1], 'to': parts[3]})
+            elif parts[0] == 'P':
+                self.paths[parts[1]] = parts[2].split(',')
+                if '#' in parts[1]: self.samples.add(parts[1].split('#')[0])
 
 class GraphAnalyzer:
     def __init__(self, gfa, name):
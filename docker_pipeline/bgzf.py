@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+BGZF (Blocked GNU Zip Format) Reader/Writer
+===========================================
+Pure-Python reader and writer for the block-compressed gzip variant
+samtools/htslib index (.fai/.gzi). Every block is an independent gzip member
+of at most 64 KiB uncompressed data, so:
+
+- BGZF files stay readable by gzip/zcat and Python's gzip module
+- BGZF files without the EOF marker block can be concatenated byte by byte;
+  appending EOF_BLOCK once at the end gives a valid BGZF file
+- With a .gzi block index (samtools format), any uncompressed byte range is
+  read by decompressing only the blocks that hold it
+- Blocks are independent, so the writer compresses them in parallel threads
+  (zlib releases the GIL) and records the .gzi entries as it goes
+- block_range maps an uncompressed range to the compressed bytes holding it,
+  so only those need to be fetched from a remote file
+
+Usage:
+    python bgzf.py <in.fa> <out.fa.gz> [--threads N]   (also writes <out.fa.gz>.gzi)
+"""
+
+import argparse
+import bisect
+import os
+import shutil
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+BLOCK_DATA_SIZE = 0xff00  # Uncompressed bytes per block, as bgzip uses
+# Fixed gzip header with the BGZF extra field; BSIZE (block size - 1) follows
+BLOCK_HEADER = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+EOF_BLOCK = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+HEADER_SIZE = 18  # BLOCK_HEADER + BSIZE
+QUEUE_BLOCKS_PER_THREAD = 4  # Blocks compressing or waiting per writer thread
+
+
+def compress_block(data, level=6):
+    """One complete BGZF block for up to BLOCK_DATA_SIZE bytes of data"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    bsize = len(BLOCK_HEADER) + 2 + len(deflated) + 8
+    return (BLOCK_HEADER + struct.pack('<H', bsize - 1) + deflated
+            + struct.pack('<II', zlib.crc32(data), len(data)))
+
+
+class BgzfWriter:
+    """Write bytes or text to a BGZF file (path or open binary file)
+
+    eof=False leaves out the EOF marker, for shards that are concatenated later.
+    With threads > 1 blocks are compressed by a thread pool, at most
+    threads * QUEUE_BLOCKS_PER_THREAD blocks in flight, and written in order.
+    The (compressed, uncompressed) offset of every block is kept in .blocks,
+    ready for write_gzi.
+    """
+
+    def __init__(self, path, level=6, eof=True, threads=1):
+        self.f = path if hasattr(path, 'write') else open(path, 'wb')
+        self.level = level
+        self.eof = eof
+        self.buf = bytearray()
+        self.compressed_bytes = 0
+        self.uncompressed_bytes = 0  # Of the blocks written so far
+        self.blocks = []
+        self.threads = threads
+        self.pool = ThreadPoolExecutor(threads) if threads > 1 else None
+        self.queue = deque()
+
+    def tell(self):
+        """Uncompressed offset of the next byte written"""
+        return self.uncompressed_bytes + sum(n for _, n in self.queue) + len(self.buf)
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.buf += data
+        while len(self.buf) >= BLOCK_DATA_SIZE:
+            self._write_block(bytes(self.buf[:BLOCK_DATA_SIZE]))
+            del self.buf[:BLOCK_DATA_SIZE]
+
+    def _write_block(self, data):
+        if self.pool is None:
+            self._emit(compress_block(data, self.level), len(data))
+            return
+        self.queue.append((self.pool.submit(compress_block, data, self.level), len(data)))
+        while len(self.queue) > self.threads * QUEUE_BLOCKS_PER_THREAD:
+            self._emit_next()
+
+    def _emit_next(self):
+        future, size = self.queue.popleft()
+        self._emit(future.result(), size)
+
+    def _emit(self, block, size):
+        self.blocks.append((self.compressed_bytes, self.uncompressed_bytes))
+        self.f.write(block)
+        self.compressed_bytes += len(block)
+        self.uncompressed_bytes += size
+
+    def close(self):
+        if self.buf:
+            self._write_block(bytes(self.buf))
+            self.buf = bytearray()
+        while self.queue:
+            self._emit_next()
+        if self.pool:
+            self.pool.shutdown()
+        if self.eof:
+            self.f.write(EOF_BLOCK)
+            self.compressed_bytes += len(EOF_BLOCK)
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_bgzf(path):
+    """True if the file starts with a BGZF block header"""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    return (len(header) == HEADER_SIZE and header[:4] == b'\x1f\x8b\x08\x04'
+            and header[12:14] == b'BC')
+
+
+def scan_blocks(path):
+    """Block index [(compressed offset, uncompressed offset)] read from the block headers and footers only"""
+    entries = []
+    uoffset = 0
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        coffset = 0
+        while coffset < size:
+            f.seek(coffset)
+            header = f.read(HEADER_SIZE)
+            if header[:4] != b'\x1f\x8b\x08\x04' or header[12:14] != b'BC':
+                raise ValueError(f"{path}: not a BGZF block at offset {coffset}")
+            bsize = struct.unpack('<H', header[16:18])[0] + 1
+            f.seek(coffset + bsize - 4)
+            (isize,) = struct.unpack('<I', f.read(4))
+            entries.append((coffset, uoffset))
+            coffset += bsize
+            uoffset += isize
+    return entries
+
+
+def read_gzi(path):
+    """Load a samtools .gzi index; the implicit first block (0, 0) is included"""
+    with open(path, 'rb') as f:
+        (n,) = struct.unpack('<Q', f.read(8))
+        data = struct.unpack(f'<{2 * n}Q', f.read(16 * n))
+    return [(0, 0)] + list(zip(data[::2], data[1::2]))
+
+
+def write_gzi(path, entries):
+    """Write a samtools .gzi index from [(compressed offset, uncompressed offset)]"""
+    entries = [e for e in entries if e != (0, 0)]
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<Q', len(entries)))
+        for coffset, uoffset in entries:
+            f.write(struct.pack('<QQ', coffset, uoffset))
+
+
+class BgzfReader:
+    """Random access to the uncompressed bytes of a BGZF file through its block index
+
+    path may also be an open binary file with seek/read (e.g. byte ranges
+    fetched over HTTP); check_crc verifies every block against its CRC32.
+    """
+
+    def __init__(self, path, gzi_entries, check_crc=False):
+        self.f = path if hasattr(path, 'read') else open(path, 'rb')
+        self.coffsets = [c for c, _ in gzi_entries]
+        self.uoffsets = [u for _, u in gzi_entries]
+        self.check_crc = check_crc
+
+    def read_block(self, coffset):
+        """Decompressed data of the block at a compressed offset, and the next block's offset"""
+        self.f.seek(coffset)
+        header = self.f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            return b'', coffset
+        bsize = struct.unpack('<H', header[16:18])[0] + 1
+        body = self.f.read(bsize - HEADER_SIZE)
+        data = zlib.decompress(body[:-8], -15)
+        if self.check_crc and struct.unpack('<II', body[-8:]) != (zlib.crc32(data), len(data)):
+            raise ValueError(f"BGZF block at offset {coffset} fails its CRC check")
+        return data, coffset + bsize
+
+    def block_range(self, start, length):
+        """Compressed byte range [first, end) of the blocks holding uncompressed bytes [start, start + length)
+
+        end is None when the range reaches the last indexed block, whose end
+        the index does not record.
+        """
+        first = bisect.bisect_right(self.uoffsets, start) - 1
+        last = bisect.bisect_right(self.uoffsets, start + length - 1) - 1
+        end = self.coffsets[last + 1] if last + 1 < len(self.coffsets) else None
+        return self.coffsets[first], end
+
+    def iter_range(self, start, length):
+        """Yield the uncompressed bytes [start, start + length) piece by piece"""
+        i = bisect.bisect_right(self.uoffsets, start) - 1
+        coffset, skip = self.coffsets[i], start - self.uoffsets[i]
+        while length > 0:
+            data, coffset = self.read_block(coffset)
+            if not data:
+                break
+            piece = data[skip:skip + length]
+            skip = 0
+            length -= len(piece)
+            yield piece
+
+    def read(self, start, length):
+        return b''.join(self.iter_range(start, length))
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def concatenate(shards, out, eof=True, buffer_size=8 * 1024 * 1024):
+    """Concatenate BGZF shards (written with eof=False) into an open binary file"""
+    for shard in shards:
+        with open(shard, 'rb') as f:
+            shutil.copyfileobj(f, out, buffer_size)
+    if eof:
+        out.write(EOF_BLOCK)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compress a file to BGZF")
+    parser.add_argument("input", help="Uncompressed input file")
+    parser.add_argument("output", help="BGZF output file")
+    parser.add_argument("--level", type=int, default=6, help="Compression level (default 6)")
+    parser.add_argument("--threads", type=int, default=1, help="Compression threads (default 1)")
+    args = parser.parse_args()
+
+    with open(args.input, 'rb') as fin, BgzfWriter(args.output, level=args.level, threads=args.threads) as out:
+        shutil.copyfileobj(fin, out)
+    write_gzi(f"{args.output}.gzi", out.blocks)
+
+
+if __name__ == "__main__":
+    main()
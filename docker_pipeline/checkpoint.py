@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Pipeline Checkpoints
+====================
+Per-unit completion markers so an interrupted or partially failed run can be
+resumed without repeating finished work. A unit is one subchunk in steps
+0, 1 and 3, and one GFA conversion or the final MEGAGRAPH build in step 2.
+
+Markers live in <OUTPUT_DIR>/checkpoints/<step>/<unit>.json and record:
+- status: "done" or "failed"
+- params: everything that determines the output (tool arguments, input checksums)
+- resources: threads and timeout used (not compared when resuming)
+- outputs: size and SHA-256 of every output file
+
+A unit counts as complete when its marker is "done", its params match the
+current run and every recorded output still exists with the recorded size.
+
+File checksums are kept in <OUTPUT_DIR>/checkpoints/hashes.json by size and
+mtime, so a file (e.g. a local GFA hashed when step 1 marked it done) is only
+read again when it changes.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def sha256_file(path):
+    """SHA-256 of a file, read in blocks"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class CheckpointStore:
+    """Read and write per-unit completion markers"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.hash_cache_path = self.root / "hashes.json"
+        self._hash_cache = None  # path -> [size, mtime_ns, sha256], loaded on first use
+        self._lock = threading.Lock()
+
+    def _hashes(self):
+        if self._hash_cache is None:
+            self._hash_cache = {}
+            if self.hash_cache_path.exists():
+                with open(self.hash_cache_path) as f:
+                    self._hash_cache = json.load(f)
+        return self._hash_cache
+
+    def checksum(self, path):
+        """SHA-256 of a file, hashed again only when its size or mtime changed"""
+        st = os.stat(path)
+        with self._lock:
+            cached = self._hashes().get(str(path))
+        if cached and cached[:2] == [st.st_size, st.st_mtime_ns]:
+            return cached[2]
+        digest = sha256_file(path)
+        with self._lock:
+            self._hashes()[str(path)] = [st.st_size, st.st_mtime_ns, digest]
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = self.hash_cache_path.with_suffix('.json.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(self._hash_cache, f)
+            os.replace(tmp, self.hash_cache_path)
+        return digest
+
+    def marker_path(self, step, unit):
+        return self.root / step / f"{unit}.json"
+
+    def load(self, step, unit):
+        path = self.marker_path(step, unit)
+        if not path.exists():
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _write(self, step, unit, marker):
+        path = self.marker_path(step, unit)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(marker, f, indent=2)
+        os.replace(tmp, path)  # Atomic, a crash never leaves a half-written marker
+
+    def mark_done(self, step, unit, params, outputs, resources=None):
+        """Record a completed unit with checksums of its outputs"""
+        self._write(step, unit, {
+            'status': 'done',
+            'params': params,
+            'resources': resources or {},
+            'outputs': {str(p): {'size': os.path.getsize(p), 'sha256': self.checksum(p)} for p in outputs},
+            'completed_at': datetime.now().isoformat(),
+        })
+
+    def mark_failed(self, step, unit, params, reason, resources=None):
+        """Record a failed unit so --retry-failed can find it"""
+        self._write(step, unit, {
+            'status': 'failed',
+            'params': params,
+            'resources': resources or {},
+            'reason': reason,
+            'failed_at': datetime.now().isoformat(),
+        })
+
+    def is_complete(self, step, unit, params, verify_checksums=False):
+        """True if the unit finished with the same params and its outputs are intact"""
+        marker = self.load(step, unit)
+        if not marker or marker['status'] != 'done' or marker['params'] != params:
+            return False
+        for path, info in marker['outputs'].items():
+            if not os.path.exists(path) or os.path.getsize(path) != info['size']:
+                return False
+            if verify_checksums and sha256_file(path) != info['sha256']:
+                return False
+        return True
+
+    def has_failed(self, step, unit):
+        marker = self.load(step, unit)
+        return marker is not None and marker['status'] == 'failed'
+
+    def failed_units(self, step):
+        """Names of all units of a step whose last attempt failed"""
+        step_dir = self.root / step
+        if not step_dir.is_dir():
+            return []
+        return sorted(p.stem for p in step_dir.glob("*.json") if self.has_failed(step, p.stem))
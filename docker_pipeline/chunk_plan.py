@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Chunk Plan
+==========
+Assignment of samples to chunk files, saved as chunk_plan.json next to the
+chunks so extraction and the pipeline agree on it.
+
+- Fixed plans cut the sorted sample names into groups of --chunk-size
+- Balanced plans bin-pack samples into K chunks by total bp (largest sample
+  first into the lightest chunk, at most ceil(samples / K) samples per chunk,
+  ties broken by haplotype count). PGGB runtime grows superlinearly with
+  input size, so the heaviest chunk sets the makespan
+- Per-sample bp comes from the assemblies' .fai indexes (built for bgzipped
+  inputs if missing); samples without one count as the mean sample
+
+Written by extract_chr19_ch22.py (--balance, --plan). In the pipeline, step 0
+checks the chunk files against it, steps 1 and 3 start the heaviest planned
+chunks first, and the summary reports its balance.
+
+Usage:
+    python chunk_plan.py <chunk_plan.json>
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from pathlib import Path
+
+from bgzf import is_bgzf
+from faidx import ensure_index, read_fai
+
+PLAN_NAME = "chunk_plan.json"
+
+
+def plan_path(directory):
+    return Path(directory) / PLAN_NAME
+
+
+def sample_sizes(inputs, contigs, regions=None, build_index=False):
+    """Per sample {'bp', 'haplotypes', 'contigs'} of a target
+
+    inputs are (sample, haplotype, FASTA path) of the assemblies; contigs are
+    PanSN names (sample#hap#contig). With regions, bp counts only the regions.
+    bp is None for samples none of whose assemblies has a .fai.
+    """
+    sizes = {}
+    for contig in contigs:
+        parts = contig.split('#')
+        if len(parts) < 2:
+            continue
+        size = sizes.setdefault(parts[0], {'bp': None, 'haplotypes': set(), 'contigs': 0})
+        size['haplotypes'].add(parts[1])
+        size['contigs'] += 1
+
+    for sample, _, fasta in inputs:
+        if sample not in sizes:
+            continue
+        fai_path = Path(f"{fasta}.fai")
+        if not fai_path.exists() and build_index and is_bgzf(fasta):
+            try:
+                fai_path, _ = ensure_index(fasta)
+            except (OSError, ValueError) as e:
+                print(f"Cannot index {fasta} ({e}); sizing without it", file=sys.stderr)
+        if not fai_path.exists():
+            continue
+        bp = 0
+        for name, (length, _, _, _) in read_fai(fai_path).items():
+            if name not in contigs:
+                continue
+            if regions is None:
+                bp += length
+            else:
+                bp += sum(max(0, min(end, length) - start) for start, end in regions.get(name, ()))
+        sizes[sample]['bp'] = (sizes[sample]['bp'] or 0) + bp
+
+    for size in sizes.values():
+        size['haplotypes'] = len(size['haplotypes'])
+    return sizes
+
+
+def _weights(sizes):
+    """bp per sample, the mean for samples of unknown size"""
+    known = [s['bp'] for s in sizes.values() if s['bp'] is not None]
+    mean = sum(known) / len(known) if known else 0
+    return {sample: s['bp'] if s['bp'] is not None else mean for sample, s in sizes.items()}
+
+
+def _chunk(samples, sizes, weights):
+    return {'samples': sorted(samples),
+            'bp': int(sum(weights[s] for s in samples)),
+            'haplotypes': sum(sizes[s]['haplotypes'] for s in samples)}
+
+
+def fixed_plan(sizes, chunk_size):
+    """Sorted sample names cut into groups of chunk_size"""
+    samples = sorted(sizes)
+    weights = _weights(sizes)
+    chunks = [_chunk(samples[i:i + chunk_size], sizes, weights) for i in range(0, len(samples), chunk_size)]
+    return {'method': 'fixed', 'chunks': chunks}
+
+
+def balanced_plan(sizes, num_chunks):
+    """Samples bin-packed into num_chunks chunks of balanced bp and haplotype counts"""
+    num_chunks = max(1, min(num_chunks, len(sizes)))
+    capacity = math.ceil(len(sizes) / num_chunks)
+    weights = _weights(sizes)
+    bins = [{'samples': [], 'bp': 0, 'haplotypes': 0} for _ in range(num_chunks)]
+    for sample in sorted(sizes, key=lambda s: (-weights[s], -sizes[s]['haplotypes'], s)):
+        target = min((b for b in bins if len(b['samples']) < capacity),
+                     key=lambda b: (b['bp'], b['haplotypes'], len(b['samples'])))
+        target['samples'].append(sample)
+        target['bp'] += weights[sample]
+        target['haplotypes'] += sizes[sample]['haplotypes']
+    chunks = [_chunk(b['samples'], sizes, weights) for b in bins if b['samples']]
+    return {'method': 'balanced', 'chunks': chunks}
+
+
+def load_plan(path):
+    """Map of target -> plan (empty if there is no plan file)"""
+    path = Path(path)
+    if path.is_dir():
+        path = plan_path(path)
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)['targets']
+
+
+def update_plan(directory, plans):
+    """Merge {target: plan} into the directory's plan file (atomic write)"""
+    targets = load_plan(directory)
+    targets.update(plans)
+    path = plan_path(directory)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump({'targets': targets}, f, indent=2)
+    os.replace(tmp, path)
+    return targets
+
+
+def chunk_bp(plan, number):
+    """Planned bp of chunk number (1-based), None if the plan has no such chunk"""
+    if plan and 1 <= number <= len(plan['chunks']):
+        return plan['chunks'][number - 1]['bp']
+    return None
+
+
+def imbalance(plan):
+    """Heaviest chunk bp over mean chunk bp (1.0 is perfectly balanced)"""
+    bps = [c['bp'] for c in plan['chunks']]
+    mean = sum(bps) / len(bps) if bps else 0
+    return max(bps) / mean if mean else 1.0
+
+
+def format_plan(name, plan):
+    r = [f"Target {name}: {len(plan['chunks'])} {plan['method']} chunks, "
+         f"heaviest/mean bp {imbalance(plan):.2f}"]
+    for idx, c in enumerate(plan['chunks'], start=1):
+        r.append(f"  chunk{idx}: {len(c['samples']):>4d} samples {c['haplotypes']:>4d} haplotypes "
+                 f"{c['bp']:>15,} bp")
+    return "\n".join(r)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a chunk plan")
+    parser.add_argument("plan", help="chunk_plan.json or the directory holding it")
+    args = parser.parse_args()
+
+    plans = load_plan(args.plan)
+    if not plans:
+        print(f"No chunk plan in {args.plan}", file=sys.stderr)
+        sys.exit(1)
+    for name, plan in plans.items():
+        print(format_plan(name, plan))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Tool Executors
+==============
+Decide how a tool command (pggb, vg, ...) is launched. Each executor turns a
+command that uses host paths into a shell command for run_command, so
+logging, timeouts and telemetry stay in one place.
+
+Backends:
+- docker: one `docker run --rm` per command (original behavior)
+- pool:   a small pool of long-running containers per image, commands are
+          sent with `docker exec` (no per-command container startup); the
+          images need coreutils `timeout`, which telemetry.run_measured
+          puts in front of commands that have a timeout
+- local:  tool binaries on PATH, commands run unchanged
+- fake:   records commands and runs a stand-in shell command (offline tests)
+
+Volumes are mounted at the same path inside containers, so commands can use
+host paths directly and shell redirection (`> out.gfa`) happens on the host.
+"""
+
+import itertools
+import shlex
+import subprocess
+import threading
+import uuid
+
+VG_IMAGE = "quay.io/vgteam/vg:v1.71.0"
+PGGB_IMAGE = "ghcr.io/pangenome/pggb:latest"
+
+
+class Executor:
+    """Base class: wrap a tool command for the chosen backend"""
+
+    def wrap(self, image, cmd, volumes=()):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LocalExecutor(Executor):
+    """Run tool binaries installed on the host"""
+
+    def wrap(self, image, cmd, volumes=()):
+        return cmd
+
+
+class DockerRunExecutor(Executor):
+    """Start a fresh container for every command"""
+
+    def wrap(self, image, cmd, volumes=()):
+        mounts = " ".join(f"-v {shlex.quote(str(v))}:{shlex.quote(str(v))}" for v in sorted(set(map(str, volumes))))
+        return f"docker run --rm {mounts} --entrypoint sh {image} -c {shlex.quote(cmd)}"
+
+
+class DockerPoolExecutor(Executor):
+    """Keep long-running containers per image and dispatch commands with docker exec"""
+
+    def __init__(self, volumes, pool_size=2, name_prefix="pangenome_pool"):
+        self.volumes = sorted(set(map(str, volumes)))
+        self.pool_size = pool_size
+        self.name_prefix = f"{name_prefix}_{uuid.uuid4().hex[:8]}"
+        self.containers = {}  # image -> list of container names
+        self._cycles = {}     # image -> round-robin iterator
+        self._lock = threading.Lock()
+
+    def _start(self, image, index):
+        name = f"{self.name_prefix}_{image.split('/')[-1].split(':')[0]}_{index}"
+        mounts = []
+        for v in self.volumes:
+            mounts += ["-v", f"{v}:{v}"]
+        subprocess.run(
+            ["docker", "run", "-d", "--rm", "--name", name, *mounts,
+             "--entrypoint", "sleep", image, "infinity"],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        return name
+
+    def _container(self, image):
+        with self._lock:
+            if image not in self.containers:
+                self.containers[image] = [self._start(image, i) for i in range(self.pool_size)]
+                self._cycles[image] = itertools.cycle(self.containers[image])
+            return next(self._cycles[image])
+
+    def wrap(self, image, cmd, volumes=()):
+        missing = [v for v in map(str, volumes)
+                   if not any(v == root or v.startswith(root.rstrip('/') + '/') for root in self.volumes)]
+        if missing:
+            raise ValueError(f"Paths not mounted in pool containers: {missing}")
+        return f"docker exec {self._container(image)} sh -c {shlex.quote(cmd)}"
+
+    def close(self):
+        with self._lock:
+            names = [n for names in self.containers.values() for n in names]
+            self.containers.clear()
+            self._cycles.clear()
+        if names:
+            subprocess.run(["docker", "rm", "-f", *names],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class FakeExecutor(Executor):
+    """Record commands and substitute a stand-in shell command
+
+    handler(image, cmd) returns the shell command to run instead (default: `true`),
+    e.g. one that writes a small GFA where the real tool would.
+    """
+
+    def __init__(self, handler=None):
+        self.handler = handler or (lambda image, cmd: "true")
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def wrap(self, image, cmd, volumes=()):
+        with self._lock:
+            self.calls.append((image, cmd, tuple(map(str, volumes))))
+        return self.handler(image, cmd)
+
+
+def make_executor(backend, volumes=(), pool_size=2):
+    """Create an executor by backend name"""
+    if backend == "docker":
+        return DockerRunExecutor()
+    if backend == "pool":
+        return DockerPoolExecutor(volumes, pool_size=pool_size)
+    if backend == "local":
+        return LocalExecutor()
+    if backend == "fake":
+        return FakeExecutor()
+    raise ValueError(f"Unknown executor backend: {backend}")
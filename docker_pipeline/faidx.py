@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Indexed FASTA Access
+====================
+Reads single contigs or regions out of bgzipped FASTA files through their
+samtools indexes (.fai for contig offsets, .gzi for BGZF blocks),
+decompressing only the blocks that hold them.
+
+- Missing or outdated indexes are built once and cached next to the FASTA:
+  with `samtools faidx` if it is installed, otherwise in Python
+- Writers that know their record offsets (BgzfWriter.tell) write the .fai
+  directly with fai_entry/write_fai, skipping the extra indexing pass
+- Plain gzip files cannot be indexed; callers fall back to a streaming scan
+
+Usage:
+    python faidx.py <assembly.fa.gz> [contig ...]
+"""
+
+import argparse
+import gzip
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+from bgzf import BgzfReader, is_bgzf, read_gzi, scan_blocks, write_gzi
+
+
+def read_fai(path):
+    """Contig name -> (length, offset, line bases, line width), in file order"""
+    index = {}
+    with open(path) as f:
+        for line in f:
+            name, length, offset, linebases, linewidth = line.rstrip('\n').split('\t')[:5]
+            index[name] = (int(length), int(offset), int(linebases), int(linewidth))
+    return index
+
+
+def build_fai(fasta_path, fai_path):
+    """Build a .fai by scanning the (decompressed) FASTA once"""
+    entries = []
+    offset = 0
+    current = None  # [name, length, offset, linebases, linewidth]
+    opener = gzip.open if str(fasta_path).endswith('.gz') else open
+    with opener(fasta_path, 'rb') as f:
+        for line in f:
+            if line.startswith(b'>'):
+                if current:
+                    entries.append(current)
+                current = [line[1:].split()[0].decode(), 0, offset + len(line), 0, 0]
+            elif current is not None:
+                bases = len(line.rstrip(b'\r\n'))
+                if current[3] == 0:
+                    current[3], current[4] = bases, len(line)
+                current[1] += bases
+            offset += len(line)
+    if current:
+        entries.append(current)
+    write_fai(fai_path, entries)
+
+
+def fai_entry(name, offset, length, line=None):
+    """.fai entry of a record whose sequence starts at an uncompressed offset
+
+    line is the record's first sequence line with its line break; without it
+    the sequence is taken to be written as one line.
+    """
+    if line is None:
+        linebases, linewidth = length, length + 1
+    else:
+        linebases, linewidth = len(line.rstrip(b'\r\n')), len(line)
+    return [name.split()[0], length, offset, linebases, linewidth]
+
+
+def write_fai(fai_path, entries):
+    """Write [name, length, offset, line bases, line width] entries as a .fai"""
+    with open(fai_path, 'w') as out:
+        for entry in entries:
+            out.write('\t'.join(str(x) for x in entry) + '\n')
+
+
+def ensure_index(fasta_path):
+    """Make sure fasta_path has a current .fai and .gzi; return their paths"""
+    fasta_path = Path(fasta_path)
+    fai_path = Path(f"{fasta_path}.fai")
+    gzi_path = Path(f"{fasta_path}.gzi")
+    mtime = fasta_path.stat().st_mtime
+    if all(p.exists() and p.stat().st_mtime >= mtime for p in (fai_path, gzi_path)):
+        return fai_path, gzi_path
+
+    samtools = shutil.which('samtools')
+    if samtools:
+        result = subprocess.run([samtools, 'faidx', str(fasta_path)], capture_output=True, text=True)
+        if result.returncode == 0 and fai_path.exists() and gzi_path.exists():
+            return fai_path, gzi_path
+        print(f"samtools faidx failed on {fasta_path}: {result.stderr.strip()}", file=sys.stderr)
+
+    write_gzi(gzi_path, scan_blocks(fasta_path))
+    build_fai(fasta_path, fai_path)
+    return fai_path, gzi_path
+
+
+class IndexedFasta:
+    """Contig-level random access to a bgzipped FASTA"""
+
+    def __init__(self, fasta_path):
+        if not is_bgzf(fasta_path):
+            raise ValueError(f"{fasta_path} is not BGZF-compressed")
+        fai_path, gzi_path = ensure_index(fasta_path)
+        self.index = read_fai(fai_path)
+        self.reader = BgzfReader(fasta_path, read_gzi(gzi_path))
+
+    @property
+    def names(self):
+        return list(self.index)
+
+    def _byte_offset(self, name, pos):
+        """Uncompressed file offset of a 0-based position in a contig"""
+        _, offset, linebases, linewidth = self.index[name]
+        full_lines, rest = divmod(pos, linebases)
+        return offset + full_lines * linewidth + rest
+
+    def iter_sequence(self, name, start=0, end=None):
+        """Yield the contig's sequence [start, end) (without line breaks) block by block, as text"""
+        length = self.index[name][0]
+        end = length if end is None else min(end, length)
+        if start >= end:
+            return
+        first = self._byte_offset(name, start)
+        nbytes = self._byte_offset(name, end - 1) + 1 - first
+        for piece in self.reader.iter_range(first, nbytes):
+            yield piece.replace(b'\n', b'').replace(b'\r', b'').decode()
+
+    def fetch(self, name, start=0, end=None):
+        return ''.join(self.iter_sequence(name, start, end))
+
+    def close(self):
+        self.reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index a bgzipped FASTA and print contigs from it")
+    parser.add_argument("fasta", help="BGZF-compressed FASTA (indexes are built if missing)")
+    parser.add_argument("contigs", nargs="*", help="Contigs to print (default: list contigs)")
+    args = parser.parse_args()
+
+    with IndexedFasta(args.fasta) as fa:
+        if not args.contigs:
+            for name, (length, _, _, _) in fa.index.items():
+                print(f"{name}\t{length}")
+        for name in args.contigs:
+            print(f">{name}")
+            print(fa.fetch(name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Fast FASTA/GFA Reader
+=====================
+Shared reader for the gzipped FASTA and GFA files the pipeline ingests,
+replacing gzip.open(..., 'rt') with per-line strip():
+
+- BGZF files are inflated block-parallel in a thread pool (zlib releases the
+  GIL), keeping the output in file order
+- Plain gzip goes through python-isal if installed, else a piped `pigz -dc`,
+  else the gzip module
+- Records are parsed out of large byte chunks (CHUNK_SIZE) with find/split
+  instead of one Python iteration per line
+- Compressed data that is not in a file (an HTTP response, see
+  download_hprc.stream_url) is inflated on the fly with iter_gzip_stream
+
+Usage:
+    python fast_reader.py <file.fa.gz|file.gfa[.gz]> [--threads N]
+"""
+
+import argparse
+import gzip
+import os
+import shutil
+import struct
+import subprocess
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from bgzf import HEADER_SIZE, is_bgzf
+
+try:
+    from isal import igzip, isal_zlib
+except ImportError:
+    igzip = isal_zlib = None
+
+CHUNK_SIZE = 16 * 1024 * 1024  # Bytes read/parsed per step
+BATCH_BLOCKS = 64  # BGZF blocks (~4 MB uncompressed) per thread task
+DEFAULT_THREADS = min(8, os.cpu_count() or 1)
+SEQ_WHITESPACE = b' \t\r\n'
+
+
+def _inflate_blocks(blocks):
+    return b''.join(zlib.decompress(block[HEADER_SIZE:-8], -15) for block in blocks)
+
+
+def _iter_bgzf_batches(f, chunk_size):
+    """Split a BGZF stream into batches of whole compressed blocks, using only the block headers"""
+    buf = b''
+    while True:
+        data = f.read(chunk_size)
+        if data:
+            buf = buf + data if buf else data
+        pos, blocks = 0, []
+        while len(buf) - pos >= HEADER_SIZE:
+            bsize = struct.unpack_from('<H', buf, pos + 16)[0] + 1
+            if len(buf) - pos < bsize:
+                break
+            blocks.append(buf[pos:pos + bsize])
+            pos += bsize
+            if len(blocks) == BATCH_BLOCKS:
+                yield blocks
+                blocks = []
+        if blocks:
+            yield blocks
+        buf = buf[pos:]
+        if not data:
+            if buf:
+                raise ValueError("Truncated BGZF block at end of file")
+            return
+
+
+def iter_bgzf_chunks(path, threads=DEFAULT_THREADS, chunk_size=CHUNK_SIZE):
+    """Decompressed data of a BGZF file in order, inflated by a thread pool"""
+    with open(path, 'rb') as f, ThreadPoolExecutor(threads) as pool:
+        pending = []
+        for blocks in _iter_bgzf_batches(f, chunk_size):
+            pending.append(pool.submit(_inflate_blocks, blocks))
+            if len(pending) >= threads * 2:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def iter_chunks(path, threads=DEFAULT_THREADS, chunk_size=CHUNK_SIZE):
+    """Decompressed content of a (BGZF, gzip or plain) file in large byte chunks"""
+    path = str(path)
+    if not path.endswith('.gz'):
+        with open(path, 'rb') as f:
+            while data := f.read(chunk_size):
+                yield data
+        return
+    if threads > 1 and is_bgzf(path):
+        yield from iter_bgzf_chunks(path, threads, chunk_size)
+        return
+
+    pigz = shutil.which('pigz')
+    if igzip is not None:
+        f, proc = igzip.open(path, 'rb'), None
+    elif pigz:
+        proc = subprocess.Popen([pigz, '-dc', path], stdout=subprocess.PIPE)
+        f = proc.stdout
+    else:
+        f, proc = gzip.open(path, 'rb'), None
+    try:
+        while data := f.read(chunk_size):
+            yield data
+    finally:
+        f.close()
+        if proc:
+            if proc.wait() not in (0, -13):  # -13: stopped early (SIGPIPE)
+                raise OSError(f"pigz -dc {path} failed with exit code {proc.returncode}")
+
+
+def iter_gzip_stream(compressed, chunk_size=CHUNK_SIZE):
+    """Decompressed content of a gzip/BGZF stream, given as an iterable of compressed byte blocks
+
+    Concatenated members (BGZF blocks, multi-member gzip) are inflated one
+    after another; output comes in chunks of about chunk_size bytes.
+    """
+    zlib_module = isal_zlib or zlib
+    inflater = zlib_module.decompressobj(31)
+    fed = False  # Input went into the current member
+    out, size = [], 0
+    for data in compressed:
+        while data:
+            piece = inflater.decompress(data)
+            fed = True
+            if piece:
+                out.append(piece)
+                size += len(piece)
+            if inflater.eof:
+                data = inflater.unused_data
+                inflater = zlib_module.decompressobj(31)
+                fed = False
+            else:
+                data = b''
+        if size >= chunk_size:
+            yield b''.join(out)
+            out, size = [], 0
+    if fed:
+        raise ValueError("Truncated gzip stream")
+    if out:
+        yield b''.join(out)
+
+
+def _source_chunks(source, threads):
+    """Decompressed chunks of a path, or the source itself if it already is an iterable of chunks"""
+    if isinstance(source, (str, os.PathLike)):
+        return iter_chunks(source, threads)
+    return source
+
+
+def iter_lines(path, threads=DEFAULT_THREADS):
+    """Lines of a text file, without line endings"""
+    rest = b''
+    for data in iter_chunks(path, threads):
+        cut = data.rfind(b'\n') + 1
+        if not cut:
+            rest += data
+            continue
+        text = (rest + data[:cut]).decode()
+        rest = data[cut:]
+        for line in text.split('\n')[:-1]:
+            yield line.rstrip('\r')
+    if rest:
+        yield rest.decode().rstrip('\r')
+
+
+def _split_record(record):
+    nl = record.find(b'\n')
+    if nl < 0:
+        return record[1:].rstrip(b'\r').decode(), b''
+    return record[1:nl].rstrip(b'\r').decode(), record[nl + 1:]
+
+
+def iter_fasta_records(path, threads=DEFAULT_THREADS):
+    """(header without '>', sequence bytes as written, line breaks included) of each record"""
+    parts = []  # Pieces of the current record, from its '>'
+    for data in iter_chunks(path, threads):
+        start = 0
+        if data.startswith(b'>') and parts and parts[-1].endswith(b'\n'):
+            record = b''.join(parts)
+            parts = []
+            if record.startswith(b'>'):
+                yield _split_record(record)
+        while (nxt := data.find(b'\n>', start)) >= 0:
+            parts.append(data[start:nxt + 1])
+            record = b''.join(parts)
+            parts = []
+            if record.startswith(b'>'):
+                yield _split_record(record)
+            start = nxt + 1
+        parts.append(data[start:])
+    record = b''.join(parts)
+    if record.startswith(b'>'):
+        yield _split_record(record)
+
+
+def iter_fasta_pieces(source, threads=DEFAULT_THREADS):
+    """Stream (header without '>', sequence piece without line breaks) for large records
+
+    source is a path or an iterable of decompressed byte chunks (e.g. from
+    iter_gzip_stream). The header string is the same object for every piece of
+    a record; records without sequence yield nothing.
+    """
+    header = None
+    line_start = True
+    rest = b''  # Header line cut by the chunk boundary
+    for data in _source_chunks(source, threads):
+        if rest:
+            data, rest = rest + data, b''
+        pos, end = 0, len(data)
+        while pos < end:
+            if line_start and data[pos] == 0x3e:  # '>'
+                nl = data.find(b'\n', pos)
+                if nl < 0:
+                    rest = data[pos:]
+                    break
+                header = data[pos + 1:nl].rstrip(b'\r').decode()
+                pos = nl + 1
+                continue
+            nxt = data.find(b'\n>', pos)
+            stop = end if nxt < 0 else nxt + 1
+            piece = data[pos:stop].translate(None, SEQ_WHITESPACE)
+            if piece and header is not None:
+                yield header, piece
+            line_start = data[stop - 1] == 0x0a
+            pos = stop
+    if rest:
+        header = rest[1:].rstrip(b'\r\n').decode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure ingest throughput of the fast FASTA/GFA reader")
+    parser.add_argument("path", help="FASTA or GFA file, optionally gzip/BGZF-compressed")
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS,
+                        help=f"Inflate threads for BGZF input (default {DEFAULT_THREADS})")
+    args = parser.parse_args()
+
+    start = time.time()
+    nbytes = sum(len(d) for d in iter_chunks(args.path, args.threads))
+    inflate = time.time() - start
+
+    start = time.time()
+    name = str(args.path).removesuffix('.gz')
+    if name.endswith(('.fa', '.fasta', '.fna')):
+        records = bp = 0
+        for _, seq in iter_fasta_records(args.path, args.threads):
+            records += 1
+            bp += len(seq) - seq.count(b'\n')
+        print(f"{records:,} records, {bp:,} bp")
+    else:
+        print(f"{sum(1 for _ in iter_lines(args.path, args.threads)):,} lines")
+    parse = time.time() - start
+    print(f"{nbytes / 1e6:,.1f} MB: decompress {nbytes / 1e6 / inflate:,.0f} MB/s, "
+          f"decompress + parse {nbytes / 1e6 / parse:,.0f} MB/s")
+
+if __name__ == "__main__":
+    main()
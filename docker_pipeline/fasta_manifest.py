@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+FASTA Chunk Manifest
+====================
+Per-chunk facts collected while the chunk files are written, so later steps
+never have to decompress them again just to count:
+
+- sequences, samples and haplotypes (from PanSN headers sample#hap#contig)
+- total bp and N bp
+- sha256 and size of the compressed file as written
+
+Written as manifest.json next to the chunks by extract_chr19_ch22.py and by
+step 0 of the pipeline; entries whose file size no longer matches are
+treated as stale.
+
+Usage:
+    python fasta_manifest.py <chunk_dir>
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+MANIFEST_NAME = "manifest.json"
+
+
+class HashingWriter:
+    """Binary file wrapper that hashes everything written through it"""
+
+    def __init__(self, path):
+        self.f = open(path, 'wb')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class ChunkStats:
+    """Running statistics of the records written to one chunk"""
+
+    def __init__(self):
+        self.sequences = 0
+        self.total_bp = 0
+        self.n_bp = 0
+        self.samples = {}  # sample -> {haplotype: sequences}
+
+    def add(self, header, seq):
+        """Count one record; header with or without '>', seq may contain line breaks"""
+        self.start(header)
+        self.extend(seq)
+
+    def start(self, header):
+        """Count a new record from its header (for records written line by line)"""
+        name = header.lstrip('>').split()[0] if header.strip() else ''
+        self.sequences += 1
+        parts = name.split('#')
+        if len(parts) >= 3:
+            haplotypes = self.samples.setdefault(parts[0], {})
+            haplotypes[parts[1]] = haplotypes.get(parts[1], 0) + 1
+
+    def extend(self, seq):
+        """Count sequence of the current record"""
+        self.total_bp += len(seq) - seq.count('\n')
+        self.n_bp += seq.count('N') + seq.count('n')
+
+    def merge(self, other):
+        """Add the counts of another ChunkStats (e.g. of a shard of the same chunk)"""
+        self.sequences += other.sequences
+        self.total_bp += other.total_bp
+        self.n_bp += other.n_bp
+        for sample, haplotypes in other.samples.items():
+            mine = self.samples.setdefault(sample, {})
+            for hap, n in haplotypes.items():
+                mine[hap] = mine.get(hap, 0) + n
+
+    def entry(self, sha256=None, size=None):
+        return {
+            'sequences': self.sequences,
+            'samples': len(self.samples),
+            'haplotypes': sum(len(h) for h in self.samples.values()),
+            'total_bp': self.total_bp,
+            'n_bp': self.n_bp,
+            'n_fraction': self.n_bp / self.total_bp if self.total_bp else 0,
+            'sha256': sha256,
+            'size': size,
+            'per_sample': self.samples,
+        }
+
+
+def manifest_path(directory):
+    return Path(directory) / MANIFEST_NAME
+
+
+def load_manifest(directory):
+    """Map of file name -> entry (empty if there is no manifest)"""
+    path = manifest_path(directory)
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)['files']
+
+
+def update_manifest(directory, entries):
+    """Merge {file name: entry} into the directory's manifest (atomic write)"""
+    files = load_manifest(directory)
+    files.update(entries)
+    path = manifest_path(directory)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump({'files': files}, f, indent=2)
+    os.replace(tmp, path)
+    return files
+
+
+def lookup(fasta_path, manifest=None):
+    """Manifest entry of a chunk file, or None if missing or stale"""
+    fasta_path = Path(fasta_path)
+    if manifest is None:
+        manifest = load_manifest(fasta_path.parent)
+    entry = manifest.get(fasta_path.name)
+    if entry is None or not fasta_path.exists():
+        return None
+    if entry.get('size') is not None and entry['size'] != fasta_path.stat().st_size:
+        return None
+    return entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the chunk manifest of a directory")
+    parser.add_argument("directory", help="Directory with chunk FASTA files and manifest.json")
+    args = parser.parse_args()
+
+    files = load_manifest(args.directory)
+    if not files:
+        print(f"No manifest in {args.directory}", file=sys.stderr)
+        sys.exit(1)
+    print(f"{'File':<40s} {'Seqs':>6s} {'Samples':>7s} {'Haps':>5s} {'Total (bp)':>15s} {'N (%)':>7s}")
+    for name, e in sorted(files.items()):
+        stale = "" if lookup(Path(args.directory) / name, files) else "  (stale)"
+        print(f"{name:<40s} {e['sequences']:>6d} {e['samples']:>7d} {e['haplotypes']:>5d} "
+              f"{e['total_bp']:>15,} {100 * e['n_fraction']:>7.2f}{stale}")
+
+
+if __name__ == "__main__":
+    main()
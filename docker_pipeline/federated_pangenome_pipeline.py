@@ -3,22 +3,46 @@
 Federated Pangenome Graph Construction Pipeline
 ================================================
 Dockerized version - runs PGGB and vg via Docker containers
+(a pool of long-running tool containers by default, see executor.py)
 Logs saved to /mnt/shared_vol/graphs/
 
 Steps:
-- Step 0: Create subchunks (20 individuals each)
-- Step 1: Build local graphs with PGGB
+- Step 0: Create subchunks (20 individuals each) as BGZF with .fai/.gzi
+  indexes written alongside + manifest.json with their sequence counts, bp
+  and checksums (see fasta_manifest.py); chunks are checked against the
+  chunk_plan.json of the extraction (see chunk_plan.py)
+- Step 1: Build local graphs with PGGB, heaviest planned chunks first
 - Step 2: Aggregate graphs with vg combine → MEGAGRAPH
+  (--dedup: collapse identical segments through sequence_store.py instead)
 - Step 3: Feedback with minigraph → improved local graphs
+
+Per-task wall/CPU time, peak memory and I/O sizes are appended to
+/mnt/shared_vol/graphs/run_ledger.jsonl (summarize with telemetry.py)
 """
 
+import argparse
 import subprocess
 import os
+import re
 import sys
+import json
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
-import gzip
+
+from analyze_gfa import GFAParser, GraphAnalyzer
+import telemetry
+from executor import PGGB_IMAGE, VG_IMAGE, make_executor
+from checkpoint import CheckpointStore
+from megagraph import Megagraph, megagraph_files
+from sequence_store import format_site_report
+from fasta_manifest import ChunkStats, HashingWriter, load_manifest, lookup, update_manifest
+from fast_reader import iter_fasta_records
+from bgzf import BgzfWriter, write_gzi
+from faidx import fai_entry, write_fai
+from chunk_plan import chunk_bp, format_plan, imbalance, load_plan
 
 # Configuration
 INPUT_DIR = "/mnt/shared_vol/hprc_mini_fasta"
@@ -26,9 +50,17 @@ SUBCHUNK_DIR = "/mnt/shared_vol/hprc_mini_fasta/subchunks"
 OUTPUT_DIR = "/mnt/shared_vol/graphs"
 NUM_INDIVIDUALS = 20  # Number of individuals per subchunk
 NUM_THREADS = 8
+PGGB_ARGS = "-p 90 -s 10000"
+PGGB_TIMEOUT = 7200  # 2 hour timeout per chunk
+MINIGRAPH_THREADS = 4  # Threads per minigraph job; NUM_THREADS is the total budget
+EXECUTOR_BACKEND = os.environ.get("PIPELINE_EXECUTOR", "pool")  # pool, docker, local or fake
+EXECUTOR_POOL_SIZE = 2  # Long-running containers per tool image (pool backend)
 
-# Log file in shared volume
-LOG_FILE = f"{OUTPUT_DIR}/pipeline_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+# Log file and per-task resource ledger in shared volume
+RUN_ID = datetime.now().strftime('%Y%m%d_%H%M%S')
+LOG_FILE = f"{OUTPUT_DIR}/pipeline_{RUN_ID}.log"
+LEDGER_FILE = f"{OUTPUT_DIR}/run_ledger.jsonl"
+CHECKPOINT_DIR = f"{OUTPUT_DIR}/checkpoints"
 
 # Setup logging
 logging.basicConfig(
@@ -40,31 +72,77 @@ logging.basicConfig(
     ]
 )
 logger = logging.getLogger(__name__)
+ledger = telemetry.RunLedger(LEDGER_FILE, RUN_ID)
+executor = None  # Created in main() from EXECUTOR_BACKEND
+checkpoints = CheckpointStore(CHECKPOINT_DIR)
+# Resume options, replaced by the command line arguments in main()
+options = argparse.Namespace(resume=False, retry_failed=False, retry_timeout=None,
+                             retry_threads=None, verify_checksums=False, incremental=False, dedup=False)
 
-def run_command(cmd, description, timeout=None):
-    """Run a shell command and log output"""
+def run_command(cmd, description, timeout=None, inputs=(), outputs=()):
+    """Run a shell command, stream its output to the log and record its resource usage in the run ledger"""
     logger.info(f"Starting: {description}")
     logger.info(f"Command: {cmd[:500]}..." if len(cmd) > 500 else f"Command: {cmd}")
-    
-    try:
-        result = subprocess.run(
-            cmd, shell=True, check=True,
-            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-            text=True, timeout=timeout
-        )
-        logger.info(f"Completed: {description}")
-        if result.stdout:
-            for line in result.stdout.split('\n')[-20:]:  # Last 20 lines
-                logger.debug(line)
-        return True
-    except subprocess.TimeoutExpired:
+    tool = telemetry.guess_tool(cmd)
+    
+    def log_line(line):
+        line = line.rstrip()
+        if line:
+            logger.info(f"  [{tool}] {line}")
+    
+    def log_stage(event):
+        logger.info(f"Stage: {description}: {event['stage']} (at {event['offset_s']:.1f}s)")
+    
+    status, exit_code, stdout, usage = telemetry.run_measured(cmd, timeout=timeout,
+                                                              on_line=log_line, on_stage=log_stage)
+    wall_s = usage['wall_s']
+    
+    ledger.record(
+        description=description,
+        tool=tool,
+        status=status,
+        success=status == "success",
+        exit_code=exit_code,
+        input_bytes=telemetry.path_bytes(inputs),
+        output_bytes=telemetry.path_bytes(outputs),
+        **usage
+    )
+    
+    if status == "timeout":
         logger.error(f"Timeout: {description}")
         return False
-    except subprocess.CalledProcessError as e:
+    if status == "failed":
         logger.error(f"Failed: {description}")
-        if e.stdout:
-            logger.error(f"Error output: {e.stdout[-1000:]}")  # Last 1000 chars
+        if stdout:
+            logger.error(f"Error output: {stdout[-1000:]}")  # Last 1000 chars
         return False
+    
+    stages = ", ".join(f"{e['stage']} {e['duration_s']:.1f}s" for e in usage.get('stages', []))
+    logger.info(f"Completed: {description} ({wall_s:.1f}s{'; ' + stages if stages else ''})")
+    return True
+
+def should_run(step, unit, params):
+    """Decide whether a unit needs to run (always, unless resuming and already complete)"""
+    if not (options.resume or options.retry_failed):
+        return True
+    if checkpoints.is_complete(step, unit, params, verify_checksums=options.verify_checksums):
+        logger.info(f"  Skipping {unit}: already completed")
+        return False
+    return True
+
+def input_checksum(path, entry):
+    """sha256 of an input from its manifest entry, hashing the file only if it has none"""
+    if entry and entry.get('sha256'):
+        return entry['sha256']
+    return checkpoints.checksum(path)
+
+def unit_resources(step, unit, timeout, threads):
+    """Timeout and threads for a unit, raised for previously failed units with --retry-failed"""
+    if options.retry_failed and checkpoints.has_failed(step, unit):
+        timeout = options.retry_timeout or (timeout * 2 if timeout else None)
+        threads = options.retry_threads or threads
+        logger.info(f"  Retrying {unit} with timeout={timeout}, threads={threads}")
+    return timeout, threads
 
 def step0_create_subchunks():
     """Step 0: Extract first N individuals from each chunk"""
@@ -82,102 +160,141 @@ def step0_create_subchunks():
     
     logger.info(f"Found {len(chunks)} chr19 chunks to process")
     
+    # Chunk plan of the extraction (chunk_plan.py), to check the chunks against it
+    plan = load_plan(INPUT_DIR).get('19')
+    input_manifest = load_manifest(INPUT_DIR)
+    if plan:
+        logger.info(f"Chunk plan: {len(plan['chunks'])} {plan['method']} chunks, "
+                    f"heaviest/mean bp {imbalance(plan):.2f}")
+        if len(plan['chunks']) != len(chunks):
+            logger.warning(f"  Chunk plan has {len(plan['chunks'])} chr19 chunks, found {len(chunks)} files")
+    
     for chunk in chunks:
         chunk_num = chunk.name.replace("chrom19_chunk", "").replace(".fa.gz", "")
+        if plan and chunk_num.isdigit() and int(chunk_num) <= len(plan['chunks']):
+            planned = plan['chunks'][int(chunk_num) - 1]
+            entry = lookup(chunk, input_manifest)
+            if entry and set(entry['per_sample']) != set(planned['samples']):
+                logger.warning(f"  {chunk.name} does not hold the samples of chunk {chunk_num} of the chunk plan")
+            logger.info(f"  {chunk.name}: planned {len(planned['samples'])} samples, {planned['bp']:,} bp")
         output_file = f"{SUBCHUNK_DIR}/chr19_chunk{chunk_num}_sub{NUM_INDIVIDUALS}.fa.gz"
         
+        # Source chunks are large, so they are identified by size and mtime rather than hashed
+        unit = f"chr19_chunk{chunk_num}"
+        st = chunk.stat()
+        params = {'num_individuals': NUM_INDIVIDUALS, 'source': str(chunk),
+                  'source_size': st.st_size, 'source_mtime_ns': st.st_mtime_ns}
+        if not should_run("step0", unit, params):
+            continue
+        
         logger.info(f"Processing {chunk.name} -> {os.path.basename(output_file)}")
         
         # Read and extract first N sequences
         try:
             seq_count = 0
-            with gzip.open(chunk, 'rt') as fin, gzip.open(output_file, 'wt') as fout:
-                current_header = None
-                current_seq = []
-                
-                for line in fin:
-                    if line.startswith('>'):
-                        # Write previous sequence if exists
-                        if current_header and seq_count < NUM_INDIVIDUALS:
-                            fout.write(current_header)
-                            fout.write(''.join(current_seq))
-                            seq_count += 1
-                        
-                        if seq_count >= NUM_INDIVIDUALS:
-                            break
-                        
-                        current_header = line
-                        current_seq = []
-                    else:
-                        current_seq.append(line)
-                
-                # Write last sequence
-                if current_header and seq_count < NUM_INDIVIDUALS:
-                    fout.write(current_header)
-                    fout.write(''.join(current_seq))
+            stats = ChunkStats()
+            raw_out = HashingWriter(output_file)
+            fai = []
+            # BGZF blocks are compressed by NUM_THREADS threads; .gzi/.fai entries are kept while writing
+            with BgzfWriter(raw_out, threads=NUM_THREADS) as fout:
+                # Records are parsed out of large decompressed blocks (see fast_reader.py)
+                for header, seq in iter_fasta_records(chunk, NUM_THREADS):
+                    if seq_count >= NUM_INDIVIDUALS:
+                        break
+                    fout.write(f">{header}\n".encode())
+                    length = len(seq) - seq.count(b'\n') - seq.count(b'\r')
+                    first_line = seq[:seq.find(b'\n') + 1] or None
+                    fai.append(fai_entry(header, fout.tell(), length, first_line))
+                    fout.write(seq)
+                    stats.add(header, seq.decode())
                     seq_count += 1
+            write_gzi(f"{output_file}.gzi", fout.blocks)
+            write_fai(f"{output_file}.fai", fai)
+            update_manifest(SUBCHUNK_DIR, {os.path.basename(output_file):
+                                           stats.entry(raw_out.sha256.hexdigest(), raw_out.size)})
             
-            logger.info(f"  Created {output_file}: {seq_count} sequences")
+            logger.info(f"  Created {output_file}: {seq_count} sequences, {stats.total_bp:,} bp")
+            checkpoints.mark_done("step0", unit, params, [output_file])
             
         except Exception as e:
             logger.error(f"Failed to process {chunk.name}: {e}")
+            checkpoints.mark_failed("step0", unit, params, str(e))
             return False
     
-    # Create samtools index for each subchunk
-    logger.info("Creating samtools indexes...")
-    for subchunk in Path(SUBCHUNK_DIR).glob("*.fa.gz"):
-        cmd = f"samtools faidx {subchunk}"
-        run_command(cmd, f"Indexing {subchunk.name}")
-    
     return True
 
+def heaviest_first(subchunks, manifest):
+    """Subchunks by the chunk plan's bp, then by their manifest bp, heaviest first
+
+    PGGB time grows faster than the input, so the heaviest chunks start first:
+    a timeout on them shows up early, and in step 3 the longest jobs do not
+    start last.
+    """
+    plan = load_plan(INPUT_DIR).get('19')
+
+    def weight(subchunk):
+        match = re.match(r'chr19_chunk(\d+)_', subchunk.name)
+        planned = chunk_bp(plan, int(match.group(1))) if match else None
+        return (-1 if planned is None else planned, (lookup(subchunk, manifest) or {}).get('total_bp', 0))
+
+    return sorted(subchunks, key=weight, reverse=True)
+
 def step1_build_local_graphs():
     """Step 1: Run PGGB on each subchunk"""
     logger.info("=" * 60)
     logger.info("STEP 1: Building local graphs with PGGB")
     logger.info("=" * 60)
     
-    subchunks = sorted(Path(SUBCHUNK_DIR).glob("chr19_chunk*_sub*.fa.gz"))
-    logger.info(f"Found {len(subchunks)} subchunks to process")
+    manifest = load_manifest(SUBCHUNK_DIR)
+    subchunks = heaviest_first(sorted(Path(SUBCHUNK_DIR).glob("chr19_chunk*_sub*.fa.gz")), manifest)
+    logger.info(f"Found {len(subchunks)} subchunks to process (heaviest first)")
     
     for subchunk in subchunks:
         chunk_name = subchunk.stem.replace(".fa", "")
         output_subdir = f"{OUTPUT_DIR}/{chunk_name}"
         os.makedirs(output_subdir, exist_ok=True)
         
-        # Get sequence count for -n parameter
-        count_cmd = f"zcat {subchunk} | grep -c '^>'"
-        result = subprocess.run(count_cmd, shell=True, capture_output=True, text=True)
-        n_seqs = int(result.stdout.strip()) if result.stdout.strip() else NUM_INDIVIDUALS
+        entry = lookup(subchunk, manifest)
+        params = {'pggb_args': PGGB_ARGS, 'input_sha256': input_checksum(subchunk, entry)}
+        if not should_run("step1", chunk_name, params):
+            continue
+        timeout, threads = unit_resources("step1", chunk_name, PGGB_TIMEOUT, NUM_THREADS)
+        resources = {'timeout': timeout, 'threads': threads}
         
-        logger.info(f"Processing {subchunk.name} with {n_seqs} sequences")
+        # Sequence count for -n from the manifest; count only subchunks made without one
+        if entry:
+            n_seqs = entry['sequences']
+            logger.info(f"Processing {subchunk.name} with {n_seqs} sequences, {entry['total_bp']:,} bp "
+                        f"({100 * entry['n_fraction']:.2f}% N)")
+        else:
+            count_cmd = f"zcat {subchunk} | grep -c '^>'"
+            result = subprocess.run(count_cmd, shell=True, capture_output=True, text=True)
+            n_seqs = int(result.stdout.strip()) if result.stdout.strip() else NUM_INDIVIDUALS
+            logger.info(f"Processing {subchunk.name} with {n_seqs} sequences (not in manifest)")
         
-        # Run PGGB via Docker
-        pggb_cmd = f"""
-docker run --rm \
-    -v {SUBCHUNK_DIR}:/data:ro \
-    -v {output_subdir}:/output \
-    ghcr.io/pangenome/pggb:latest \
-    pggb -i /data/{subchunk.name} \
-         -o /output \
-         -n {n_seqs} \
-         -t {NUM_THREADS} \
-         -p 90 \
-         -s 10000
-"""
+        # Run PGGB through the configured executor
+        pggb_cmd = executor.wrap(
+            PGGB_IMAGE,
+            f"pggb -i {subchunk} -o {output_subdir} -n {n_seqs} -t {threads} {PGGB_ARGS}",
+            volumes=[SUBCHUNK_DIR, output_subdir]
+        )
         
-        success = run_command(pggb_cmd, f"PGGB on {subchunk.name}", timeout=7200)  # 2 hour timeout per chunk
+        success = run_command(pggb_cmd, f"PGGB on {subchunk.name}", timeout=timeout,
+                              inputs=[subchunk], outputs=[output_subdir])
         
         if not success:
             logger.warning(f"PGGB failed for {subchunk.name}, continuing to next chunk...")
+            checkpoints.mark_failed("step1", chunk_name, params, "PGGB failed or timed out", resources)
             continue
         
         # Verify output
         gfa_files = list(Path(output_subdir).glob("*.smooth.final.gfa"))
         if gfa_files:
             logger.info(f"  Output GFA: {gfa_files[0].name}")
+            checkpoints.mark_done("step1", chunk_name, params, gfa_files, resources)
         else:
             logger.warning(f"  No GFA output found for {subchunk.name}")
+            checkpoints.mark_failed("step1", chunk_name, params, "No GFA output", resources)
     
     return True
 
@@ -196,34 +313,55 @@ def step2_aggregate_graphs():
                 gfa_files.append(gfas[0])
                 logger.info(f"Found GFA: {gfas[0]}")
     
+    megagraph_gfa = f"{OUTPUT_DIR}/MEGAGRAPH.gfa"
+    if options.incremental and os.path.exists(megagraph_gfa):
+        return aggregate_incremental(gfa_files, megagraph_gfa)
+    if options.dedup:
+        # Build from scratch through the sequence store instead of vg combine
+        if not should_run("step2", "MEGAGRAPH", {'sources': sorted(str(gfa) for gfa in gfa_files),
+                                                 'dedup': True}):
+            return True
+        for old in megagraph_files(megagraph_gfa):
+            if old.exists():
+                old.unlink()
+        return aggregate_incremental(gfa_files, megagraph_gfa)
+    
     if len(gfa_files) < 2:
         logger.error(f"Need at least 2 GFA files to combine, found {len(gfa_files)}")
         return False
     
     logger.info(f"Combining {len(gfa_files)} GFA files")
     
+    # Local GFAs were hashed when step 1 marked them done, so this is a stat per file
+    megagraph_params = {'inputs': {str(gfa): checkpoints.checksum(gfa) for gfa in gfa_files}}
+    if not should_run("step2", "MEGAGRAPH", megagraph_params):
+        return True
+    
     # Convert each GFA to VG
     vg_files = []
-    for i, gfa in enumerate(gfa_files):
-        vg_file = f"temp_{i}.vg"
+    for gfa in gfa_files:
+        vg_file = f"temp_{gfa.parent.name}.vg"
         vg_path = f"{OUTPUT_DIR}/{vg_file}"
         
-        cmd = f"""
-docker run --rm \
-    -v {gfa.parent}:/input:ro \
-    -v {OUTPUT_DIR}:/output \
-    quay.io/vgteam/vg:v1.71.0 \
-    vg convert /input/{gfa.name} -v > {vg_path}
-"""
+        unit = f"convert_{gfa.parent.name}"
+        params = {'gfa_sha256': megagraph_params['inputs'][str(gfa)]}
+        if not should_run("step2", unit, params):
+            vg_files.append(vg_file)
+            continue
         
-        if run_command(cmd, f"Converting {gfa.name} to VG"):
+        cmd = executor.wrap(VG_IMAGE, f"vg convert {gfa} -v", volumes=[gfa.parent]) + f" > {vg_path}"
+        
+        if run_command(cmd, f"Converting {gfa.name} to VG", inputs=[gfa], outputs=[vg_path]):
             if os.path.exists(vg_path) and os.path.getsize(vg_path) > 0:
                 vg_files.append(vg_file)
                 logger.info(f"  Created {vg_file}")
+                checkpoints.mark_done("step2", unit, params, [vg_path])
             else:
                 logger.warning(f"  VG file empty or not created: {vg_file}")
+                checkpoints.mark_failed("step2", unit, params, "VG file empty or not created")
         else:
             logger.warning(f"  Failed to convert {gfa.name}")
+            checkpoints.mark_failed("step2", unit, params, "vg convert failed")
     
     if len(vg_files) < 2:
         logger.error("Not enough VG files to combine")
@@ -239,15 +377,13 @@ docker run --rm \
         next_vg = f"{OUTPUT_DIR}/{vg_files[i]}"
         temp_output = f"{OUTPUT_DIR}/temp_combined_{i}.vg"
         
-        cmd = f"""
-docker run --rm \
-    -v {OUTPUT_DIR}:/graphs \
-    quay.io/vgteam/vg:v1.71.0 \
-    vg combine -p /graphs/{os.path.basename(current_combined)} /graphs/{vg_files[i]} > {temp_output}
-"""
+        cmd = executor.wrap(VG_IMAGE, f"vg combine -p {current_combined} {next_vg}",
+                            volumes=[OUTPUT_DIR]) + f" > {temp_output}"
         
-        if not run_command(cmd, f"Combining graph {i}/{len(vg_files)-1}"):
+        if not run_command(cmd, f"Combining graph {i}/{len(vg_files)-1}",
+                           inputs=[current_combined, next_vg], outputs=[temp_output]):
             logger.error("Failed to combine graphs")
+            checkpoints.mark_failed("step2", "MEGAGRAPH", megagraph_params, "vg combine failed")
             return False
         
         # Clean up previous combined file if it's a temp file
@@ -261,17 +397,26 @@ docker run --rm \
     logger.info(f"Created MEGAGRAPH.vg")
     
     # Convert MEGAGRAPH to GFA for minigraph
-    convert_cmd = f"""
-docker run --rm \
-    -v {OUTPUT_DIR}:/graphs \
-    quay.io/vgteam/vg:v1.71.0 \
-    vg convert -f /graphs/MEGAGRAPH.vg > {OUTPUT_DIR}/MEGAGRAPH.gfa
-"""
+    convert_cmd = executor.wrap(VG_IMAGE, f"vg convert -f {OUTPUT_DIR}/MEGAGRAPH.vg",
+                                volumes=[OUTPUT_DIR]) + f" > {OUTPUT_DIR}/MEGAGRAPH.gfa"
     
-    if not run_command(convert_cmd, "Converting MEGAGRAPH to GFA"):
+    if not run_command(convert_cmd, "Converting MEGAGRAPH to GFA",
+                       inputs=[f"{OUTPUT_DIR}/MEGAGRAPH.vg"], outputs=[f"{OUTPUT_DIR}/MEGAGRAPH.gfa"]):
+        checkpoints.mark_failed("step2", "MEGAGRAPH", megagraph_params, "vg convert -f failed")
         return False
     
     logger.info(f"Created MEGAGRAPH.gfa")
+    checkpoints.mark_done("step2", "MEGAGRAPH", megagraph_params,
+                          [f"{OUTPUT_DIR}/MEGAGRAPH.vg", f"{OUTPUT_DIR}/MEGAGRAPH.gfa"])
+    
+    # Summary statistics and sources for later incremental updates
+    for old in megagraph_files(megagraph_gfa)[1:]:
+        if old.exists():
+            old.unlink()
+    mg = Megagraph(megagraph_gfa)
+    for gfa in gfa_files:
+        mg.summary['sources'][str(gfa)] = {}
+    mg.save()
     
     # Cleanup temp VG files
     for vg in vg_files:
@@ -281,6 +426,70 @@ docker run --rm \
     
     return True
 
+def aggregate_incremental(gfa_files, megagraph_gfa):
+    """Step 2 (--incremental/--dedup): append local GFAs not yet in MEGAGRAPH.gfa"""
+    mg = Megagraph(megagraph_gfa, dedup=options.dedup)
+    new_gfas = [gfa for gfa in gfa_files if str(gfa) not in mg.summary['sources']]
+    logger.info(f"Incremental aggregation: {len(new_gfas)} new of {len(gfa_files)} local GFAs")
+    
+    for gfa in new_gfas:
+        start = time.monotonic()
+        added = mg.append_file(gfa, site=gfa.parent.name)
+        logger.info(f"  Appended {gfa.name}: {added['nodes']:,} nodes, {added['edges']:,} edges, "
+                    f"{added['paths']:,} paths, {added['collapsed']:,} segments collapsed "
+                    f"({time.monotonic() - start:.1f}s)")
+        if added['skipped']:
+            logger.warning(f"  {gfa.name}: skipped unsupported GFA records: "
+                           f"{', '.join(f'{n:,} {kind}' for kind, n in added['skipped'].items())}")
+    
+    stats = mg.stats()
+    logger.info(f"MEGAGRAPH.gfa: {stats['num_nodes']:,} nodes, {stats['num_edges']:,} edges, "
+                f"{stats['num_paths']:,} paths, {stats['num_samples']} samples")
+    if mg.store is not None:
+        logger.info(f"Collapsed {stats['collapsed_nodes']:,} duplicate segments ({stats['collapsed_bp']:,} bp)")
+        for line in format_site_report(mg.store).splitlines():
+            logger.info(line)
+    if new_gfas and os.path.exists(f"{OUTPUT_DIR}/MEGAGRAPH.vg"):
+        logger.warning("MEGAGRAPH.vg is not updated incrementally; regenerate it from MEGAGRAPH.gfa if needed")
+    
+    # The summary is the cheap stand-in output; hashing MEGAGRAPH.gfa would cost a full read
+    checkpoints.mark_done("step2", "MEGAGRAPH", {'sources': sorted(mg.summary['sources']),
+                                                 'dedup': options.dedup},
+                          [mg.summary_path])
+    return True
+
+def feedback_subchunk(subchunk, megagraph, federated_dir, params):
+    """Run minigraph feedback for one subchunk and return its graph stats"""
+    chunk_name = subchunk.stem.replace(".fa", "")
+    output_gfa = f"{federated_dir}/{chunk_name}_federated.gfa"
+    timeout, threads = unit_resources("step3", chunk_name, None, params['threads'])
+    resources = {'timeout': timeout, 'threads': threads}
+    params = {k: v for k, v in params.items() if k != 'threads'}
+    
+    logger.info(f"Feedback for {chunk_name} ({threads} threads)")
+    
+    # minigraph: MEGAGRAPH.gfa + chunk.fa.gz → improved GFA
+    # minigraph reads gzipped FASTA directly, so no temporary copy is needed
+    cmd = f"minigraph -cxggs -t {threads} {megagraph} {subchunk} > {output_gfa}"
+    
+    if not run_command(cmd, f"Minigraph feedback for {chunk_name}", timeout=timeout,
+                       inputs=[megagraph, subchunk], outputs=[output_gfa]):
+        logger.warning(f"Minigraph failed for {chunk_name}, continuing...")
+        checkpoints.mark_failed("step3", chunk_name, params, "minigraph failed", resources)
+        return chunk_name, None
+    
+    if not os.path.exists(output_gfa) or os.path.getsize(output_gfa) == 0:
+        logger.warning(f"  Output GFA empty or not created: {output_gfa}")
+        checkpoints.mark_failed("step3", chunk_name, params, "Output GFA empty or not created", resources)
+        return chunk_name, None
+    checkpoints.mark_done("step3", chunk_name, params, [output_gfa], resources)
+    
+    # Log stats
+    stats = GraphAnalyzer(GFAParser(output_gfa), chunk_name).stats
+    logger.info(f"  {os.path.basename(output_gfa)}: {stats['num_nodes']:,} nodes, "
+                f"{stats['num_edges']:,} edges, {stats['num_paths']:,} paths")
+    return chunk_name, stats
+
 def step3_feedback_loop():
     """Step 3: Use minigraph to improve local graphs with MEGAGRAPH"""
     logger.info("=" * 60)
@@ -296,38 +505,45 @@ def step3_feedback_loop():
         return False
     
     subchunks = sorted(Path(SUBCHUNK_DIR).glob("chr19_chunk*_sub*.fa.gz"))
-    
+    manifest = load_manifest(SUBCHUNK_DIR)
+    megagraph_sha256 = checkpoints.checksum(megagraph)  # Hashed once per MEGAGRAPH version (hashes.json)
+    unit_params = {}
     for subchunk in subchunks:
-        chunk_name = subchunk.stem.replace(".fa", "")
-        output_gfa = f"{federated_dir}/{chunk_name}_federated.gfa"
-        
-        logger.info(f"Feedback for {chunk_name}")
-        
-        # Decompress subchunk temporarily
-        temp_fa = f"/tmp/{chunk_name}.fa"
-        decompress_cmd = f"zcat {subchunk} > {temp_fa}"
-        run_command(decompress_cmd, f"Decompressing {subchunk.name}")
-        
-        # minigraph: MEGAGRAPH.gfa + chunk.fa → improved GFA
-        cmd = f"minigraph -cxggs {megagraph} {temp_fa} > {output_gfa}"
-        
-        success = run_command(cmd, f"Minigraph feedback for {chunk_name}")
-        
-        # Cleanup temp file
-        if os.path.exists(temp_fa):
-            os.remove(temp_fa)
-        
-        if not success:
-            logger.warning(f"Minigraph failed for {chunk_name}, continuing...")
-            continue
-        
-        # Log stats
-        if os.path.exists(output_gfa) and os.path.getsize(output_gfa) > 0:
-            count_cmd = f"grep -c '^S' {output_gfa}"
-            result = subprocess.run(count_cmd, shell=True, capture_output=True, text=True)
-            logger.info(f"  {os.path.basename(output_gfa)}: {result.stdout.strip()} nodes")
-        else:
-            logger.warning(f"  Output GFA empty or not created: {output_gfa}")
+        params = {'megagraph_sha256': megagraph_sha256,
+                  'input_sha256': input_checksum(subchunk, lookup(subchunk, manifest))}
+        if should_run("step3", subchunk.stem.replace(".fa", ""), params):
+            unit_params[subchunk] = params
+    subchunks = heaviest_first(unit_params, manifest)
+    if not subchunks:
+        logger.warning("No subchunks to run for feedback")
+        return True
+    
+    # Split the thread budget across concurrent minigraph jobs
+    num_jobs = max(1, min(len(subchunks), NUM_THREADS // MINIGRAPH_THREADS))
+    threads_per_job = max(1, NUM_THREADS // num_jobs)
+    logger.info(f"Running {len(subchunks)} subchunks, {num_jobs} at a time with {threads_per_job} threads each")
+    
+    # Keep stats of subchunks completed by earlier (resumed) runs
+    stats_file = f"{federated_dir}/feedback_stats.json"
+    feedback_stats = {}
+    if os.path.exists(stats_file):
+        with open(stats_file) as f:
+            feedback_stats = json.load(f)
+    
+    with ThreadPoolExecutor(max_workers=num_jobs) as pool:
+        futures = [
+            pool.submit(feedback_subchunk, subchunk, megagraph, federated_dir,
+                        {**unit_params[subchunk], 'threads': threads_per_job})
+            for subchunk in subchunks
+        ]
+        for future in as_completed(futures):
+            chunk_name, stats = future.result()
+            if stats:
+                feedback_stats[chunk_name] = stats
+    
+    with open(stats_file, 'w') as f:
+        json.dump(feedback_stats, f, indent=2, default=float)
+    logger.info(f"Feedback stats for {len(feedback_stats)} subchunks saved to {stats_file}")
     
     return True
 
@@ -339,9 +555,21 @@ def print_summary():
     
     # Subchunks
     subchunks = list(Path(SUBCHUNK_DIR).glob("*.fa.gz"))
+    manifest = load_manifest(SUBCHUNK_DIR)
     logger.info(f"\nSubchunks created: {len(subchunks)}")
     for s in subchunks:
-        logger.info(f"  - {s.name}")
+        entry = lookup(s, manifest)
+        if entry:
+            logger.info(f"  - {s.name}: {entry['sequences']} sequences, {entry['samples']} samples, "
+                        f"{entry['total_bp']:,} bp")
+        else:
+            logger.info(f"  - {s.name}")
+    
+    # Chunk balance of the extraction
+    for name, plan in load_plan(INPUT_DIR).items():
+        logger.info("")
+        for line in format_plan(name, plan).split('\n'):
+            logger.info(line)
     
     # PGGB outputs
     pggb_dirs = list(Path(OUTPUT_DIR).glob("chr19_chunk*_sub*"))
@@ -364,9 +592,36 @@ def print_summary():
         logger.info(f"\nFederated outputs: {len(fed_gfas)}")
         for f in fed_gfas:
             logger.info(f"  - {f.name}")
+    
+    # Resource usage of this run
+    if os.path.exists(LEDGER_FILE):
+        summary = telemetry.summarize(telemetry.load_ledger(LEDGER_FILE, RUN_ID))
+        logger.info(f"\nResource usage (ledger: {LEDGER_FILE}):")
+        for line in telemetry.format_summary(summary).split('\n'):
+            logger.info(f"  {line}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Federated pangenome graph construction pipeline")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip units that already completed with the same parameters")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Like --resume, and rerun failed units with --retry-timeout/--retry-threads")
+    parser.add_argument("--retry-timeout", type=int, default=None,
+                        help="Timeout in seconds for retried units (default: twice the normal timeout)")
+    parser.add_argument("--retry-threads", type=int, default=None,
+                        help="Threads for retried units (default: unchanged)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Append new local GFAs to the existing MEGAGRAPH.gfa instead of rebuilding it")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Aggregate through the sequence store, collapsing identical segments across local graphs")
+    parser.add_argument("--verify-checksums", action="store_true",
+                        help="Re-hash recorded outputs instead of only checking their sizes when resuming")
+    return parser.parse_args()
 
 def main():
     """Run the complete federated pangenome pipeline"""
+    global options
+    options = parse_args()
     start_time = datetime.now()
     
     logger.info("=" * 60)
@@ -380,6 +635,17 @@ def main():
     logger.info(f"  Output directory: {OUTPUT_DIR}")
     logger.info(f"  Individuals per subchunk: {NUM_INDIVIDUALS}")
     logger.info(f"  Threads: {NUM_THREADS}")
+    logger.info(f"  Executor: {EXECUTOR_BACKEND}")
+    if options.resume or options.retry_failed:
+        logger.info(f"  Resuming from checkpoints in {CHECKPOINT_DIR}")
+        for step in ["step0", "step1", "step2", "step3"]:
+            failed = checkpoints.failed_units(step)
+            if failed:
+                logger.info(f"    {step} failed units: {', '.join(failed)}")
+    
+    global executor
+    executor = make_executor(EXECUTOR_BACKEND, volumes=[INPUT_DIR, SUBCHUNK_DIR, OUTPUT_DIR],
+                             pool_size=EXECUTOR_POOL_SIZE)
     
     # Run all steps
     steps = [
@@ -390,19 +656,23 @@ def main():
     ]
     
     results = {}
-    for step_name, step_func in steps:
-        logger.info(f"\n{'='*60}")
-        logger.info(f"STARTING: {step_name}")
-        logger.info(f"{'='*60}\n")
-        
-        try:
-            success = step_func()
-            results[step_name] = "SUCCESS" if success else "FAILED"
-        except Exception as e:
-            logger.error(f"Exception in {step_name}: {e}")
-            results[step_name] = f"ERROR: {e}"
-        
-        logger.info(f"\n{step_name}: {results[step_name]}")
+    try:
+        for step_name, step_func in steps:
+            logger.info(f"\n{'='*60}")
+            logger.info(f"STARTING: {step_name}")
+            logger.info(f"{'='*60}\n")
+            
+            try:
+                success = step_func()
+                results[step_name] = "SUCCESS" if success else "FAILED"
+            except Exception as e:
+                logger.error(f"Exception in {step_name}: {e}")
+                results[step_name] = f"ERROR: {e}"
+            
+            logger.info(f"\n{step_name}: {results[step_name]}")
+    finally:
+        # Stop pooled tool containers
+        executor.close()
     
     # Print summary
     print_summary()
@@ -418,6 +688,7 @@ def main():
     for step, result in results.items():
         logger.info(f"  {step}: {result}")
     logger.info(f"\nLogs saved to: {LOG_FILE}")
+    logger.info(f"Task ledger: {LEDGER_FILE}")
     logger.info("=" * 60)
 
 if __name__ == "__main__":
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Local Federation Simulator
+==========================
+Runs the federated workflow with real process and network boundaries on one
+host: every site is a separate worker process with a private input
+directory. Workers build local graphs and ship only the GFA artifacts to a
+coordinator over a localhost TCP socket; the coordinator aggregates them into
+a MEGAGRAPH. With --format pgx graphs are sent in the compact binary
+exchange format (graph_exchange.py) and decoded by the coordinator as they
+are aggregated. Payloads are streamed from and to disk (the PGX encoding is
+written next to the site's GFA, the coordinator spools what it receives), so
+neither side holds a whole graph in memory. With --dedup identical segments from different sites are
+collapsed through the sequence store (sequence_store.py), and the report adds
+per-site unique/shared bp.
+
+Reports bytes transferred, per-site build/transfer latency and aggregation
+throughput (federation_report.json + printed table).
+
+Protocol (one TCP connection per site): every message is a 4-byte big-endian
+header length, a JSON header and, for artifacts, header['size'] payload bytes.
+- worker → HELLO {site, n_inputs}
+- worker → ARTIFACT {site, name, format, size, gfa_bytes, sha256, build_s} + payload
+- coordinator → ACK {name, ok}
+- worker → DONE {site}
+
+Usage:
+    python federation_sim.py <workdir> --inputs <dir with *.fa.gz> [--sites 4] \\
+        [--executor fake|docker|pool|local] [--format gfa|pgx] [--dedup]
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+from multiprocessing import Process
+from pathlib import Path
+
+import telemetry
+from executor import PGGB_IMAGE, make_executor
+from graph_exchange import encode_file, read_lines
+from megagraph import Megagraph, megagraph_files
+from sequence_store import format_site_report
+
+PGGB_ARGS = "-p 90 -s 10000"
+FAKE_SEGMENT_LEN = 1000
+HEADER = struct.Struct('>I')
+ACCEPT_POLL_S = 1.0  # How often the coordinator checks for dead workers while waiting for connections
+
+
+def send_message(sock, header, payload=None):
+    """Send a framed message with an optional payload file path, return bytes written"""
+    data = json.dumps(header).encode()
+    sock.sendall(HEADER.pack(len(data)) + data)
+    if payload is None:
+        return HEADER.size + len(data)
+    with open(payload, 'rb') as f:
+        return HEADER.size + len(data) + sock.sendfile(f)
+
+
+def recv_exact(sock, n):
+    chunks = []
+    while n:
+        chunk = sock.recv(min(n, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed mid-message")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_into(sock, n, out):
+    """Stream n bytes from the socket into a file, return their sha256"""
+    digest = hashlib.sha256()
+    while n:
+        chunk = sock.recv(min(n, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed mid-message")
+        out.write(chunk)
+        digest.update(chunk)
+        n -= len(chunk)
+    return digest.hexdigest()
+
+
+def recv_message(sock, spool=None):
+    """Receive a framed message, return (header, payload sha256, bytes read, seconds reading the payload)
+
+    An artifact payload replaces the contents of the spool file, which is left
+    rewound for reading.
+    """
+    (length,) = HEADER.unpack(recv_exact(sock, HEADER.size))
+    header = json.loads(recv_exact(sock, length))
+    start = time.monotonic()
+    digest, size = None, 0
+    if header.get('type') == 'ARTIFACT':
+        size = header['size']
+        spool.seek(0)
+        spool.truncate()
+        digest = recv_into(sock, size, spool)
+        spool.seek(0)
+    return header, digest, HEADER.size + length + size, time.monotonic() - start
+
+
+def count_sequences(fasta):
+    with gzip.open(fasta, 'rt') as f:
+        return sum(1 for line in f if line.startswith('>'))
+
+
+def fake_build_gfa(fasta, out_gfa):
+    """Offline stand-in for PGGB: one linear chain of segments per sequence"""
+    node_id = 0
+    with gzip.open(fasta, 'rt') as fin, open(out_gfa, 'w') as out:
+        out.write("H\tVN:Z:1.0\n")
+        name, seq = None, []
+
+        def flush():
+            nonlocal node_id
+            if name is None:
+                return
+            s = ''.join(seq)
+            steps = []
+            for i in range(0, len(s), FAKE_SEGMENT_LEN):
+                node_id += 1
+                out.write(f"S\t{node_id}\t{s[i:i + FAKE_SEGMENT_LEN]}\n")
+                if steps:
+                    out.write(f"L\t{node_id - 1}\t+\t{node_id}\t+\t0M\n")
+                steps.append(f"{node_id}+")
+            out.write(f"P\t{name}\t{','.join(steps)}\t*\n")
+
+        for line in fin:
+            line = line.strip()
+            if line.startswith('>'):
+                flush()
+                name, seq = line[1:].split()[0], []
+            else:
+                seq.append(line)
+        flush()
+
+
+def build_local_graph(fasta, graph_dir, executor_name, executor):
+    """Build one local graph, return the GFA path (or None)"""
+    graph_dir.mkdir(parents=True, exist_ok=True)
+    if executor_name == "fake":
+        out_gfa = graph_dir / f"{fasta.name}.smooth.final.gfa"
+        fake_build_gfa(fasta, out_gfa)
+        return out_gfa
+    cmd = executor.wrap(
+        PGGB_IMAGE,
+        f"pggb -i {fasta} -o {graph_dir} -n {count_sequences(fasta)} -t {os.cpu_count()} {PGGB_ARGS}",
+        volumes=[fasta.parent, graph_dir]
+    )
+    status, _, _, _ = telemetry.run_measured(cmd)
+    gfas = sorted(graph_dir.glob("*.smooth.final.gfa"))
+    return gfas[0] if status == "success" and gfas else None
+
+
+def site_worker(site, site_dir, address, executor_name, fmt='gfa'):
+    """Worker process: build local graphs from private inputs and ship the GFAs"""
+    site_dir = Path(site_dir)
+    inputs = sorted((site_dir / "input").glob("*.fa.gz"))
+    executor = make_executor(executor_name, volumes=[site_dir])
+    with executor, socket.create_connection(address) as sock:
+        send_message(sock, {'type': 'HELLO', 'site': site, 'n_inputs': len(inputs)})
+        for fasta in inputs:
+            start = time.monotonic()
+            gfa = build_local_graph(fasta, site_dir / "graphs" / fasta.name.replace(".fa.gz", ""),
+                                    executor_name, executor)
+            build_s = time.monotonic() - start
+            if gfa is None:
+                print(f"[{site}] Failed to build graph for {fasta.name}")
+                continue
+            gfa_bytes = gfa.stat().st_size
+            payload = gfa
+            if fmt == 'pgx':
+                payload = gfa.with_suffix('.pgx')
+                encode_file(gfa, payload)
+            with open(payload, 'rb') as f:
+                sha256 = hashlib.file_digest(f, 'sha256').hexdigest()
+            send_message(sock, {'type': 'ARTIFACT', 'site': site, 'name': gfa.name, 'format': fmt,
+                                'size': payload.stat().st_size, 'gfa_bytes': gfa_bytes,
+                                'sha256': sha256, 'build_s': build_s},
+                         payload)
+            if payload != gfa:
+                payload.unlink()
+            ack = recv_message(sock)[0]
+            if not ack['ok']:
+                print(f"[{site}] Coordinator rejected {gfa.name}")
+        send_message(sock, {'type': 'DONE', 'site': site})
+
+
+class Coordinator:
+    """Accept site connections and aggregate incoming graphs into a MEGAGRAPH"""
+
+    def __init__(self, megagraph_path, n_sites, dedup=False):
+        self.megagraph_path = megagraph_path
+        self.n_sites = n_sites
+        self.sites = {}
+        self.connected = set()
+        self.errors = []
+        self.aggregation = {'artifacts': 0, 'bytes': 0, 'gfa_bytes': 0, 'segments': 0, 'seconds': 0.0}
+        self._lock = threading.Lock()
+        self.megagraph = Megagraph(megagraph_path, dedup=dedup)
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.address = self.server.getsockname()
+
+    def handle(self, conn):
+        site = None
+        try:
+            with conn, tempfile.TemporaryFile(dir=Path(self.megagraph_path).parent) as spool:
+                header, _, nbytes, _ = recv_message(conn)
+                site = header['site']
+                with self._lock:
+                    self.connected.add(site)
+                stats = {'n_inputs': header['n_inputs'], 'artifacts': 0, 'bytes_received': nbytes,
+                         'bytes_sent': 0, 'build_s': 0.0, 'transfer_s': 0.0,
+                         'connected_at': time.monotonic()}
+                while True:
+                    header, digest, nbytes, payload_s = recv_message(conn, spool)
+                    stats['bytes_received'] += nbytes
+                    if header['type'] == 'DONE':
+                        break
+                    stats['transfer_s'] += payload_s
+                    ok = digest == header['sha256']
+                    if ok:
+                        self.aggregate(header, spool)
+                        stats['artifacts'] += 1
+                        stats['build_s'] += header['build_s']
+                    stats['bytes_sent'] += send_message(conn, {'type': 'ACK', 'name': header['name'], 'ok': ok})
+                stats['latency_s'] = time.monotonic() - stats.pop('connected_at')
+                with self._lock:
+                    self.sites[site] = stats
+        except (ConnectionError, ValueError, struct.error) as e:
+            # The worker died mid-stream
+            with self._lock:
+                self.errors.append(f"{site or 'A site'} disconnected: {e}")
+
+    def aggregate(self, header, payload):
+        """Append a received artifact (a binary file object) to the MEGAGRAPH"""
+        with self._lock:
+            start = time.monotonic()
+            if header.get('format') == 'pgx':
+                lines = read_lines(payload)
+            else:
+                lines = (line.decode() for line in payload)
+            n_segments = self.megagraph.append(lines, site=header['site'])['nodes']
+            self.aggregation['seconds'] += time.monotonic() - start
+            self.aggregation['artifacts'] += 1
+            self.aggregation['bytes'] += header['size']
+            self.aggregation['gfa_bytes'] += header.get('gfa_bytes', header['size'])
+            self.aggregation['segments'] += n_segments
+
+    def serve(self, workers):
+        """Accept one connection per site; give up when a worker exits before it connects
+
+        workers maps site names to their processes.
+        """
+        self.server.settimeout(ACCEPT_POLL_S)
+        threads = []
+        while len(threads) < self.n_sites:
+            try:
+                conn, _ = self.server.accept()
+            except socket.timeout:
+                # Connections still missing that no live worker can make
+                alive = sum(w.is_alive() for w in workers.values())
+                if self.n_sites - len(threads) > alive:
+                    with self._lock:
+                        dead = [f"{site} (exit code {w.exitcode})" for site, w in sorted(workers.items())
+                                if not w.is_alive() and site not in self.connected]
+                        self.errors.append(f"Worker exited before connecting: {', '.join(dead)}")
+                    break
+                continue
+            conn.settimeout(None)
+            t = threading.Thread(target=self.handle, args=(conn,))
+            t.start()
+            threads.append(t)
+        self.server.close()
+        for t in threads:
+            t.join()
+
+
+def assign_sites(input_dir, workdir, n_sites):
+    """Give each site a private input directory with a round-robin share of the FASTAs"""
+    fastas = sorted(Path(input_dir).glob("*.fa.gz"))
+    site_dirs = []
+    for k in range(n_sites):
+        site_dir = Path(workdir) / "sites" / f"site_{k + 1}"
+        if site_dir.exists():
+            shutil.rmtree(site_dir)
+        (site_dir / "input").mkdir(parents=True)
+        site_dirs.append(site_dir)
+    for i, fasta in enumerate(fastas):
+        target = site_dirs[i % n_sites] / "input" / fasta.name
+        try:
+            os.link(fasta, target)
+        except OSError:
+            shutil.copy2(fasta, target)
+    return site_dirs
+
+
+def format_report(report):
+    r = []
+    r.append(f"{'Site':<10s} {'Inputs':>6s} {'Graphs':>6s} {'Sent (MB)':>10s} {'Build (s)':>10s} "
+             f"{'Transfer (s)':>12s} {'Latency (s)':>11s}")
+    r.append("-" * 71)
+    for site, s in sorted(report['sites'].items()):
+        r.append(f"{site:<10s} {s['n_inputs']:>6d} {s['artifacts']:>6d} {s['bytes_received'] / 1e6:>10.2f} "
+                 f"{s['build_s']:>10.2f} {s['transfer_s']:>12.3f} {s['latency_s']:>11.2f}")
+    a = report['aggregation']
+    r.append(f"\nTotal transferred: {report['bytes_transferred'] / 1e6:.2f} MB "
+             f"(sites→coordinator {report['bytes_uploaded'] / 1e6:.2f} MB)")
+    if report['format'] != 'gfa' and a['bytes']:
+        r.append(f"Graph payloads: {a['bytes'] / 1e6:.2f} MB {report['format']} "
+                 f"for {a['gfa_bytes'] / 1e6:.2f} MB GFA ({a['gfa_bytes'] / a['bytes']:.1f}x smaller)")
+    r.append(f"Aggregation: {a['artifacts']} graphs, {a['segments']:,} segments in {a['seconds']:.2f}s "
+             f"({a['mb_per_s']:.1f} MB/s, {a['segments_per_s']:,.0f} segments/s)")
+    if 'site_sequences' in report:
+        r.append("")
+        r.append(report['site_sequences'])
+    r.append(f"Wall time: {report['wall_s']:.2f}s")
+    return "\n".join(r)
+
+
+def run_simulation(input_dir, workdir, n_sites, executor_name, fmt='gfa', dedup=False):
+    workdir = Path(workdir).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    for old in megagraph_files(workdir / "MEGAGRAPH.gfa"):
+        if old.exists():
+            old.unlink()
+    site_dirs = assign_sites(input_dir, workdir, n_sites)
+
+    coordinator = Coordinator(workdir / "MEGAGRAPH.gfa", n_sites, dedup)
+    workers = {f"site_{k + 1}": Process(target=site_worker,
+                                        args=(f"site_{k + 1}", str(d), coordinator.address, executor_name, fmt))
+               for k, d in enumerate(site_dirs)}
+    server = threading.Thread(target=coordinator.serve, args=(workers,))
+    start = time.monotonic()
+    server.start()
+    for w in workers.values():
+        w.start()
+    server.join()
+    errors = list(coordinator.errors)
+    for site, w in sorted(workers.items()):
+        if errors and w.is_alive():
+            w.terminate()  # The coordinator gave up, so it would never connect
+            errors.append(f"{site} stopped")
+        w.join()
+        if w.exitcode and w.exitcode > 0 and not any(site in e for e in coordinator.errors):
+            errors.append(f"{site} exited with code {w.exitcode}")
+    if errors:
+        raise RuntimeError(f"Federation failed: {'; '.join(errors)}")
+    wall_s = time.monotonic() - start
+
+    a = coordinator.aggregation
+    a['mb_per_s'] = a['bytes'] / 1e6 / a['seconds'] if a['seconds'] else 0
+    a['segments_per_s'] = a['segments'] / a['seconds'] if a['seconds'] else 0
+    uploaded = sum(s['bytes_received'] for s in coordinator.sites.values())
+    report = {
+        'sites': coordinator.sites,
+        'aggregation': a,
+        'bytes_uploaded': uploaded,
+        'bytes_transferred': uploaded + sum(s['bytes_sent'] for s in coordinator.sites.values()),
+        'wall_s': wall_s,
+        'format': fmt,
+        'megagraph': str(coordinator.megagraph_path),
+        'megagraph_stats': coordinator.megagraph.stats(),
+    }
+    store = coordinator.megagraph.store
+    if store is not None:
+        report['site_bp'] = store.site_report()
+        report['shared_bp'] = store.shared_matrix()
+    with open(workdir / "federation_report.json", 'w') as f:
+        json.dump(report, f, indent=2)
+    if store is not None:
+        report['site_sequences'] = format_site_report(store)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a federation of sites on one host")
+    parser.add_argument("workdir", help="Working directory for site data, graphs and the report")
+    parser.add_argument("--inputs", required=True, help="Directory with *.fa.gz inputs to distribute over sites")
+    parser.add_argument("--sites", type=int, default=4, help="Number of sites (default 4)")
+    parser.add_argument("--executor", default="fake", choices=["fake", "docker", "pool", "local"],
+                        help="How sites build graphs (default fake: linear graphs, fully offline)")
+    parser.add_argument("--format", default="gfa", choices=["gfa", "pgx"],
+                        help="Graph transfer format (default gfa; pgx is the compact binary format)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Collapse identical segments from different sites when aggregating")
+    args = parser.parse_args()
+
+    report = run_simulation(args.inputs, args.workdir, args.sites, args.executor, args.format, args.dedup)
+    print(format_report(report))
+    print(f"\nMEGAGRAPH: {report['megagraph']}")
+    print(f"Report saved to {Path(args.workdir) / 'federation_report.json'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""
+Compact Binary Graph Exchange Format (PGX)
+==========================================
+Encoder/decoder for shipping GFA graphs between sites. Round-trips GFA
+losslessly (every line, in order) while storing:
+
+- Segment sequence 2-bit packed (ACGT), with an exceptions list of runs for
+  N, IUPAC codes and lowercase bases
+- Node ids, edge endpoints and path steps as zigzag delta varints
+- Records in blocks of ~4 MB, each compressed with zstd (zlib if the
+  zstandard module is not installed)
+
+Both directions stream block by block, so neither side holds the whole graph.
+Sequences are packed and unpacked for a whole block at once, and path steps
+are (de)coded as one array per path, with NumPy lookup tables.
+Lines that do not fit the compact records (H, W, unusual ids) are kept as raw
+text records.
+
+File layout: b'PGX1', codec byte, then blocks of
+[u32 compressed size][u32 raw size][compressed records].
+
+Usage:
+    python graph_exchange.py encode <in.gfa> <out.pgx>
+    python graph_exchange.py decode <in.pgx> <out.gfa>
+"""
+
+import argparse
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'PGX1'
+CODEC_NONE, CODEC_ZSTD, CODEC_ZLIB = 0, 1, 2
+BLOCK_SIZE = 4 * 1024 * 1024
+BLOCK_HEADER = struct.Struct('>II')
+ZSTD_LEVEL = 3
+
+REC_RAW, REC_SEGMENT, REC_LINK, REC_PATH = b'X', b'S', b'L', b'P'
+
+# Segment flags
+SEG_STRING_ID, SEG_TAGS, SEG_NO_SEQ = 1, 2, 4
+# Link flags
+LINK_FROM_REV, LINK_TO_REV, LINK_OVERLAP, LINK_TAGS, LINK_FROM_STR, LINK_TO_STR = 1, 2, 4, 8, 16, 32
+# Path flags
+PATH_OVERLAPS, PATH_TAGS = 1, 2
+
+BASES = b'ACGT'
+EXCEPTION_RE = re.compile(r'[^ACGT]+')
+BASE_CODE = np.zeros(256, dtype=np.uint8)  # byte -> 2-bit code; non-ACGT packs as A
+BASE_CODE[np.frombuffer(BASES, dtype=np.uint8)] = np.arange(4)
+SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)  # first base of a quad in the high bits
+BYTE_QUAD = np.frombuffer(BASES, dtype=np.uint8)[(np.arange(256)[:, None] >> SHIFTS) & 3]  # byte -> 4 bases
+VARINT_SHIFTS = np.arange(0, 70, 7, dtype=np.uint64)
+POW10 = 10 ** np.arange(19, dtype=np.int64)
+
+
+def is_numeric_id(s):
+    return s.isdigit() and (s == '0' or s[0] != '0')
+
+
+def zigzag(n):
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+
+def unzigzag(z):
+    return z >> 1 if not z & 1 else -((z + 1) >> 1)
+
+
+def write_varint(buf, n):
+    while n > 0x7f:
+        buf.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def write_bytes(buf, data):
+    write_varint(buf, len(data))
+    buf += data
+
+
+def write_varints(buf, values):
+    """Append an array of unsigned ints as varints"""
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = 1 + (values[:, None] >= (np.uint64(1) << VARINT_SHIFTS[1:])).sum(axis=1)
+    owner = np.repeat(np.arange(len(values)), sizes)
+    index = np.arange(len(owner)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    out = ((values[owner] >> VARINT_SHIFTS[index]) & 0x7f).astype(np.uint8)
+    out[index < sizes[owner] - 1] |= 0x80
+    buf += out.tobytes()
+
+
+def read_varints(data, pos, count):
+    """Decode count varints from a uint8 array starting at pos, return (values, new pos)"""
+    if not count:
+        return np.zeros(0, dtype=np.uint64), pos
+    window = data[pos:pos + 10 * count]
+    ends = np.flatnonzero(window < 0x80)[:count]
+    if len(ends) < count:
+        raise ValueError("Corrupt PGX block: truncated varints")
+    window = window[:ends[-1] + 1].astype(np.uint64)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    index = np.arange(len(window)) - np.repeat(starts, ends - starts + 1)
+    values = np.bitwise_or.reduceat((window & 0x7f) << VARINT_SHIFTS[index], starts)
+    return values, pos + len(window)
+
+
+def concat_ranges(starts, lengths):
+    """Indices of the ranges [start, start + length), concatenated"""
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(offsets[-1] + lengths[-1] if len(lengths) else 0)
+
+
+def pack_sequences(seqs):
+    """2-bit pack sequences into one buffer, each padded with A to a whole byte
+
+    Non-ACGT positions are packed as A (see sequence_exceptions).
+    """
+    text = ''.join(s + 'A' * (-len(s) % 4) for s in seqs)
+    # 'replace' keeps one byte per character, so positions line up with the string
+    quads = BASE_CODE[np.frombuffer(text.encode('ascii', 'replace'), dtype=np.uint8)].reshape(-1, 4)
+    return np.bitwise_or.reduce(quads << SHIFTS, axis=1).astype(np.uint8).tobytes()
+
+
+def unpack_sequences(data, starts, lengths):
+    """Decode 2-bit packed sequences of the given lengths at byte offsets starts of a uint8 array"""
+    # Expanding every byte of the buffer is one lookup; sequences are then plain slices
+    text = BYTE_QUAD[data].tobytes().decode('latin-1')
+    return [text[4 * start:4 * start + n] for start, n in zip(starts, lengths)]
+
+
+def sequence_exceptions(seq):
+    if seq.isascii() and not seq.encode().translate(None, BASES):
+        return []
+    return [(m.start(), m.group()) for m in EXCEPTION_RE.finditer(seq)]
+
+
+def apply_exceptions(seq, exceptions):
+    if not exceptions:
+        return seq
+    parts, pos = [], 0
+    for start, run in exceptions:
+        parts.append(seq[pos:start])
+        parts.append(run)
+        pos = start + len(run)
+    parts.append(seq[pos:])
+    return ''.join(parts)
+
+
+def pack_sequence(seq):
+    """2-bit pack a sequence; non-ACGT positions are packed as A and listed as exception runs"""
+    return pack_sequences([seq]), sequence_exceptions(seq)
+
+
+def unpack_sequence(packed, length, exceptions):
+    return apply_exceptions(unpack_sequences(np.frombuffer(packed, dtype=np.uint8), [0], [length])[0],
+                            exceptions)
+
+
+def parse_steps(steps):
+    """Node ids and reverse flags of a P line step list, or None if it is not plain 12+,7-,..."""
+    if not steps.isascii():
+        return None
+    b = np.frombuffer(steps.encode(), dtype=np.uint8)
+    digit = (b >= ord('0')) & (b <= ord('9'))
+    commas = np.flatnonzero(b == ord(','))
+    signs = np.flatnonzero((b == ord('+')) | (b == ord('-')))
+    starts = np.concatenate(([0], commas + 1))
+    lengths = signs - starts if len(signs) == len(starts) else None
+    if (lengths is None or signs[-1] != len(b) - 1 or not np.array_equal(commas, signs[:-1] + 1)
+            or len(signs) + len(commas) + digit.sum() != len(b) or lengths.min() < 1
+            or (lengths > 18).any() or ((b[starts] == ord('0')) & (lengths > 1)).any()):
+        return None
+    # Place value of every digit within its number, summed per number
+    places = np.repeat(signs - 1, lengths) - np.flatnonzero(digit)
+    ids = np.add.reduceat((b[digit] - ord('0')).astype(np.int64) * POW10[places], np.cumsum(lengths) - lengths)
+    return ids, b[signs] == ord('-')
+
+
+def format_steps(ids, reverse):
+    """Inverse of parse_steps: '12+,7-,...' from node ids and reverse flags"""
+    if not len(ids):
+        return ''
+    n_digits = 1 + (ids[:, None] >= POW10[1:]).sum(axis=1)
+    widths = n_digits + 2  # digits, orientation, comma
+    widths[-1] -= 1
+    starts = np.cumsum(widths) - widths
+    out = np.full(widths.sum(), ord(','), dtype=np.uint8)
+    owner = np.repeat(np.arange(len(ids)), n_digits)
+    positions = concat_ranges(starts, n_digits)
+    places = np.repeat(starts + n_digits - 1, n_digits) - positions
+    out[positions] = ord('0') + ids[owner] // POW10[places] % 10
+    out[starts + n_digits] = np.where(reverse, ord('-'), ord('+'))
+    return out.tobytes().decode('ascii')
+
+
+class Reader:
+    """Cursor over the bytes of one decompressed block"""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def varint(self):
+        data, pos = self.data, self.pos
+        result = shift = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            result |= (b & 0x7f) << shift
+            if b < 0x80:
+                break
+            shift += 7
+        self.pos = pos
+        return result
+
+    def take(self, n):
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return chunk
+
+    def text(self):
+        return self.take(self.varint()).decode()
+
+
+class PGXWriter:
+    """Stream GFA lines into a PGX file"""
+
+    def __init__(self, fileobj, codec=None):
+        if codec is None:
+            codec = CODEC_ZSTD if zstandard else CODEC_ZLIB
+        if codec == CODEC_ZSTD and zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        self.f = fileobj
+        self.codec = codec
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL) if codec == CODEC_ZSTD else None
+        self.buf = bytearray()
+        self._pending = []  # (offset in buf, sequence) packed when the block is flushed
+        self.prev_seg = 0
+        self.prev_link = 0
+        self.prev_step = 0
+        self.raw_bytes = 0
+        self.bytes_written = len(MAGIC) + 1
+        self.f.write(MAGIC + bytes([codec]))
+
+    def _raw(self, line):
+        self.buf += REC_RAW
+        write_bytes(self.buf, line.encode())
+
+    def write_line(self, line):
+        line = line.rstrip('\n')
+        self.raw_bytes += len(line) + 1
+        parts = line.split('\t')
+        kind = parts[0]
+        if kind == 'S' and len(parts) >= 3:
+            self._segment(parts)
+        elif kind == 'L' and len(parts) >= 6:
+            self._link(parts)
+        elif kind == 'P' and len(parts) >= 4 and self._path(parts):
+            pass
+        else:
+            self._raw(line)
+        if len(self.buf) >= BLOCK_SIZE:
+            self.flush()
+
+    def _segment(self, parts):
+        buf = self.buf
+        seg_id, seq, tags = parts[1], parts[2], parts[3:]
+        flags = (0 if is_numeric_id(seg_id) else SEG_STRING_ID) | (SEG_TAGS if tags else 0) \
+            | (SEG_NO_SEQ if seq == '*' else 0)
+        buf += REC_SEGMENT
+        buf.append(flags)
+        if flags & SEG_STRING_ID:
+            write_bytes(buf, seg_id.encode())
+        else:
+            n = int(seg_id)
+            write_varint(buf, zigzag(n - self.prev_seg))
+            self.prev_seg = n
+        if not flags & SEG_NO_SEQ:
+            exceptions = sequence_exceptions(seq)
+            write_varint(buf, len(seq))
+            self._pending.append((len(buf), seq))
+            buf += bytes((len(seq) + 3) // 4)
+            write_varint(buf, len(exceptions))
+            pos = 0
+            for start, run in exceptions:
+                write_varint(buf, start - pos)
+                write_bytes(buf, run.encode())
+                pos = start + len(run)
+        if tags:
+            write_bytes(buf, '\t'.join(tags).encode())
+
+    def _link(self, parts):
+        buf = self.buf
+        src, src_o, dst, dst_o, overlap, tags = parts[1], parts[2], parts[3], parts[4], parts[5], parts[6:]
+        if src_o not in '+-' or dst_o not in '+-':
+            self._raw('\t'.join(parts))
+            return
+        src_num, dst_num = is_numeric_id(src), is_numeric_id(dst)
+        flags = (LINK_FROM_REV if src_o == '-' else 0) | (LINK_TO_REV if dst_o == '-' else 0) \
+            | (LINK_OVERLAP if overlap != '0M' else 0) | (LINK_TAGS if tags else 0) \
+            | (0 if src_num else LINK_FROM_STR) | (0 if dst_num else LINK_TO_STR)
+        buf += REC_LINK
+        buf.append(flags)
+        if src_num:
+            s = int(src)
+            write_varint(buf, zigzag(s - self.prev_link))
+            self.prev_link = s
+        else:
+            write_bytes(buf, src.encode())
+        if dst_num:
+            # Edges mostly join nearby ids, so the target is stored relative to the source
+            base = int(src) if src_num else self.prev_link
+            write_varint(buf, zigzag(int(dst) - base))
+        else:
+            write_bytes(buf, dst.encode())
+        if flags & LINK_OVERLAP:
+            write_bytes(buf, overlap.encode())
+        if tags:
+            write_bytes(buf, '\t'.join(tags).encode())
+
+    def _path(self, parts):
+        steps = parse_steps(parts[2])
+        if steps is None:
+            return False
+        ids, reverse = steps
+        buf = self.buf
+        overlaps, tags = parts[3], parts[4:]
+        flags = (PATH_OVERLAPS if overlaps != '*' else 0) | (PATH_TAGS if tags else 0)
+        buf += REC_PATH
+        buf.append(flags)
+        write_bytes(buf, parts[1].encode())
+        write_varint(buf, len(ids))
+        deltas = np.diff(ids, prepend=self.prev_step)
+        zigzags = np.where(deltas >= 0, deltas << 1, ((-deltas) << 1) - 1).astype(np.uint64)
+        write_varints(buf, (zigzags << np.uint64(1)) | reverse.astype(np.uint64))
+        self.prev_step = int(ids[-1])
+        if flags & PATH_OVERLAPS:
+            write_bytes(buf, overlaps.encode())
+        if tags:
+            write_bytes(buf, '\t'.join(tags).encode())
+        return True
+
+    def flush(self):
+        if not self.buf:
+            return
+        if self._pending:
+            offsets, seqs = zip(*self._pending)
+            packed = np.frombuffer(pack_sequences(seqs), dtype=np.uint8)
+            lengths = np.array([(len(s) + 3) // 4 for s in seqs])
+            np.frombuffer(self.buf, dtype=np.uint8)[concat_ranges(np.array(offsets), lengths)] = packed
+            self._pending = []
+        raw = bytes(self.buf)
+        if self.codec == CODEC_ZSTD:
+            data = self._compressor.compress(raw)
+        elif self.codec == CODEC_ZLIB:
+            data = zlib.compress(raw, 6)
+        else:
+            data = raw
+        self.f.write(BLOCK_HEADER.pack(len(data), len(raw)) + data)
+        self.bytes_written += BLOCK_HEADER.size + len(data)
+        self.buf = bytearray()
+
+    def close(self):
+        self.flush()
+
+
+def read_lines(fileobj):
+    """Stream GFA lines (without newline) from a PGX file"""
+    header = fileobj.read(len(MAGIC) + 1)
+    if header[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a PGX file")
+    codec = header[len(MAGIC)]
+    if codec == CODEC_ZSTD and zstandard is None:
+        raise RuntimeError("PGX file is zstd-compressed but zstandard is not installed")
+    decompressor = zstandard.ZstdDecompressor() if codec == CODEC_ZSTD else None
+    prev_seg = prev_link = prev_step = 0
+
+    while True:
+        block_header = fileobj.read(BLOCK_HEADER.size)
+        if not block_header:
+            return
+        size, raw_size = BLOCK_HEADER.unpack(block_header)
+        data = fileobj.read(size)
+        if codec == CODEC_ZSTD:
+            data = decompressor.decompress(data, max_output_size=raw_size)
+        elif codec == CODEC_ZLIB:
+            data = zlib.decompress(data)
+        r = Reader(data)
+        array = np.frombuffer(data, dtype=np.uint8)
+        end = len(data)
+        # Lines of the block; segment sequences are filled in once the block is parsed
+        lines, segments = [], []  # segments: (line index, packed offset, length, exceptions)
+        while r.pos < end:
+            kind = r.take(1)
+            if kind == REC_RAW:
+                lines.append(r.text())
+            elif kind == REC_SEGMENT:
+                flags = r.take(1)[0]
+                if flags & SEG_STRING_ID:
+                    seg_id = r.text()
+                else:
+                    prev_seg += unzigzag(r.varint())
+                    seg_id = str(prev_seg)
+                fields = ['S', seg_id, '*']
+                if not flags & SEG_NO_SEQ:
+                    length = r.varint()
+                    offset = r.pos
+                    r.pos += (length + 3) // 4
+                    exceptions, pos = [], 0
+                    for _ in range(r.varint()):
+                        start = pos + r.varint()
+                        run = r.text()
+                        exceptions.append((start, run))
+                        pos = start + len(run)
+                    segments.append((len(lines), offset, length, exceptions))
+                if flags & SEG_TAGS:
+                    fields.append(r.text())
+                lines.append('\t'.join(fields) if flags & SEG_NO_SEQ else fields)
+            elif kind == REC_LINK:
+                flags = r.take(1)[0]
+                if flags & LINK_FROM_STR:
+                    src = r.text()
+                    src_num = None
+                else:
+                    prev_link += unzigzag(r.varint())
+                    src_num = prev_link
+                    src = str(src_num)
+                if flags & LINK_TO_STR:
+                    dst = r.text()
+                else:
+                    base = src_num if src_num is not None else prev_link
+                    dst = str(base + unzigzag(r.varint()))
+                overlap = r.text() if flags & LINK_OVERLAP else '0M'
+                fields = ['L', src, '-' if flags & LINK_FROM_REV else '+',
+                          dst, '-' if flags & LINK_TO_REV else '+', overlap]
+                if flags & LINK_TAGS:
+                    fields.append(r.text())
+                lines.append('\t'.join(fields))
+            elif kind == REC_PATH:
+                flags = r.take(1)[0]
+                name = r.text()
+                n_steps = r.varint()
+                values, r.pos = read_varints(array, r.pos, n_steps)
+                zigzags = (values >> np.uint64(1)).astype(np.int64)
+                ids = prev_step + np.cumsum((zigzags >> 1) ^ -(zigzags & 1))
+                if len(ids):
+                    prev_step = int(ids[-1])
+                steps = format_steps(ids, (values & np.uint64(1)).astype(bool))
+                fields = ['P', name, steps, r.text() if flags & PATH_OVERLAPS else '*']
+                if flags & PATH_TAGS:
+                    fields.append(r.text())
+                lines.append('\t'.join(fields))
+            else:
+                raise ValueError(f"Corrupt PGX block: unknown record type {kind!r}")
+
+        if segments:
+            index, offsets, lengths, exceptions = zip(*segments)
+            for i, seq, exc in zip(index, unpack_sequences(array, offsets, lengths), exceptions):
+                lines[i][2] = apply_exceptions(seq, exc)
+                lines[i] = '\t'.join(lines[i])
+        yield from lines
+
+
+def encode_file(gfa_path, pgx_path, codec=None):
+    """Encode a GFA file, return (GFA bytes, PGX bytes)"""
+    with open(gfa_path) as fin, open(pgx_path, 'wb') as fout:
+        writer = PGXWriter(fout, codec)
+        for line in fin:
+            writer.write_line(line)
+        writer.close()
+    return writer.raw_bytes, writer.bytes_written
+
+
+def decode_file(pgx_path, gfa_path):
+    with open(pgx_path, 'rb') as fin, open(gfa_path, 'w') as fout:
+        for line in read_lines(fin):
+            fout.write(line + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode/decode GFA in the compact PGX exchange format")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_enc = sub.add_parser("encode", help="GFA -> PGX")
+    p_enc.add_argument("gfa")
+    p_enc.add_argument("pgx")
+    p_enc.add_argument("--codec", choices=["zstd", "zlib", "none"], default=None,
+                       help="Block compression (default zstd, zlib if zstandard is missing)")
+    p_dec = sub.add_parser("decode", help="PGX -> GFA")
+    p_dec.add_argument("pgx")
+    p_dec.add_argument("gfa")
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    if args.command == "encode":
+        codec = {'zstd': CODEC_ZSTD, 'zlib': CODEC_ZLIB, 'none': CODEC_NONE}.get(args.codec)
+        if codec is None and zstandard is None:
+            print("zstandard not found; falling back to zlib", file=sys.stderr)
+        raw, packed = encode_file(args.gfa, args.pgx, codec)
+        print(f"Encoded {args.gfa} ({raw:,} bytes) -> {args.pgx} ({packed:,} bytes), "
+              f"{raw / packed:.1f}x smaller in {time.monotonic() - start:.1f}s")
+    else:
+        decode_file(args.pgx, args.gfa)
+        print(f"Decoded {args.pgx} -> {args.gfa} ({os.path.getsize(args.gfa):,} bytes) "
+              f"in {time.monotonic() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Incremental MEGAGRAPH Aggregation
+=================================
+Appends local GFAs to an existing MEGAGRAPH.gfa without rebuilding it. Each
+new graph gets a fresh id range (ids from the stored next free id), its
+paths are merged into the path set, and the summary statistics stored next
+to the graph (MEGAGRAPH.gfa.summary.json) are updated from the new graph
+alone, so the cost of adding a site is proportional to the site's graph.
+The path index (name, fragments, last step, bp) is an append-only journal,
+MEGAGRAPH.gfa.paths.tsv, rewritten only once superseded lines dominate it.
+
+A P path whose name is already in the MEGAGRAPH is joined to the existing
+path with a connecting edge, as `vg combine -p` does. The P line written
+before cannot be extended in an append-only file, so the continuation is
+written as the subpath at its bp offset in vg/odgi notation, e.g.
+`HG00097#1#contig[52000-97000]`. W lines carry their own coordinates and are
+renumbered and appended as they are. Other record types (C, J, ...) are not
+merged; they are counted in the result's 'skipped' so callers can warn.
+
+With dedup, segments are interned into a content-addressed sequence store
+(sequence_store.py, MEGAGRAPH.gfa.seqstore.tsv): a segment whose sequence is
+already in the MEGAGRAPH is not written again, its edges and path steps point
+at the existing node instead.
+
+Usage:
+    python megagraph.py append <MEGAGRAPH.gfa> <local.gfa> [<local.gfa> ...] [--dedup]
+    python megagraph.py summary <MEGAGRAPH.gfa>
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+
+from sequence_store import COMPACT_FACTOR, SequenceStore
+
+WALK_STEP_RE = re.compile(r'([<>])([^<>]+)')
+SUBRANGE_RE = re.compile(r'\[\d+(?:-\d+)?\]$')  # vg subpath suffix, e.g. contig[52000-97000]
+ORIENT = {'>': '+', '<': '-'}
+SUFFIXES = ('.summary.json', '.paths.tsv', '.seqstore.tsv')
+
+
+def megagraph_files(gfa_path):
+    """The MEGAGRAPH GFA and the files kept next to it"""
+    return [Path(gfa_path)] + [Path(f"{gfa_path}{suffix}") for suffix in SUFFIXES]
+
+
+def path_name(parts):
+    """Path name of a P line (without a subpath range), or sample#haplotype#sequence of a W line"""
+    return SUBRANGE_RE.sub('', parts[1]) if parts[0] == 'P' else f"{parts[1]}#{parts[2]}#{parts[3]}"
+
+
+def path_steps(parts):
+    """(node, orientation) steps of a P or W line"""
+    if parts[0] == 'P':
+        return [(step[:-1], step[-1]) for step in parts[2].split(',')]
+    return [(node, ORIENT[o]) for o, node in WALK_STEP_RE.findall(parts[6])]
+
+
+def new_summary():
+    return {
+        'next_id': 1,
+        'num_nodes': 0,
+        'num_edges': 0,
+        'num_paths': 0,
+        'total_bp': 0,
+        'collapsed_nodes': 0,
+        'collapsed_bp': 0,
+        'samples': [],
+        'length_counts': {},  # node length -> number of nodes
+        'sources': {},        # appended GFA -> {'nodes', 'edges', 'paths'}
+    }
+
+
+class Megagraph:
+    """A MEGAGRAPH GFA plus incrementally maintained summary statistics"""
+
+    def __init__(self, gfa_path, dedup=False):
+        self.gfa_path = Path(gfa_path)
+        self.summary_path = Path(f"{gfa_path}.summary.json")
+        self.paths_path = Path(f"{gfa_path}.paths.tsv")
+        self.paths = {}  # name -> [fragments, last step, bp]
+        self._dirty_paths = set()
+        self._path_lines = 0
+        self.store = None
+        if dedup:
+            self.store = SequenceStore(f"{gfa_path}.seqstore.tsv")
+            if not self.store.path.exists() and self.gfa_path.exists():
+                # Intern the nodes of a graph built without the store
+                with open(self.gfa_path) as f:
+                    self._intern_existing(f)
+        if self.summary_path.exists():
+            with open(self.summary_path) as f:
+                self.summary = json.load(f)
+            self.summary.setdefault('collapsed_nodes', 0)
+            self.summary.setdefault('collapsed_bp', 0)
+            if 'paths' in self.summary:
+                # Summary written before the path journal: move the index over
+                for name, p in self.summary.pop('paths').items():
+                    self.paths[name] = [p['fragments'], p['last_step'], None]
+                self._fill_path_bp()
+            else:
+                self._load_paths()
+        else:
+            self.summary = new_summary()
+            if self.paths_path.exists():
+                self.paths_path.unlink()  # Stale, the graph is scanned again
+            if self.gfa_path.exists():
+                # One full scan to bootstrap the summary of a graph built by vg combine
+                with open(self.gfa_path) as f:
+                    self._scan(f)
+                self._fill_path_bp()
+            else:
+                with open(self.gfa_path, 'w') as f:
+                    f.write("H\tVN:Z:1.0\n")
+        self._samples = set(self.summary['samples'])
+        self._length_counts = Counter({int(k): v for k, v in self.summary['length_counts'].items()})
+        if not self.summary_path.exists() or self._dirty_paths:
+            self.save()
+
+    def _scan(self, lines):
+        """Build the summary of an existing graph"""
+        s = self.summary
+        lengths = Counter()
+        samples = set()
+        max_id = 0
+        for line in lines:
+            parts = line.rstrip('\n').split('\t')
+            if parts[0] == 'S':
+                s['num_nodes'] += 1
+                length = len(parts[2]) if len(parts) > 2 else 0
+                lengths[length] += 1
+                s['total_bp'] += length
+                if parts[1].isdigit():
+                    max_id = max(max_id, int(parts[1]))
+            elif parts[0] == 'L':
+                s['num_edges'] += 1
+            elif parts[0] in ('P', 'W'):
+                s['num_paths'] += 1
+                name = path_name(parts)
+                node, orient = path_steps(parts)[-1]
+                fragments = self.paths[name][0] + 1 if name in self.paths else 1
+                self.paths[name] = [fragments, node + orient, None]
+                if '#' in name:
+                    samples.add(name.split('#')[0])
+        s['next_id'] = max_id + 1
+        s['samples'] = sorted(samples)
+        s['length_counts'] = {str(k): v for k, v in lengths.items()}
+
+    def _fill_path_bp(self):
+        """Length in bp of every indexed path whose length is unknown, from two passes over the graph"""
+        missing = {name for name, p in self.paths.items() if p[2] is None}
+        if not missing:
+            return
+        lengths = {}
+        with open(self.gfa_path) as f:
+            for line in f:
+                if line.startswith('S\t'):
+                    parts = line.rstrip('\n').split('\t')
+                    lengths[parts[1]] = len(parts[2]) if len(parts) > 2 else 0
+        bp = Counter()
+        with open(self.gfa_path) as f:
+            for line in f:
+                if line[:2] not in ('P\t', 'W\t'):
+                    continue
+                parts = line.rstrip('\n').split('\t')
+                base = path_name(parts)
+                if base not in missing and '.' in base and base.rsplit('.', 1)[1].isdigit():
+                    base = base.rsplit('.', 1)[0]  # Fragment named by the earlier name.N scheme
+                if base in missing:
+                    bp[base] += sum(lengths.get(node, 0) for node, _ in path_steps(parts))
+        for name in missing:
+            self.paths[name][2] = bp[name]
+        self._dirty_paths.update(missing)
+
+    def _load_paths(self):
+        if not self.paths_path.exists():
+            return
+        with open(self.paths_path) as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # Torn last line of an interrupted save
+                name, fragments, last_step, bp = line.rstrip('\n').split('\t')
+                self.paths[name] = [int(fragments), last_step, int(bp)]
+                self._path_lines += 1
+
+    def _intern_existing(self, lines):
+        for line in lines:
+            parts = line.rstrip('\n').split('\t')
+            if parts[0] == 'S' and parts[1].isdigit():
+                self.store.intern(parts[2] if len(parts) > 2 else '*', self.gfa_path.name, int(parts[1]))
+            elif parts[0] == 'L' and parts[1].isdigit() and parts[3].isdigit():
+                self.store.add_edge(int(parts[1]), parts[2], int(parts[3]), parts[4])
+
+    def append(self, lines, source=None, site=None):
+        """Append one GFA (an iterable of lines) with renumbered ids
+
+        site names the contributor in the sequence store (default: source).
+        Returns counts of appended nodes, edges and paths, of segments
+        collapsed into existing nodes, and of skipped record types.
+        """
+        s = self.summary
+        store = self.store
+        site = site or str(source)
+        id_map = {}
+        lengths = {}   # Segment lengths by their id in this GFA, for the bp of its paths
+        deferred = []  # Paths through segments further down the file
+
+        def new_id(old):
+            if old not in id_map:
+                id_map[old] = str(s['next_id'])
+                s['next_id'] += 1
+            return id_map[old]
+
+        added = {'nodes': 0, 'edges': 0, 'paths': 0, 'collapsed': 0, 'collapsed_bp': 0, 'skipped': {}}
+        with open(self.gfa_path, 'a') as out:
+            for line in lines:
+                parts = line.rstrip('\n').split('\t')
+                if parts[0] == 'S':
+                    length = len(parts[2]) if len(parts) > 2 else 0
+                    lengths[parts[1]] = length
+                    if store is not None and parts[1] not in id_map:
+                        node_id, is_new = store.intern(parts[2] if len(parts) > 2 else '*', site, s['next_id'])
+                        if node_id is not None:
+                            id_map[parts[1]] = str(node_id)
+                            if not is_new:
+                                added['collapsed'] += 1
+                                added['collapsed_bp'] += length
+                                continue
+                            s['next_id'] += 1
+                    parts[1] = new_id(parts[1])
+                    self._length_counts[length] += 1
+                    s['total_bp'] += length
+                    added['nodes'] += 1
+                elif parts[0] == 'L':
+                    parts[1], parts[3] = new_id(parts[1]), new_id(parts[3])
+                    if store is not None and not store.add_edge(int(parts[1]), parts[2], int(parts[3]), parts[4]):
+                        continue
+                    added['edges'] += 1
+                elif parts[0] in ('P', 'W'):
+                    steps = path_steps(parts)
+                    if all(node in lengths for node, _ in steps):
+                        self._append_path(parts, steps, new_id, lengths, out, added)
+                    else:
+                        deferred.append((parts, steps))
+                    continue
+                else:
+                    if parts[0] and parts[0] != 'H' and not parts[0].startswith('#'):
+                        added['skipped'][parts[0]] = added['skipped'].get(parts[0], 0) + 1
+                    continue
+                out.write('\t'.join(parts) + '\n')
+            for parts, steps in deferred:
+                self._append_path(parts, steps, new_id, lengths, out, added)
+
+        s['num_nodes'] += added['nodes']
+        s['num_edges'] += added['edges']
+        s['num_paths'] += added['paths']
+        s['collapsed_nodes'] += added['collapsed']
+        s['collapsed_bp'] += added['collapsed_bp']
+        if source is not None:
+            s['sources'][str(source)] = added
+        self.save()
+        return added
+
+    def _append_path(self, parts, steps, new_id, lengths, out, added):
+        """Write one P or W line with renumbered steps and update the path index"""
+        name = path_name(parts)
+        bp = sum(lengths.get(node, 0) for node, _ in steps)
+        steps = [(new_id(node), orient) for node, orient in steps]
+        if parts[0] == 'P':
+            parts[2] = ','.join(node + orient for node, orient in steps)
+        else:
+            parts[6] = ''.join(('>' if orient == '+' else '<') + node for node, orient in steps)
+        first, last = steps[0], steps[-1]
+
+        existing = self.paths.get(name)
+        if existing:
+            fragments, last_step, offset = existing
+            if parts[0] == 'P':
+                # Join to the existing path, as vg combine -p does
+                if self.store is None or self.store.add_edge(int(last_step[:-1]), last_step[-1],
+                                                             int(first[0]), first[1]):
+                    out.write(f"L\t{last_step[:-1]}\t{last_step[-1]}\t{first[0]}\t{first[1]}\t0M\n")
+                    added['edges'] += 1
+                parts[1] = f"{name}[{offset}-{offset + bp}]"
+            self.paths[name] = [fragments + 1, last[0] + last[1], offset + bp]
+        else:
+            self.paths[name] = [1, last[0] + last[1], bp]
+        self._dirty_paths.add(name)
+        if '#' in name:
+            self._samples.add(name.split('#')[0])
+        added['paths'] += 1
+        out.write('\t'.join(parts) + '\n')
+
+    def append_file(self, gfa_path, site=None):
+        with open(gfa_path) as f:
+            return self.append(f, source=gfa_path, site=site)
+
+    def save(self):
+        s = self.summary
+        s['samples'] = sorted(self._samples)
+        s['length_counts'] = {str(k): v for k, v in self._length_counts.items()}
+        tmp = self.summary_path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(s, f)
+        os.replace(tmp, self.summary_path)
+        self._save_paths()
+        if self.store is not None:
+            self.store.save()
+
+    def _save_paths(self):
+        """Append the index entries of paths changed since the last save (or rewrite the journal)"""
+        def row(name):
+            fragments, last_step, bp = self.paths[name]
+            return f"{name}\t{fragments}\t{last_step}\t{bp}\n"
+
+        if self.paths_path.exists() and \
+                self._path_lines + len(self._dirty_paths) <= COMPACT_FACTOR * len(self.paths):
+            with open(self.paths_path, 'a') as f:
+                f.writelines(row(name) for name in self._dirty_paths)
+            self._path_lines += len(self._dirty_paths)
+        else:
+            tmp = self.paths_path.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                f.writelines(row(name) for name in self.paths)
+            os.replace(tmp, self.paths_path)
+            self._path_lines = len(self.paths)
+        self._dirty_paths.clear()
+
+    def stats(self):
+        """Summary statistics in the same terms as GraphAnalyzer.stats"""
+        s = self.summary
+        stats = {
+            'num_nodes': s['num_nodes'],
+            'num_edges': s['num_edges'],
+            'num_paths': s['num_paths'],
+            'num_samples': len(self._samples),
+            'total_bp': s['total_bp'],
+            'collapsed_nodes': s['collapsed_nodes'],
+            'collapsed_bp': s['collapsed_bp'],
+            'edge_node_ratio': s['num_edges'] / s['num_nodes'] if s['num_nodes'] else 0,
+            'mean_degree': 2 * s['num_edges'] / s['num_nodes'] if s['num_nodes'] else 0,
+        }
+        if self._length_counts:
+            n = s['num_nodes']
+            mean = s['total_bp'] / n
+            variance = sum(c * (l - mean) ** 2 for l, c in self._length_counts.items()) / n
+            stats.update({
+                'mean_node_len': mean,
+                'median_node_len': self._length_quantile(0.5),
+                'min_node_len': min(self._length_counts),
+                'max_node_len': max(self._length_counts),
+                'std_node_len': math.sqrt(variance),
+                'n50': self._nx(50),
+                'n90': self._nx(90),
+            })
+        return stats
+
+    def _length_quantile(self, q):
+        target = q * (self.summary['num_nodes'] - 1)
+        seen = 0
+        for length in sorted(self._length_counts):
+            seen += self._length_counts[length]
+            if seen > target:
+                return length
+        return 0
+
+    def _nx(self, x):
+        target = self.summary['total_bp'] * x / 100
+        cumsum = 0
+        for length in sorted(self._length_counts, reverse=True):
+            cumsum += length * self._length_counts[length]
+            if cumsum >= target:
+                return length
+        return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally update a MEGAGRAPH")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_append = sub.add_parser("append", help="Append local GFAs to a MEGAGRAPH")
+    p_append.add_argument("megagraph", help="MEGAGRAPH.gfa (created if missing)")
+    p_append.add_argument("gfas", nargs="+", help="Local GFA files to append")
+    p_append.add_argument("--dedup", action="store_true",
+                          help="Collapse segments whose sequence is already in the MEGAGRAPH")
+    p_summary = sub.add_parser("summary", help="Print MEGAGRAPH summary statistics")
+    p_summary.add_argument("megagraph", help="MEGAGRAPH.gfa")
+    args = parser.parse_args()
+
+    mg = Megagraph(args.megagraph, dedup=getattr(args, 'dedup', False))
+    if args.command == "append":
+        for gfa in args.gfas:
+            if str(gfa) in mg.summary['sources']:
+                print(f"Skipping {gfa}: already in {args.megagraph}")
+                continue
+            added = mg.append_file(gfa)
+            print(f"Appended {gfa}: {added['nodes']:,} nodes, {added['edges']:,} edges, {added['paths']:,} paths"
+                  f", {added['collapsed']:,} segments collapsed")
+            if added['skipped']:
+                print(f"  Warning: skipped unsupported GFA records: "
+                      f"{', '.join(f'{n:,} {kind}' for kind, n in added['skipped'].items())}")
+    for k, v in mg.stats().items():
+        print(f"  {k:30s}: {v:>20,.4f}" if isinstance(v, float) else f"  {k:30s}: {v:>20,}")
+
+
+if __name__ == "__main__":
+    main()
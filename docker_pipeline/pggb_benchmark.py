@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+PGGB Parameter and Thread-Scaling Benchmark
+===========================================
+Sweeps PGGB segment length (-s), mapping identity (-p) and threads (-t) on a
+sample input, measures runtime and peak memory of each run and scores the
+output graph with GraphAnalyzer. Writes:
+
+- benchmark_results.tsv: one row per run (settings, runtime, memory, graph stats)
+- pareto.tsv: runs not dominated on (wall time, peak memory, compression)
+- thread_scaling.tsv: speedup and efficiency per (-s, -p) over thread counts
+- recommendation.json: suggested settings
+
+Compression (input bp / graph bp) is the quality score: the more homologous
+sequence PGGB collapses, the smaller the graph relative to its input.
+
+The input can be a FASTA(.gz) or a GFA with P lines, whose paths are spelled
+out into a FASTA first (e.g. the bundled results/graphs/HLA_test graph).
+
+Usage:
+    python pggb_benchmark.py <input.fa.gz|input.gfa> <output_dir> \\
+        [--segment-lengths 5000,10000] [--identities 90,95] [--threads 4,8] \\
+        [--executor docker|pool|local|fake]
+"""
+
+import argparse
+import csv
+import gzip
+import itertools
+import json
+import shutil
+from pathlib import Path
+
+from analyze_gfa import GFAParser, GraphAnalyzer
+import telemetry
+from executor import PGGB_IMAGE, FakeExecutor, make_executor
+
+COMPLEMENT = str.maketrans("ACGTNacgtn", "TGCANtgcan")
+RESULT_FIELDS = [
+    'segment_length', 'identity', 'threads', 'status', 'wall_s', 'cpu_s', 'peak_rss',
+    'input_bp', 'num_nodes', 'num_edges', 'num_paths', 'total_bp', 'n50',
+    'branch_ratio', 'compression',
+]
+
+
+def parse_int_list(text):
+    return [int(x) for x in text.split(',') if x]
+
+
+def gfa_to_fasta(gfa_path, fasta_path):
+    """Spell out the P lines of a GFA as FASTA records (the graph's input haplotypes)"""
+    segments = {}
+    paths = []
+    with open(gfa_path) as f:
+        for line in f:
+            parts = line.rstrip('\n').split('\t')
+            if parts[0] == 'S':
+                segments[parts[1]] = parts[2]
+            elif parts[0] == 'P':
+                paths.append((parts[1], parts[2]))
+    with open(fasta_path, 'w') as out:
+        for name, steps in paths:
+            seq = []
+            for step in steps.split(','):
+                node, orient = step[:-1], step[-1]
+                s = segments[node]
+                seq.append(s if orient == '+' else s.translate(COMPLEMENT)[::-1])
+            out.write(f">{name}\n{''.join(seq)}\n")
+    return len(paths)
+
+
+def fasta_stats(fasta_path):
+    """Number of sequences and total bp of a FASTA(.gz)"""
+    opener = gzip.open if str(fasta_path).endswith('.gz') else open
+    n_seqs, total_bp = 0, 0
+    with opener(fasta_path, 'rt') as f:
+        for line in f:
+            if line.startswith('>'):
+                n_seqs += 1
+            else:
+                total_bp += len(line.strip())
+    return n_seqs, total_bp
+
+
+def fake_pggb_handler(template_gfa):
+    """FakeExecutor handler that 'builds' a graph by copying a template GFA"""
+    def handler(image, cmd):
+        output_dir = cmd.split(' -o ')[1].split()[0]
+        return f"cp {template_gfa} {output_dir}/benchmark.smooth.final.gfa"
+    return handler
+
+
+def run_benchmark(input_fasta, output_dir, executor, segment_lengths, identities, threads_list,
+                  timeout=None):
+    """Run every (-s, -p, -t) combination and return one result dict per run"""
+    n_seqs, input_bp = fasta_stats(input_fasta)
+    print(f"Input: {input_fasta} ({n_seqs} sequences, {input_bp:,} bp)")
+
+    results = []
+    for s, p, t in itertools.product(segment_lengths, identities, threads_list):
+        run_dir = Path(output_dir) / f"s{s}_p{p}_t{t}"
+        if run_dir.exists():
+            shutil.rmtree(run_dir)
+        run_dir.mkdir(parents=True)
+
+        cmd = executor.wrap(
+            PGGB_IMAGE,
+            f"pggb -i {input_fasta} -o {run_dir} -n {n_seqs} -t {t} -p {p} -s {s}",
+            volumes=[Path(input_fasta).parent, run_dir]
+        )
+        print(f"Running PGGB -s {s} -p {p} -t {t}...")
+        status, _, output, usage = telemetry.run_measured(cmd, timeout=timeout)
+
+        row = {'segment_length': s, 'identity': p, 'threads': t, 'status': status,
+               'wall_s': usage['wall_s'], 'cpu_s': round(usage['user_s'] + usage['sys_s'], 3),
+               'peak_rss': usage['peak_rss'], 'input_bp': input_bp}
+        gfas = sorted(run_dir.glob("*.smooth.final.gfa"))
+        if status == "success" and gfas:
+            stats = GraphAnalyzer(GFAParser(gfas[0]), run_dir.name).stats
+            for key in ['num_nodes', 'num_edges', 'num_paths', 'total_bp', 'n50', 'branch_ratio']:
+                row[key] = stats.get(key, 0)
+            row['compression'] = input_bp / stats['total_bp'] if stats.get('total_bp') else 0
+        else:
+            row['status'] = status if status != "success" else "no_output"
+            print(f"  {row['status']}: {output[-500:]}")
+        results.append(row)
+        print(f"  {row['status']}: {row['wall_s']:.1f}s, {row['peak_rss'] / 1e9:.2f} GB, "
+              f"compression {row.get('compression', 0):.2f}x")
+    return results
+
+
+def pareto_front(results):
+    """Successful runs not dominated on (lower wall time, lower peak memory, higher compression)"""
+    ok = [r for r in results if r['status'] == 'success']
+
+    def dominates(a, b):
+        no_worse = (a['wall_s'] <= b['wall_s'] and a['peak_rss'] <= b['peak_rss']
+                    and a['compression'] >= b['compression'])
+        better = (a['wall_s'] < b['wall_s'] or a['peak_rss'] < b['peak_rss']
+                  or a['compression'] > b['compression'])
+        return no_worse and better
+
+    front = [r for r in ok if not any(dominates(o, r) for o in ok)]
+    return sorted(front, key=lambda r: r['wall_s'])
+
+
+def thread_scaling(results):
+    """Speedup and parallel efficiency relative to the fewest threads, per (-s, -p)"""
+    rows = []
+    ok = [r for r in results if r['status'] == 'success']
+    for key, group in itertools.groupby(sorted(ok, key=lambda r: (r['segment_length'], r['identity'], r['threads'])),
+                                        key=lambda r: (r['segment_length'], r['identity'])):
+        group = list(group)
+        base = group[0]
+        for r in group:
+            speedup = base['wall_s'] / r['wall_s'] if r['wall_s'] else 0
+            rows.append({'segment_length': key[0], 'identity': key[1], 'threads': r['threads'],
+                         'wall_s': r['wall_s'], 'speedup': round(speedup, 3),
+                         'efficiency': round(speedup * base['threads'] / r['threads'], 3)})
+    return rows
+
+
+def recommend(results, quality_tolerance=0.05, min_efficiency=0.7):
+    """Fastest (-s, -p) within tolerance of the best compression, with the most efficient thread count"""
+    front = pareto_front(results)
+    if not front:
+        return None
+    best_compression = max(r['compression'] for r in front)
+    good = [r for r in front if r['compression'] >= best_compression * (1 - quality_tolerance)]
+    choice = min(good, key=lambda r: r['wall_s'])
+
+    # Most threads that still scale efficiently for the chosen (-s, -p)
+    scaling = [r for r in thread_scaling(results)
+               if (r['segment_length'], r['identity']) == (choice['segment_length'], choice['identity'])]
+    efficient = [r['threads'] for r in scaling if r['efficiency'] >= min_efficiency]
+    threads = max(efficient) if efficient else choice['threads']
+    return {
+        'segment_length': choice['segment_length'],
+        'identity': choice['identity'],
+        'threads': threads,
+        'pggb_args': f"-p {choice['identity']} -s {choice['segment_length']} -t {threads}",
+        'wall_s': choice['wall_s'],
+        'peak_rss': choice['peak_rss'],
+        'compression': choice['compression'],
+        'best_compression': best_compression,
+    }
+
+
+def write_tsv(rows, path, fields):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, delimiter='\t', extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PGGB parameters and thread scaling")
+    parser.add_argument("input", help="Input FASTA(.gz), or a GFA whose paths are used as input")
+    parser.add_argument("output_dir", help="Directory for benchmark runs and reports")
+    parser.add_argument("--segment-lengths", type=parse_int_list, default=[5000, 10000],
+                        help="Comma-separated PGGB -s values (default 5000,10000)")
+    parser.add_argument("--identities", type=parse_int_list, default=[90, 95],
+                        help="Comma-separated PGGB -p values (default 90,95)")
+    parser.add_argument("--threads", type=parse_int_list, default=[4, 8],
+                        help="Comma-separated PGGB -t values (default 4,8)")
+    parser.add_argument("--executor", default="docker", choices=["docker", "pool", "local", "fake"],
+                        help="How PGGB is launched (default docker; fake copies a template graph)")
+    parser.add_argument("--timeout", type=int, default=None, help="Timeout per run in seconds")
+    parser.add_argument("--quality-tolerance", type=float, default=0.05,
+                        help="Accept settings within this fraction of the best compression (default 0.05)")
+    args = parser.parse_args()
+
+    output_dir = Path(args.output_dir).resolve()
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    input_path = Path(args.input).resolve()
+    if input_path.name.endswith('.gfa'):
+        input_fasta = output_dir / f"{input_path.stem}.paths.fa"
+        n_paths = gfa_to_fasta(input_path, input_fasta)
+        print(f"Spelled out {n_paths} paths from {input_path.name} to {input_fasta.name}")
+        template_gfa = input_path
+    else:
+        input_fasta = input_path
+        template_gfa = None
+
+    if args.executor == "fake":
+        if template_gfa is None:
+            parser.error("--executor fake needs a GFA input to use as the template graph")
+        executor = FakeExecutor(fake_pggb_handler(template_gfa))
+    else:
+        executor = make_executor(args.executor, volumes=[input_fasta.parent, output_dir])
+
+    with executor:
+        results = run_benchmark(input_fasta, output_dir, executor, args.segment_lengths,
+                                args.identities, args.threads, timeout=args.timeout)
+
+    write_tsv(results, output_dir / "benchmark_results.tsv", RESULT_FIELDS)
+    front = pareto_front(results)
+    write_tsv(front, output_dir / "pareto.tsv", RESULT_FIELDS)
+    write_tsv(thread_scaling(results), output_dir / "thread_scaling.tsv",
+              ['segment_length', 'identity', 'threads', 'wall_s', 'speedup', 'efficiency'])
+    recommendation = recommend(results, quality_tolerance=args.quality_tolerance)
+    with open(output_dir / "recommendation.json", 'w') as f:
+        json.dump(recommendation, f, indent=2, default=float)
+
+    print(f"\n{'='*60}")
+    print("PARETO FRONT (wall time, peak memory, compression)")
+    print(f"{'='*60}")
+    print(f"{'-s':>7s} {'-p':>4s} {'-t':>4s} {'Wall (s)':>10s} {'Peak (GB)':>10s} {'Compression':>12s} {'Nodes':>10s}")
+    for r in front:
+        print(f"{r['segment_length']:>7d} {r['identity']:>4d} {r['threads']:>4d} {r['wall_s']:>10.1f} "
+              f"{r['peak_rss'] / 1e9:>10.2f} {r['compression']:>11.2f}x {r['num_nodes']:>10,}")
+    if recommendation:
+        print(f"\nRecommended: pggb {recommendation['pggb_args']}")
+    else:
+        print("\nNo successful runs, no recommendation")
+    print(f"Reports saved to {output_dir}/")
+
+
+if __name__ == "__main__":
+    main()
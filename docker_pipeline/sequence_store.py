@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed Node Sequence Store
+=====================================
+Interns node sequences of local graphs by hash so identical nodes from
+different sites (or subchunks) collapse into one MEGAGRAPH node, and keeps
+track of which sites contain each sequence.
+
+- Keys are 128-bit BLAKE2b digests of the exact sequence (case kept, so
+  soft-masked and unmasked copies stay distinct)
+- Each entry points at the MEGAGRAPH node holding the sequence, with its
+  length and the set of sites (bitmask) that contributed it
+- Sequences shorter than MIN_COLLAPSE_LEN are never collapsed: short SNP/indel
+  nodes recur all over the graph and merging them would tangle it
+- Edges between interned nodes are remembered so edges repeated by collapsed
+  nodes are written only once
+
+Used by megagraph.py (Megagraph(..., dedup=True)); stored next to the graph as
+MEGAGRAPH.gfa.seqstore.tsv. The file is a journal: every save appends the
+entries and edges changed since the last one, closed by a '#' metadata line
+(a batch without it, from an interrupted save, is ignored), and the file is
+only rewritten once superseded records dominate it.
+
+Usage:
+    python sequence_store.py intern <store.tsv> --site NAME <local.gfa> [<local.gfa> ...]
+    python sequence_store.py report <store.tsv>
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+
+MIN_COLLAPSE_LEN = 32
+JOURNAL_VERSION = 1
+COMPACT_FACTOR = 2  # Journals are rewritten once they hold this many times more lines than live records
+FLIP = {'+': '-', '-': '+'}
+
+
+def sequence_key(seq):
+    return hashlib.blake2b(seq.encode(), digest_size=16).digest()
+
+
+def canonical_edge(src, src_o, dst, dst_o):
+    """The same edge read from either strand gets the same key"""
+    return min((src, src_o, dst, dst_o), (dst, FLIP[dst_o], src, FLIP[src_o]))
+
+
+class SequenceStore:
+    """Sequence hash -> [node id, length, site bitmask]"""
+
+    def __init__(self, path=None, min_len=MIN_COLLAPSE_LEN):
+        self.path = Path(path) if path else None
+        self.min_len = min_len
+        self.entries = {}
+        self.node_ids = set()
+        self.edges = set()
+        self.sites = []
+        self._site_index = {}
+        self.short_bp = defaultdict(int)
+        self.next_id = 1
+        self._dirty = set()     # Keys added or given a new site since the last save
+        self._new_edges = []
+        self._file_records = 0  # Record lines in the file, live or superseded
+        if self.path and self.path.exists():
+            self.load()
+
+    def site_bit(self, site):
+        if site not in self._site_index:
+            self._site_index[site] = len(self.sites)
+            self.sites.append(site)
+        return 1 << self._site_index[site]
+
+    def intern(self, seq, site, node_id=None):
+        """Intern a node sequence seen at a site
+
+        Returns (node id, is_new), or (None, False) for sequences too short to
+        collapse. node_id is the id to use if the sequence is new (default: the
+        store's own counter).
+        """
+        bit = self.site_bit(site)
+        if len(seq) < self.min_len or seq == '*':
+            self.short_bp[site] += len(seq) if seq != '*' else 0
+            return None, False
+        key = sequence_key(seq)
+        entry = self.entries.get(key)
+        if entry:
+            if not entry[2] & bit:
+                entry[2] |= bit
+                self._dirty.add(key)
+            return entry[0], False
+        if node_id is None:
+            node_id = self.next_id
+        self.next_id = max(self.next_id, node_id + 1)
+        self.entries[key] = [node_id, len(seq), bit]
+        self.node_ids.add(node_id)
+        self._dirty.add(key)
+        return node_id, True
+
+    def add_edge(self, src, src_o, dst, dst_o):
+        """Record an edge between interned nodes, return False if it is already known"""
+        if src not in self.node_ids or dst not in self.node_ids:
+            return True
+        key = canonical_edge(src, src_o, dst, dst_o)
+        if key in self.edges:
+            return False
+        self.edges.add(key)
+        self._new_edges.append(key)
+        return True
+
+    def intern_gfa(self, lines, site):
+        """Intern every segment of a GFA without merging it anywhere, return (new, seen before)"""
+        new = seen = 0
+        for line in lines:
+            if line.startswith('S\t'):
+                parts = line.rstrip('\n').split('\t')
+                node_id, is_new = self.intern(parts[2] if len(parts) > 2 else '*', site)
+                if node_id is not None:
+                    new += is_new
+                    seen += not is_new
+        return new, seen
+
+    def site_report(self):
+        """Per site: distinct interned bp unique to it, shared with other sites, and short (uncollapsed) bp"""
+        report = {site: {'unique_bp': 0, 'shared_bp': 0, 'sequences': 0, 'short_bp': self.short_bp.get(site, 0)}
+                  for site in self.sites}
+        for _, length, mask in self.entries.values():
+            shared = mask & (mask - 1) != 0
+            for i, site in enumerate(self.sites):
+                if mask >> i & 1:
+                    r = report[site]
+                    r['sequences'] += 1
+                    r['shared_bp' if shared else 'unique_bp'] += length
+        return report
+
+    def shared_matrix(self):
+        """bp of distinct sequence shared by each pair of sites"""
+        n = len(self.sites)
+        matrix = [[0] * n for _ in range(n)]
+        for _, length, mask in self.entries.values():
+            members = [i for i in range(n) if mask >> i & 1]
+            for a in members:
+                for b in members:
+                    matrix[a][b] += length
+        return {self.sites[a]: {self.sites[b]: matrix[a][b] for b in range(n)} for a in range(n)}
+
+    def load(self):
+        """Read every complete batch of the journal"""
+        pending = []
+        legacy = False
+        with open(self.path) as f:
+            for i, line in enumerate(f):
+                if not line.endswith('\n'):
+                    break  # Torn last line of an interrupted save
+                if not line.startswith('#'):
+                    pending.append(line)
+                    continue
+                meta = json.loads(line[1:])
+                # Files written before the journal have one metadata line, first
+                legacy = i == 0 and 'journal' not in meta
+                self.min_len = meta['min_len']
+                self.next_id = meta['next_id']
+                for site in meta['sites']:
+                    self.site_bit(site)
+                self.short_bp = defaultdict(int, meta['short_bp'])
+                self._apply(pending)
+                pending = []
+        if legacy:
+            self._apply(pending)
+
+    def _apply(self, lines):
+        for line in lines:
+            parts = line.rstrip('\n').split('\t')
+            if parts[0] == 'E':
+                node_id = int(parts[2])
+                self.entries[bytes.fromhex(parts[1])] = [node_id, int(parts[3]), int(parts[4], 16)]
+                self.node_ids.add(node_id)
+            elif parts[0] == 'L':
+                self.edges.add((int(parts[1]), parts[2], int(parts[3]), parts[4]))
+        self._file_records += len(lines)
+
+    def save(self, path=None):
+        """Append what changed since the last save as one batch, or rewrite the file when
+        saving elsewhere or once superseded records dominate it"""
+        path = Path(path) if path else self.path
+        meta = {'journal': JOURNAL_VERSION, 'min_len': self.min_len, 'next_id': self.next_id,
+                'sites': self.sites, 'short_bp': dict(self.short_bp)}
+
+        def write(f, keys, edges):
+            for key in keys:
+                node_id, length, mask = self.entries[key]
+                f.write(f"E\t{key.hex()}\t{node_id}\t{length}\t{mask:x}\n")
+            for src, src_o, dst, dst_o in edges:
+                f.write(f"L\t{src}\t{src_o}\t{dst}\t{dst_o}\n")
+            f.write('#' + json.dumps(meta) + '\n')
+
+        batch = len(self._dirty) + len(self._new_edges)
+        live = len(self.entries) + len(self.edges)
+        own = path == self.path
+        if own and path.exists() and self._file_records + batch <= COMPACT_FACTOR * live:
+            with open(path, 'a') as f:
+                write(f, self._dirty, self._new_edges)
+            self._file_records += batch
+        else:
+            tmp = path.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                write(f, self.entries, self.edges)
+            os.replace(tmp, path)
+            if own:
+                self._file_records = live
+        if own:
+            self._dirty.clear()
+            self._new_edges.clear()
+
+
+def format_site_report(store):
+    r = []
+    r.append(f"{'Site':<30s} {'Sequences':>10s} {'Unique (bp)':>14s} {'Shared (bp)':>14s} {'Short (bp)':>12s}")
+    r.append("-" * 84)
+    for site, s in store.site_report().items():
+        r.append(f"{site:<30s} {s['sequences']:>10,} {s['unique_bp']:>14,} {s['shared_bp']:>14,} "
+                 f"{s['short_bp']:>12,}")
+    total_bp = sum(length for _, length, _ in store.entries.values())
+    r.append(f"\n{len(store.entries):,} distinct sequences, {total_bp:,} bp "
+             f"(collapse threshold {store.min_len} bp)")
+    return "\n".join(r)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed store of graph node sequences")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_intern = sub.add_parser("intern", help="Intern the segments of local GFAs for one site")
+    p_intern.add_argument("store", help="Store file (created if missing)")
+    p_intern.add_argument("gfas", nargs="+", help="Local GFA files")
+    p_intern.add_argument("--site", required=True, help="Site the GFAs come from")
+    p_intern.add_argument("--min-len", type=int, default=MIN_COLLAPSE_LEN,
+                          help=f"Shortest sequence to intern (default {MIN_COLLAPSE_LEN})")
+    p_report = sub.add_parser("report", help="Print per-site unique/shared bp")
+    p_report.add_argument("store", help="Store file")
+    args = parser.parse_args()
+
+    if args.command == "intern":
+        store = SequenceStore(args.store, min_len=args.min_len)
+        for gfa in args.gfas:
+            with open(gfa) as f:
+                new, seen = store.intern_gfa(f, args.site)
+            print(f"Interned {gfa}: {new:,} new, {seen:,} already stored")
+        store.save()
+    else:
+        store = SequenceStore(args.store)
+    print(format_site_report(store))
+
+
+if __name__ == "__main__":
+    main()
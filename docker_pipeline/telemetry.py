@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+Per-task Resource Telemetry
+===========================
+Records wall/user/sys time, peak memory and input/output sizes for every
+command the federated pipeline runs, as one JSON line per task in an
+append-only run ledger (run_ledger.jsonl next to the pipeline logs).
+
+- Child processes are accounted with os.wait4 (CPU of the shell and every
+  process it waited for, e.g. minigraph or samtools); peak memory comes from
+  sampling the resident memory of the command's session in /proc, since the
+  wait4 maximum also counts the copy of the Python parent made by fork
+- Docker tasks are also sampled from the container cgroup (memory.peak,
+  cpu.stat), falling back to `docker stats` when the cgroup is not visible;
+  for `docker exec` into a pool container only what the container gained
+  while the command ran is counted
+- Tool output is streamed line by line (to a callback, e.g. the pipeline log)
+  and only the last TAIL_LINES lines are kept for error reports
+- Timeouts kill the work itself, not only the local docker client: `docker
+  run` containers are killed with `docker kill`, and commands sent to pool
+  containers run under `timeout -s KILL` inside the container
+- PGGB stage transitions (wfmash, seqwish, smoothxg, ...) are recorded as
+  timestamped stage events with their durations
+
+Usage:
+    python telemetry.py <run_ledger.jsonl> [--run-id RUN_ID]
+"""
+
+import argparse
+import functools
+import json
+import math
+import os
+import re
+import resource
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from pathlib import Path
+
+KNOWN_TOOLS = ['pggb', 'minigraph', 'samtools', 'odgi', 'bgzip', 'zcat']
+TAIL_LINES = 200  # Lines of tool output kept for error reports
+
+# Log prefixes of the PGGB stages, e.g. "[wfmash::map] ..." or "[smoothxg::(1-1)::prep] ..."
+STAGE_RE = re.compile(r'^\[(wfmash|seqwish|smoothxg|gfaffix|odgi|vg|multiqc)\b')
+
+# cgroup v2 (systemd and cgroupfs drivers) and cgroup v1 locations of a container
+CGROUP_DIRS = [
+    "/sys/fs/cgroup/system.slice/docker-{cid}.scope",
+    "/sys/fs/cgroup/docker/{cid}",
+]
+CGROUP_V1_MEMORY = "/sys/fs/cgroup/memory/docker/{cid}/memory.max_usage_in_bytes"
+CGROUP_V1_CPU = "/sys/fs/cgroup/cpuacct/docker/{cid}/cpuacct.stat"
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+FORK_RSS_MARGIN = 1.1  # wait4 peaks up to this multiple of the parent's RSS may be its forked copy
+
+# Container of a command sent to a pool container by executor.DockerPoolExecutor
+DOCKER_EXEC_RE = re.compile(r'\bdocker exec\s+(?:-\S+\s+)*([\w.-]+)')
+EXEC_KILL_GRACE = 30  # Seconds the in-container timeout gets before the docker client is killed
+TIMEOUT_EXIT_CODES = (124, 137)  # timeout(1) exit codes (137: killed with its process group)
+
+SIZE_UNITS = {'B': 1, 'KIB': 1024, 'MIB': 1024**2, 'GIB': 1024**3, 'TIB': 1024**4,
+              'KB': 1000, 'MB': 1000**2, 'GB': 1000**3, 'TB': 1000**4}
+
+
+def guess_tool(cmd):
+    """Name the tool a shell command runs (vg subcommands are kept, e.g. 'vg convert')"""
+    tokens = cmd.split()
+    for i, token in enumerate(tokens):
+        if token == 'vg' and i + 1 < len(tokens):
+            return f"vg {tokens[i + 1]}"
+        if token in KNOWN_TOOLS:
+            return token
+    return tokens[0] if tokens else 'unknown'
+
+
+def path_bytes(paths):
+    """Total size in bytes of files and directories (recursively)"""
+    total = 0
+    for p in paths:
+        p = Path(p)
+        if p.is_file():
+            total += p.stat().st_size
+        elif p.is_dir():
+            total += sum(f.stat().st_size for f in p.rglob('*') if f.is_file())
+    return total
+
+
+def parse_size(text):
+    """Parse a docker stats size such as '1.5GiB' into bytes"""
+    match = re.match(r'([\d.]+)\s*([A-Za-z]+)', text.strip())
+    if not match:
+        return 0
+    return int(float(match.group(1)) * SIZE_UNITS.get(match.group(2).upper(), 1))
+
+
+def new_cidfile():
+    """Path for `docker run --cidfile` (docker requires that it does not exist yet)"""
+    return os.path.join(tempfile.mkdtemp(prefix="pipeline_cid_"), "container.cid")
+
+
+def session_rss(sid):
+    """Summed resident memory of the processes in a session (None without /proc)"""
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return None
+    total = 0
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue  # exited while listing
+        # Fields after the parenthesized command name: state ppid pgrp session ... rss (24th field)
+        fields = stat[stat.rindex(b')') + 2:].split()
+        if int(fields[3]) == sid:
+            total += int(fields[21]) * PAGE_SIZE
+    return total
+
+
+def own_rss():
+    """Current resident memory of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Peak, an upper bound
+
+
+@functools.lru_cache(maxsize=None)
+def container_id(name):
+    """Full id of a container given its name (cgroup paths use the id)"""
+    result = subprocess.run(['docker', 'inspect', '--format', '{{.Id}}', name],
+                            capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def read_cgroup(cid):
+    """Read peak and current anonymous memory and CPU seconds of a running container from its cgroup"""
+    for template in CGROUP_DIRS:
+        cgroup = Path(template.format(cid=cid))
+        if not cgroup.is_dir():
+            continue
+        stats = {}
+        peak = cgroup / "memory.peak"
+        if peak.exists():
+            stats['peak_rss'] = int(peak.read_text())
+        else:
+            stats['peak_rss'] = int((cgroup / "memory.current").read_text())
+        for line in (cgroup / "memory.stat").read_text().splitlines():
+            key, value = line.split()
+            if key == 'anon':
+                stats['anon'] = int(value)
+        for line in (cgroup / "cpu.stat").read_text().splitlines():
+            key, value = line.split()
+            if key == 'user_usec':
+                stats['user_s'] = int(value) / 1e6
+            elif key == 'system_usec':
+                stats['sys_s'] = int(value) / 1e6
+        return stats
+
+    memory = Path(CGROUP_V1_MEMORY.format(cid=cid))
+    if memory.exists():
+        stats = {'peak_rss': int(memory.read_text())}
+        for line in memory.with_name("memory.stat").read_text().splitlines():
+            key, value = line.split()
+            if key == 'total_rss':
+                stats['anon'] = int(value)
+        ticks = os.sysconf('SC_CLK_TCK')
+        for line in Path(CGROUP_V1_CPU.format(cid=cid)).read_text().splitlines():
+            key, value = line.split()
+            stats['user_s' if key == 'user' else 'sys_s'] = int(value) / ticks
+        return stats
+    return None
+
+
+def docker_stats_memory(cid):
+    """Current memory usage of a container via `docker stats` (no cgroup access needed)"""
+    result = subprocess.run(
+        ['docker', 'stats', '--no-stream', '--format', '{{.MemUsage}}', cid],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0 or not result.stdout.strip():
+        return None
+    return parse_size(result.stdout.split('/')[0])
+
+
+class ContainerSampler(threading.Thread):
+    """Poll a docker container's resource usage until stopped
+
+    A container started for the command (cidfile) is measured over its whole
+    life. A long-running pool container (container name) is shared by many
+    commands, so only what its anonymous memory and CPU time grew by since the
+    first sample is counted; commands overlapping in one container are flagged
+    as shared, as their usage cannot be told apart.
+    """
+
+    _active = defaultdict(set)  # pool container name -> samplers of running commands
+    _active_lock = threading.Lock()
+
+    def __init__(self, cidfile=None, container=None, interval=2.0):
+        super().__init__(daemon=True)
+        self.cidfile = cidfile
+        self.container = container
+        self.interval = interval
+        self.cid = None
+        self.peak_rss = 0
+        self.user_s = None
+        self.sys_s = None
+        self.baseline = None
+        self.shared = False
+        self._stop_event = threading.Event()
+        if container:
+            with self._active_lock:
+                others = self._active[container]
+                if others:
+                    for sampler in others | {self}:
+                        sampler.shared = True
+                others.add(self)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.sample()
+            self._stop_event.wait(self.interval)
+
+    def sample(self):
+        if self.cid is None:
+            if self.container:
+                self.cid = container_id(self.container)
+            elif os.path.exists(self.cidfile):
+                self.cid = Path(self.cidfile).read_text().strip() or None
+            if self.cid is None:
+                return
+        try:
+            stats = read_cgroup(self.cid)
+        except (OSError, ValueError):
+            stats = None
+        if self.container:
+            self.sample_growth(stats)
+        elif stats:
+            self.peak_rss = max(self.peak_rss, stats['peak_rss'])
+            self.user_s = stats.get('user_s', self.user_s)
+            self.sys_s = stats.get('sys_s', self.sys_s)
+        else:
+            memory = docker_stats_memory(self.cid)
+            if memory:
+                self.peak_rss = max(self.peak_rss, memory)
+
+    def sample_growth(self, stats):
+        """Pool container: usage relative to the first sample"""
+        if stats:
+            current = (stats.get('anon', stats['peak_rss']), stats.get('user_s'), stats.get('sys_s'))
+        else:
+            current = (docker_stats_memory(self.cid) or 0, None, None)
+        if self.baseline is None:
+            self.baseline = current
+            return
+        self.peak_rss = max(self.peak_rss, current[0] - self.baseline[0])
+        if current[1] is not None and self.baseline[1] is not None:
+            self.user_s = current[1] - self.baseline[1]
+            self.sys_s = current[2] - self.baseline[2]
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        if self.container:
+            self.sample()  # The container outlives the command, so take a last sample
+            with self._active_lock:
+                self._active[self.container].discard(self)
+            return
+        if os.path.exists(self.cidfile):
+            os.remove(self.cidfile)
+        os.rmdir(os.path.dirname(self.cidfile))
+
+
+class StageTracker:
+    """Turn tool output lines into timestamped stage events"""
+
+    def __init__(self, start):
+        self.start = start
+        self.events = []
+
+    def feed(self, line):
+        """Return a new stage event if the line starts a different stage"""
+        match = STAGE_RE.match(line)
+        if not match:
+            return None
+        stage = match.group(1)
+        if self.events and self.events[-1]['stage'] == stage:
+            return None
+        event = {'stage': stage, 'started_at': datetime.now().isoformat(),
+                 'offset_s': round(time.monotonic() - self.start, 3)}
+        self.events.append(event)
+        return event
+
+    def finish(self, wall_s):
+        """Stage events with their durations (each stage lasts until the next one starts)"""
+        for event, following in zip(self.events, self.events[1:] + [None]):
+            end = following['offset_s'] if following else wall_s
+            event['duration_s'] = round(end - event['offset_s'], 3)
+        return self.events
+
+
+def run_measured(cmd, timeout=None, on_line=None, on_stage=None, tail_lines=TAIL_LINES):
+    """Run a shell command and measure its resource usage
+
+    Returns (status, exit_code, output, usage): status is 'success', 'failed' or
+    'timeout', output is the last tail_lines lines of the combined stdout/stderr
+    and usage holds wall_s, user_s, sys_s, peak_rss (bytes) and, if the tool
+    reported any, its stages. Every output line is passed to on_line and every
+    stage event to on_stage as it happens.
+    """
+    # Docker tasks do their work inside the container, so sample its cgroup too
+    sampler = None
+    exec_match = DOCKER_EXEC_RE.search(cmd)
+    if "docker run" in cmd:
+        sampler = ContainerSampler(new_cidfile())
+        cmd = cmd.replace("docker run", f"docker run --cidfile {sampler.cidfile}", 1)
+        sampler.start()
+    elif exec_match:
+        sampler = ContainerSampler(container=exec_match.group(1))
+        sampler.sample()  # Baseline before the command starts
+        sampler.start()
+        # Killing the docker client would leave the command running in the
+        # pool container, so it is timed out inside the container
+        if timeout:
+            cmd = f"{cmd[:exec_match.end()]} timeout -s KILL {math.ceil(timeout)}{cmd[exec_match.end():]}"
+
+    parent_rss = own_rss()
+    start = time.monotonic()
+    proc = subprocess.Popen(
+        cmd, shell=True,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        text=True, errors='replace', start_new_session=True
+    )
+    # Universal newlines also split carriage-return progress meters into lines
+    tail = deque(maxlen=tail_lines)
+    stages = StageTracker(start)
+
+    def read_output():
+        for line in proc.stdout:
+            tail.append(line)
+            event = stages.feed(line)
+            if event and on_stage:
+                on_stage(event)
+            if on_line:
+                on_line(line)
+
+    reader = threading.Thread(target=read_output, daemon=True)
+    reader.start()
+
+    # os.wait4 gives the rusage of the shell and every child it waited for;
+    # memory is sampled from the session the command runs in (start_new_session)
+    status = "success"
+    deadline = start + timeout if timeout else None
+    if deadline and exec_match:
+        deadline += EXEC_KILL_GRACE
+    sampled_rss = 0
+    while True:
+        pid, wait_status, rusage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            break
+        sampled_rss = max(sampled_rss, session_rss(proc.pid) or 0)
+        if deadline and time.monotonic() > deadline:
+            os.killpg(proc.pid, signal.SIGKILL)  # the shell and everything it started
+            if sampler and sampler.cidfile and os.path.exists(sampler.cidfile):
+                # ... but not the container of `docker run`
+                subprocess.run(['docker', 'kill', Path(sampler.cidfile).read_text().strip()],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            pid, wait_status, rusage = os.wait4(proc.pid, 0)
+            status = "timeout"
+            break
+        time.sleep(0.2)
+    wall_s = time.monotonic() - start
+    proc.returncode = os.waitstatus_to_exitcode(wait_status)
+    reader.join(timeout=10)
+    if sampler:
+        sampler.stop()
+    if (status == "success" and exec_match and timeout and wall_s >= timeout
+            and proc.returncode in TIMEOUT_EXIT_CODES):
+        status = "timeout"
+    if status == "success" and proc.returncode != 0:
+        status = "failed"
+
+    # The wait4 maximum includes the forked copy of this process, so it only
+    # counts when clearly above it (e.g. a peak between two samples)
+    peak_rss = max(sampled_rss, sampler.peak_rss if sampler else 0)
+    if rusage.ru_maxrss * 1024 > parent_rss * FORK_RSS_MARGIN:
+        peak_rss = max(peak_rss, rusage.ru_maxrss * 1024)
+    usage = {
+        'wall_s': round(wall_s, 3),
+        'user_s': round(max(rusage.ru_utime, sampler.user_s or 0) if sampler else rusage.ru_utime, 3),
+        'sys_s': round(max(rusage.ru_stime, sampler.sys_s or 0) if sampler else rusage.ru_stime, 3),
+        'peak_rss': peak_rss,
+    }
+    if sampler and sampler.shared:
+        usage['shared_container'] = True
+    if stages.events:
+        usage['stages'] = stages.finish(wall_s)
+    return status, proc.returncode, ''.join(tail), usage
+
+
+class RunLedger:
+    """Append-only JSONL ledger of task telemetry, safe to share between threads"""
+
+    def __init__(self, path, run_id):
+        self.path = path
+        self.run_id = run_id
+        self._lock = threading.Lock()
+
+    def record(self, **fields):
+        entry = {'run_id': self.run_id, 'recorded_at': datetime.now().isoformat()}
+        entry.update(fields)
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+        return entry
+
+
+def load_ledger(path, run_id=None):
+    """Load ledger entries, optionally for a single run"""
+    entries = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if run_id is None or entry.get('run_id') == run_id:
+                entries.append(entry)
+    return entries
+
+
+def summarize(entries):
+    """Aggregate ledger entries per (run, tool)"""
+    summary = defaultdict(lambda: {
+        'tasks': 0, 'failed': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+        'peak_rss': 0, 'input_bytes': 0, 'output_bytes': 0,
+    })
+    for e in entries:
+        s = summary[(e['run_id'], e['tool'])]
+        s['tasks'] += 1
+        s['failed'] += 0 if e['success'] else 1
+        s['wall_s'] += e['wall_s']
+        s['cpu_s'] += e['user_s'] + e['sys_s']
+        s['peak_rss'] = max(s['peak_rss'], e['peak_rss'])
+        s['input_bytes'] += e['input_bytes']
+        s['output_bytes'] += e['output_bytes']
+    return dict(summary)
+
+
+def format_summary(summary):
+    """Render a per-run, per-tool summary table"""
+    r = []
+    r.append(f"{'Run':<17s} {'Tool':<14s} {'Tasks':>6s} {'Failed':>6s} {'Wall (s)':>10s} "
+             f"{'CPU (s)':>10s} {'CPU/Wall':>8s} {'Peak RSS (GB)':>13s} {'In (GB)':>9s} {'Out (GB)':>9s}")
+    r.append("-" * 112)
+    for (run_id, tool), s in sorted(summary.items()):
+        parallelism = s['cpu_s'] / s['wall_s'] if s['wall_s'] else 0
+        r.append(f"{run_id:<17s} {tool:<14s} {s['tasks']:>6d} {s['failed']:>6d} {s['wall_s']:>10.1f} "
+                 f"{s['cpu_s']:>10.1f} {parallelism:>8.2f} {s['peak_rss'] / 1e9:>13.2f} "
+                 f"{s['input_bytes'] / 1e9:>9.2f} {s['output_bytes'] / 1e9:>9.2f}")
+    return "\n".join(r)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a pipeline run ledger")
+    parser.add_argument("ledger", help="Path to run_ledger.jsonl")
+    parser.add_argument("--run-id", help="Only summarize this run (default: all runs)")
+    args = parser.parse_args()
+
+    entries = load_ledger(args.ledger, args.run_id)
+    print(format_summary(summarize(entries)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,89 +1,248 @@
-#!/usr/bin/env python3
-"""
-OmniGenome: Genomic Dot Plot Generator
---------------------------------------
-Optimized for APOE haploblock clusters (~50kb).
-Uses k-mer hashing 
-
-"""
-
-import sys
-import gzip
-import argparse
-import matplotlib.pyplot as plt
-from Bio import SeqIO
-from collections import defaultdict
-
-def get_args():
-    parser = argparse.ArgumentParser(description="Generate a genomic dot plot.")
-    parser.add_argument("fasta", help="Input FASTA or FASTA.GZ file")
-    parser.add_argument("output", help="Output PNG filename")
-    parser.add_argument("-k", "--kmer", type=int, default=15, 
-                        help="K-mer size (15 is recommended for APOE)")
-    return parser.parse_args()
-
-def find_kmer_matches(seq1, seq2, k):
-    """
-    Builds a hash map of seq1 and scans seq2 for matches.
-    
-    """
-    # 1. Index the first sequence
-    lookup = defaultdict(list)
-    for i in range(len(seq1) - k + 1):
-        kmer = seq1[i : i + k]
-        lookup[kmer].append(i)
-    
-    # 2. Search using the second sequence
-    x_points, y_points = [], []
-    for j in range(len(seq2) - k + 1):
-        kmer = seq2[j : j + k]
-        if kmer in lookup:
-            for i in lookup[kmer]:
-                x_points.append(j)
-                y_points.append(i)
-                
-    return x_points, y_points
-
-def main():
-    args = get_args()
-
-    # Load FASTA (Handles both .gz or .fa)
-    opener = gzip.open if args.fasta.endswith(".gz") else open
-    try:
-        with opener(args.fasta, "rt") as f:
-            records = list(SeqIO.parse(f, "fasta"))
-    except Exception as e:
-        sys.exit(f"Error reading file: {e}")
-
-    if len(records) < 2:
-        sys.exit("Error: Need at least 2 sequences to compare.")
-
-    # Select the cluster 
-    rec1, rec2 = records[0], records[1]
-    s1_seq, s2_seq = str(rec1.seq).upper(), str(rec2.seq).upper()
-
-    print(f"Comparing {rec1.id} vs {rec2.id}...")
-
-    # Run hashing logic
-    x, y = find_kmer_matches(s1_seq, s2_seq, args.kmer)
-
-    # Visualization
-    plt.figure(figsize=(10, 10))
-    plt.scatter(x, y, s=0.5, c='black', marker='.', alpha=0.6)
-    
-    # Labels & Styling
-    plt.title(f"OmniGenome Dot Plot\n{rec1.id} vs {rec2.id} (k={args.kmer})")
-    plt.xlabel(f"{rec2.id} (bp)")
-    plt.ylabel(f"{rec1.id} (bp)")
-    
-    # Invert Y-axis to match genome browsers (0 at top)
-    plt.gca().invert_yaxis()
-    plt.tight_layout()
-    
-    plt.savefig(args.output, dpi=300)
-    print(f"Plot saved to {args.output}")
-
-if __name__ == "__main__":
-
-    main()
-
+#!/usr/bin/env python3
+"""
+OmniGenome: Genomic Dot Plot Generator
+--------------------------------------
+Optimized for APOE haploblock clusters (~50kb), fast up to Mb-sized regions.
+Uses 2-bit k-mer codes (k <= 31, see kmers.py) in NumPy arrays, matched by a sort/merge join
+instead of a dictionary of k-mer strings; k-mers with N or other non-ACGT
+bases are skipped.
+
+Seeds are canonical k-mers (the smaller of the k-mer and its reverse
+complement), so one join finds forward matches and inversions (reverse
+matches, drawn in red). --window keeps only the minimizer of every window of
+k-mers (sparse seeding), and --max-occ drops k-mers occurring more often
+than that in either sequence, so low-complexity repeats cannot blow up the
+point count.
+
+--all-vs-all compares every pair of sequences in the FASTA (e.g. cluster
+representatives) in a process pool and writes one image with a small panel
+per pair, plus <output>.order.tsv with the sequence of each row/column.
+
+Matches are never drawn as markers: they are binned straight into a pixel
+grid (np.bincount) and shown as an image on a log color scale, so rendering
+takes time and memory proportional to pixels + matches.
+
+"""
+
+import os
+import sys
+import gzip
+import argparse
+from multiprocessing import Pool
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.colors import LinearSegmentedColormap, LogNorm
+from matplotlib.patches import Patch
+from Bio import SeqIO
+from kmers import MAX_K, kmer_codes, mix64
+
+GRID_PIXELS = 8192  # Largest side of the all-vs-all image
+RASTER_PIXELS = 2000  # Side of the two-sequence dot plot raster
+FORWARD_COLOR = (0, 0, 0)
+REVERSE_COLOR = (200, 0, 0)
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Generate a genomic dot plot.")
+    parser.add_argument("fasta", help="Input FASTA or FASTA.GZ file")
+    parser.add_argument("output", help="Output PNG filename")
+    parser.add_argument("-k", "--kmer", type=int, default=15,
+                        help="K-mer size, at most 31 (15 is recommended for APOE)")
+    parser.add_argument("-w", "--window", type=int,
+                        help="Seed only the minimizer of every W consecutive k-mers "
+                             "(default: every k-mer for two sequences, 10 for --all-vs-all)")
+    parser.add_argument("--max-occ", type=int, default=50,
+                        help="Skip k-mers occurring more often than this in either sequence (default 50, 0 for no cap)")
+    parser.add_argument("--all-vs-all", action="store_true",
+                        help="Compare every pair of sequences and write a grid of panels")
+    parser.add_argument("--tile", type=int,
+                        help=f"Panel size in pixels for --all-vs-all (default: fit in {GRID_PIXELS} px)")
+    parser.add_argument("--pixels", type=int, default=RASTER_PIXELS,
+                        help=f"Raster size of the two-sequence plot (default {RASTER_PIXELS})")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(),
+                        help="Worker processes for --all-vs-all (default: all cores)")
+    return parser.parse_args()
+
+def seed_index(seq, k, window=1):
+    """
+    Canonical k-mer seeds of seq, sorted by code: (codes, positions, strands)
+    where strand is True if the seed is the reverse complement of the k-mer.
+    With window > 1 only the minimizer of every window of k-mers is kept.
+
+    """
+    if not 1 <= k <= MAX_K:
+        raise ValueError(f"k must be between 1 and {MAX_K}")
+    forward, reverse, positions = kmer_codes(seq, k)
+    strands = reverse < forward
+    canonical = np.where(strands, reverse, forward)
+
+    if window > 1 and len(canonical) > window:
+        # Smallest hash of every window of consecutive valid k-mers (ties: leftmost)
+        windows = np.lib.stride_tricks.sliding_window_view(mix64(canonical), window)
+        chosen = np.unique(np.arange(len(windows)) + windows.argmin(axis=1))
+        canonical, positions, strands = canonical[chosen], positions[chosen], strands[chosen]
+
+    order = np.argsort(canonical, kind='stable')
+    return canonical[order], positions[order], strands[order]
+
+def match_seeds(seeds1, seeds2, max_occ=0):
+    """
+    Sort/merge join of two seed indexes on their codes. Returns x (positions
+    in seq2), y (positions in seq1) and whether each match is reverse
+    (the k-mers are on opposite strands). Codes occurring more than max_occ
+    times in either sequence are skipped (0: no cap).
+
+    """
+    codes1, pos1, strands1 = seeds1
+    codes2, pos2, strands2 = seeds2
+
+    # Range of equal codes in seq1 for every seed of seq2
+    lo = np.searchsorted(codes1, codes2, side='left')
+    counts = np.searchsorted(codes1, codes2, side='right') - lo
+    hit = counts > 0
+    if max_occ:
+        occ2 = np.searchsorted(codes2, codes2, side='right') - np.searchsorted(codes2, codes2, side='left')
+        hit &= (counts <= max_occ) & (occ2 <= max_occ)
+    pos2, strands2, lo, counts = pos2[hit], strands2[hit], lo[hit], counts[hit]
+
+    # One point per (seq2 seed, equal seq1 seed) pair
+    x_points = np.repeat(pos2, counts)
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    idx1 = starts + np.arange(len(x_points))
+    reverse = strands1[idx1] != np.repeat(strands2, counts)
+    return x_points, pos1[idx1], reverse
+
+def find_kmer_matches(seq1, seq2, k, window=1, max_occ=0):
+    """
+    Matches of the canonical k-mers (or minimizers) of seq1 and seq2.
+    Returns x (positions in seq2), y (positions in seq1) and a reverse flag as arrays.
+
+    """
+    return match_seeds(seed_index(seq1, k, window), seed_index(seq2, k, window), max_occ)
+
+def rasterize(x, y, width, height, x_max, y_max):
+    """Number of points per pixel of a (height, width) grid spanning [0, x_max) x [0, y_max), row 0 at y = 0"""
+    cols = np.minimum(x * width // max(x_max, 1), width - 1)
+    rows = np.minimum(y * height // max(y_max, 1), height - 1)
+    return np.bincount(rows * width + cols, minlength=width * height).reshape(height, width)
+
+def log_rgb(forward, reverse, vmax):
+    """RGB image of forward and reverse counts per pixel, intensity on a log scale up to vmax"""
+    scale = np.log1p(max(vmax, 1))
+    rgb = np.full(forward.shape + (3,), 255.0)
+    for counts, color in ((forward, FORWARD_COLOR), (reverse, REVERSE_COLOR)):
+        alpha = (np.log1p(counts) / scale)[..., None]
+        rgb = rgb * (1 - alpha) + np.array(color) * alpha
+    return rgb.astype(np.uint8)
+
+# Seeds and lengths of all sequences, set once per worker by init_worker
+_worker_seeds = []
+
+def init_worker(seeds):
+    _worker_seeds[:] = seeds
+
+def compare_pair(args):
+    """Panel of sequences i (rows) and j (columns): forward and reverse match counts per pixel"""
+    i, j, tile, max_occ = args
+    (seeds_i, len_i), (seeds_j, len_j) = _worker_seeds[i], _worker_seeds[j]
+    x, y, reverse = match_seeds(seeds_i, seeds_j, max_occ)
+    counts = np.stack([rasterize(x[~reverse], y[~reverse], tile, tile, len_j, len_i),
+                       rasterize(x[reverse], y[reverse], tile, tile, len_j, len_i)], axis=-1)
+    return i, j, np.minimum(counts, np.iinfo(np.uint16).max).astype(np.uint16)
+
+def all_vs_all(records, output, k, window, max_occ, tile=None, processes=None):
+    """Grid of dot plot panels of every pair of records, computed in a process pool"""
+    n = len(records)
+    tile = tile or max(4, min(64, GRID_PIXELS // n))
+    seqs = [str(rec.seq).upper() for rec in records]
+
+    with Pool(processes) as pool:
+        seeds = pool.starmap(seed_index, [(seq, k, window) for seq in seqs])
+    seeds = list(zip(seeds, (len(seq) for seq in seqs)))
+
+    # Forward and reverse match counts of every pixel
+    grid = np.zeros((n * tile, n * tile, 2), dtype=np.uint16)
+    pairs = [(i, j, tile, max_occ) for i in range(n) for j in range(i, n)]
+    print(f"Comparing {len(pairs):,} pairs of {n} sequences ({tile} px panels)...")
+    with Pool(processes, initializer=init_worker, initargs=(seeds,)) as pool:
+        for i, j, counts in pool.imap_unordered(compare_pair, pairs, chunksize=64):
+            # Panel (j, i) is the mirror image of panel (i, j)
+            grid[i * tile:(i + 1) * tile, j * tile:(j + 1) * tile] = counts
+            grid[j * tile:(j + 1) * tile, i * tile:(i + 1) * tile] = counts.transpose(1, 0, 2)
+
+    # Colored one row of panels at a time, to keep the float intermediates small
+    vmax = int(grid.max())
+    canvas = np.empty((n * tile, n * tile, 3), dtype=np.uint8)
+    for r in range(0, n * tile, tile):
+        canvas[r:r + tile] = log_rgb(grid[r:r + tile, :, 0], grid[r:r + tile, :, 1], vmax)
+    del grid
+    # Panel borders
+    canvas[::tile, :] = canvas[:, ::tile] = (200, 200, 200)
+
+    plt.imsave(output, canvas)
+    order_file = f"{output}.order.tsv"
+    with open(order_file, "w") as f:
+        f.write("index\tsequence\tlength\n")
+        for idx, rec in enumerate(records):
+            f.write(f"{idx}\t{rec.id}\t{len(rec.seq)}\n")
+    print(f"Grid saved to {output} (rows/columns listed in {order_file})")
+
+def main():
+    args = get_args()
+
+    # Load FASTA (Handles both .gz or .fa)
+    opener = gzip.open if args.fasta.endswith(".gz") else open
+    try:
+        with opener(args.fasta, "rt") as f:
+            records = list(SeqIO.parse(f, "fasta"))
+    except Exception as e:
+        sys.exit(f"Error reading file: {e}")
+
+    if len(records) < 2:
+        sys.exit("Error: Need at least 2 sequences to compare.")
+
+    if args.all_vs_all:
+        all_vs_all(records, args.output, args.kmer, args.window or 10, args.max_occ,
+                   args.tile, args.processes)
+        return
+
+    # Select the cluster
+    rec1, rec2 = records[0], records[1]
+    s1_seq, s2_seq = str(rec1.seq).upper(), str(rec2.seq).upper()
+
+    print(f"Comparing {rec1.id} vs {rec2.id}...")
+
+    # Run hashing logic
+    x, y, reverse = find_kmer_matches(s1_seq, s2_seq, args.kmer, args.window or 1, args.max_occ)
+    print(f"{len(x):,} k-mer matches ({reverse.sum():,} reverse)")
+
+    # Visualization: matches binned into pixels, drawn as one image
+    len1, len2 = len(s1_seq), len(s2_seq)
+    width = min(args.pixels, max(len2, 1))
+    height = min(args.pixels, max(len1, 1))
+    forward = rasterize(x[~reverse], y[~reverse], width, height, len2, len1)
+    backward = rasterize(x[reverse], y[reverse], width, height, len2, len1)
+    vmax = max(int(forward.max()), int(backward.max()), 2)
+
+    fig, ax = plt.subplots(figsize=(10, 10))
+    # Row 0 at the top matches genome browsers (0 at top)
+    ax.imshow(log_rgb(forward, backward, vmax), extent=(0, len2, len1, 0),
+              interpolation='nearest', aspect='auto')
+    ax.legend(handles=[Patch(color=np.array(FORWARD_COLOR) / 255, label='forward'),
+                       Patch(color=np.array(REVERSE_COLOR) / 255, label='reverse')],
+              loc='upper right')
+    greys = LinearSegmentedColormap.from_list('matches', ['white', np.array(FORWARD_COLOR) / 255])
+    fig.colorbar(plt.cm.ScalarMappable(norm=LogNorm(1, vmax), cmap=greys), ax=ax,
+                 fraction=0.04, label="k-mer matches per pixel")
+
+    # Labels & Styling
+    ax.set_title(f"OmniGenome Dot Plot\n{rec1.id} vs {rec2.id} (k={args.kmer})")
+    ax.set_xlabel(f"{rec2.id} (bp)")
+    ax.set_ylabel(f"{rec1.id} (bp)")
+    plt.tight_layout()
+
+    plt.savefig(args.output, dpi=300)
+    print(f"Plot saved to {args.output}")
+
+if __name__ == "__main__":
+
+    main()
@@ -30,21 +30,19 @@ echo "Note: Ensure that the docker-compose.yml mounts the directory containing"
 echo "      the input graph to /data/ inside the container."
 echo ""
 
-# Extract APOE region using odgi
-docker compose -f ../docker/docker-compose.yml run vg bash -c "odgi extract \
-    -i /data/$(basename "$INPUT_GRAPH") \
-    -r $APOE_REGION \
-    -o /output/APOE_test/apoe_extracted.og -P"
-
-# Convert to GFA
-docker compose -f ../docker/docker-compose.yml run vg bash -c "odgi view \
-    -i /output/APOE_test/apoe_extracted.og \
-    -g > /output/APOE_test/apoe_extracted.gfa"
-
-# Create Giraffe index
-docker compose -f ../docker/docker-compose.yml run vg autoindex --workflow giraffe \
-    -g /output/APOE_test/apoe_extracted.gfa \
-    -p /output/APOE_test/apoe_giraffe
+# Extract APOE region, convert to GFA and build the Giraffe index in a single
+# container, so the container only starts once
+docker compose -f ../docker/docker-compose.yml run --entrypoint bash vg -c "\
+    odgi extract \
+        -i /data/$(basename "$INPUT_GRAPH") \
+        -r $APOE_REGION \
+        -o /output/APOE_test/apoe_extracted.og -P && \
+    odgi view \
+        -i /output/APOE_test/apoe_extracted.og \
+        -g > /output/APOE_test/apoe_extracted.gfa && \
+    vg autoindex --workflow giraffe \
+        -g /output/APOE_test/apoe_extracted.gfa \
+        -p /output/APOE_test/apoe_giraffe"
 
 echo "APOE graph extraction complete!"
 echo "Output: $OUTPUT_DIR/"
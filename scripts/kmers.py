@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+K-mer Codes
+-----------
+2-bit k-mer codes (k <= 31) of DNA sequences in NumPy arrays and a hash
+over them, shared by dotplot.py (seeds, minimizers),
+backgrounds/minhash_sketch.py (MinHash sketches) and
+HPRC_download_prep/classify_contigs.py (reference minimizers).
+
+"""
+
+import numpy as np
+
+MAX_K = 31  # 2 bits per base in a uint64
+
+# 2-bit codes; everything that is not ACGT (N, IUPAC) is 4
+BASE_CODE = np.full(256, 4, dtype=np.uint8)
+for i, base in enumerate(b'ACGT'):
+    BASE_CODE[base] = BASE_CODE[base + 32] = i
+
+def _combine(a, b, len_a, len_b):
+    """Forward and reverse codes of (len_a + len_b)-mers from those of len_a-mers and len_b-mers"""
+    m = len(b[0]) - len_a
+    return ((a[0][:m] << np.uint64(2 * len_b)) | b[0][len_a:],
+            (b[1][len_a:] << np.uint64(2 * len_a)) | a[1][:m])
+
+def kmer_codes(seq, k):
+    """
+    2-bit codes of all k-mers of seq (str or bytes) and of their reverse
+    complements, with their start positions, leaving out k-mers that contain
+    non-ACGT bases.
+
+    """
+    if isinstance(seq, str):
+        seq = seq.encode()
+    codes = BASE_CODE[np.frombuffer(seq, dtype=np.uint8)]
+    n = len(codes) - k + 1
+    if n <= 0:
+        empty = np.empty(0, dtype=np.uint64)
+        return empty, empty, np.empty(0, dtype=np.int64)
+
+    # Codes of 1-, 2-, 4-, ... mers, each built from two halves in one pass,
+    # combined along the bits of k: log2(k) passes instead of k; in the
+    # reverse complement the first base of the k-mer is the last one
+    base = (codes & 3).astype(np.uint64)
+    power, power_len = (base, np.uint64(3) - base), 1
+    result, result_len = None, 0
+    bits = k
+    while bits:
+        if bits & 1:
+            if result is None:
+                result, result_len = power, power_len
+            else:
+                result, result_len = _combine(result, power, result_len, power_len), result_len + power_len
+        bits >>= 1
+        if bits:
+            power, power_len = _combine(power, power, power_len, power_len), 2 * power_len
+    forward, reverse = result
+
+    # K-mers without a non-ACGT base, from a running count of them
+    bad = np.concatenate(([0], np.cumsum(codes == 4)))
+    positions = np.flatnonzero(bad[k:] == bad[:n])
+    return forward[positions], reverse[positions], positions
+
+def mix64(codes):
+    """
+    Invertible 64-bit hash of k-mer codes (the MurmurHash3 finalizer), so
+    minimizers and sketches are not biased towards poly-A.
+
+    """
+    h = codes ^ (codes >> np.uint64(33))
+    h *= np.uint64(0xff51afd7ed558ccd)
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xc4ceb9fe1a85ec53)
+    h ^= h >> np.uint64(33)
+    return h